@@ -0,0 +1,4 @@
+"""
+Benchmarks of the monitoring system. They are run by management commands,
+e.g. `manage.py bench_probes`, and print numbers to compare before upgrades.
+"""
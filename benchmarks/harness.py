@@ -0,0 +1,179 @@
+"""
+A harness of benchmarks: stand-in targets of probes and measurements of runs.
+
+Targets are either fake, simulated inside the probe engines with a configurable
+latency and loss, or loopback addresses that answer real pings on Linux
+(127.0.0.0/8) mixed with addresses that never answer (192.0.2.0/24, TEST-NET-1).
+"""
+
+import asyncio
+import random
+import resource
+import subprocess
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from unittest import mock
+
+from sms_core.utils import devices_utils, icmp_utils
+
+
+# Latency and jitter in milliseconds, loss - a share of targets that do not answer
+TargetProfile = namedtuple('TargetProfile', ('latency', 'jitter', 'loss', 'seed'))
+
+
+def fleet_addresses(size: int, profile: TargetProfile, loopback=False) -> list:
+    """
+    Addresses of a fleet. A fake fleet uses private addresses that are never
+    contacted, a loopback fleet has `loss` of addresses that do not answer.
+    """
+    if not loopback:
+        return [f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}' for i in range(size)]
+    rng = random.Random(profile.seed)
+    return [
+        f'192.0.2.{i % 254 + 1}' if rng.random() < profile.loss
+        else f'127.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255 or 1}'
+        for i in range(size)
+    ]
+
+
+class FakeTargets:
+    """ Answers of fake targets: a seeded loss per address and a latency with jitter """
+
+    def __init__(self, profile: TargetProfile):
+        self.profile = profile
+        self._rng = random.Random(profile.seed)
+
+    def answers(self, address: str) -> bool:
+        return random.Random(f'{self.profile.seed}:{address}').random() >= self.profile.loss
+
+    def latency(self) -> float:
+        """ Seconds of a reply """
+        jitter = self._rng.uniform(-self.profile.jitter, self.profile.jitter)
+        return max(self.profile.latency + jitter, 0) / 1000
+
+    def run_ping(self, command: list, **kwargs) -> subprocess.CompletedProcess:
+        """
+        subprocess.run of `ping` for the subprocess engine. A `sleep` process stands
+        for ping, so costs of processes are measured too.
+        """
+        address = command[-1]
+        if self.answers(address):
+            delay, returncode = self.latency(), 0
+            rtt = delay * 1000
+            output = (f'1 packets transmitted, 1 received, 0% packet loss\n'
+                      f'rtt min/avg/max/mdev = {rtt:.3f}/{rtt:.3f}/{rtt:.3f}/0.000 ms\n')
+        else:
+            # Fast mode waits for the deadline, the full mode for a second per request
+            delay = float(command[command.index('-w') + 1]) if '-w' in command \
+                else float(command[command.index('-c') + 1])
+            returncode = 1
+            output = '1 packets transmitted, 0 received, 100% packet loss\n'
+        subprocess.call(['sleep', f'{delay:.3f}'])
+        return subprocess.CompletedProcess(command, returncode, stdout=output)
+
+    def prober_class(self) -> type:
+        """ IcmpProber without a socket, replies are scheduled on the event loop """
+        targets = self
+
+        class FakeIcmpProber(icmp_utils.IcmpProber):
+
+            def open(self) -> None:
+                self._loop = asyncio.get_running_loop()
+                self._semaphore = asyncio.Semaphore(self.concurrency)
+
+            def close(self) -> None:
+                for future in self._waiters.values():
+                    future.cancel()
+                self._waiters.clear()
+
+            async def _send(self, packet: bytes, address: str) -> None:
+                if targets.answers(address):
+                    _, _, _, _, seq = icmp_utils.ICMP_HEADER.unpack(
+                        packet[:icmp_utils.ICMP_HEADER.size]
+                    )
+                    self._loop.call_later(targets.latency(), self._reply, address, seq)
+
+            def _reply(self, address: str, seq: int) -> None:
+                future = self._waiters.pop((address, seq), None)
+                if future is not None and not future.done():
+                    future.set_result(time.monotonic())
+
+        return FakeIcmpProber
+
+    @contextmanager
+    def patch(self):
+        """ Probe engines talk to the fake targets """
+        with mock.patch.object(devices_utils.subprocess, 'run', self.run_ping), \
+                mock.patch.object(icmp_utils, 'IcmpProber', self.prober_class()):
+            yield
+
+
+@contextmanager
+def record_completions(times: list):
+    """ Appending the time of every finished probe of both engines to `times` """
+    device_probe = devices_utils.device_probe
+    probe = icmp_utils.IcmpProber.probe
+
+    def timed_device_probe(*args, **kwargs):
+        result = device_probe(*args, **kwargs)
+        times.append(time.perf_counter())
+        return result
+
+    async def timed_probe(self, *args, **kwargs):
+        result = await probe(self, *args, **kwargs)
+        times.append(time.perf_counter())
+        return result
+
+    with mock.patch.object(devices_utils, 'device_probe', timed_device_probe), \
+            mock.patch.object(icmp_utils.IcmpProber, 'probe', timed_probe):
+        yield
+
+
+def percentile(values: list, share: float) -> float:
+    """ A percentile of values by the nearest rank """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(share * len(values)), len(values) - 1)]
+
+
+def rss_mb() -> float:
+    """ The resident memory of the process, Linux only """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize() / 2 ** 20
+    except OSError:
+        return None
+
+
+def measure(run, size: int) -> dict:
+    """
+    Running `run` that probes `size` targets. Returns probes per second, completion
+    times of probes since the start, CPU seconds of the process and of its children
+    (ping processes) and memory
+    """
+    completions = []
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = time.process_time()
+    with record_completions(completions):
+        started_at = time.perf_counter()
+        run()
+        duration = time.perf_counter() - started_at
+    cpu = time.process_time() - cpu
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    completions = [completion - started_at for completion in completions]
+    return {
+        'devices': size,
+        'duration': round(duration, 3),
+        'probes_per_second': round(size / duration, 1),
+        'p50': round(percentile(completions, 0.5), 4),
+        'p99': round(percentile(completions, 0.99), 4),
+        'cpu': round(cpu, 3),
+        'children_cpu': round(max(
+            children_after.ru_utime + children_after.ru_stime
+            - children.ru_utime - children.ru_stime, 0
+        ), 3),
+        'rss_mb': round(rss_mb(), 1),
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
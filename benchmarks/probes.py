@@ -0,0 +1,62 @@
+"""
+The benchmark of probe engines: every engine checks the whole fleet once,
+the same way the scheduler does, statuses and probe results are written too.
+"""
+
+import shutil
+
+from sms_core.utils.devices_utils import check_device_status, check_device_status_icmp
+from sms_core.utils.icmp_utils import open_icmp_socket
+from .harness import FakeTargets, measure
+
+
+ENGINES = {
+    'subprocess': check_device_status,
+    'icmp': check_device_status_icmp,
+}
+
+
+def engine_available(engine: str, fake: bool) -> bool:
+    """ Loopback targets need the `ping` binary and an ICMP socket """
+    if fake:
+        return True
+    if engine == 'subprocess':
+        return shutil.which('ping') is not None
+    try:
+        sock, _ = open_icmp_socket()
+    except OSError:
+        return False
+    sock.close()
+    return True
+
+
+def run_engine(engine: str, names: list, workers: int) -> dict:
+    """ One check of the fleet by the engine """
+    if engine == 'subprocess':
+        return ENGINES[engine](names, workers_limit=workers)
+    return ENGINES[engine](names)
+
+
+def bench_probes(names: list, engines: list, profile=None, workers=5) -> list:
+    """
+    Measuring engines on devices `names`. `profile` - TargetProfile of fake targets,
+    None for real pings. Returns results of `measure` with the engine and up devices.
+    """
+    results = []
+    for engine in engines:
+        if not engine_available(engine, profile is not None):
+            results.append({'engine': engine, 'skipped': True})
+            continue
+        statuses = {}
+
+        def run():
+            statuses.update(run_engine(engine, names, workers))
+
+        if profile is not None:
+            with FakeTargets(profile).patch():
+                result = measure(run, len(names))
+        else:
+            result = measure(run, len(names))
+        result.update(engine=engine, up=sum(statuses.values()))
+        results.append(result)
+    return results
@@ -0,0 +1,128 @@
+"""
+The benchmark of paths of the scheduler and the database on a synthetic fleet:
+reconciliation and claims of the check loop, the database phase of checks
+with stubbed probes, the overview page and the listing of the REST API.
+"""
+
+import random
+import time
+from unittest import mock
+
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from sms.celery import CELERY_LOOP_TIME
+from sms_api.views import DeviceView
+from sms_core.models import Device
+from sms_core.utils import devices_utils
+from sms_core.utils.icmp_utils import PingStats
+from sms_core.utils.scheduler_utils import DeviceScheduler
+from sms_core.views import SmsOverviewView
+
+
+# Shares of check intervals of a fleet: most devices are checked every few minutes
+INTERVAL_MIX = {
+    5: 0.01, 10: 0.02, 15: 0.02, 30: 0.05, 60: 0.3, 300: 0.3,
+    600: 0.1, 900: 0.05, 1800: 0.05, 3600: 0.1,
+}
+# Shares of devices that are up and that change their status by a check
+UP_SHARE = 0.9
+FLIP_SHARE = 0.01
+
+
+def fleet_devices(user: object, size: int, seed=1) -> list:
+    """ Unsaved devices of a fleet with the mix of check intervals """
+    rng = random.Random(seed)
+    intervals = rng.choices(list(INTERVAL_MIX), weights=list(INTERVAL_MIX.values()), k=size)
+    return [
+        Device(name=f'bench{i}', ip_fqdn=f'bench{i}.invalid', check_interval=interval,
+               status=rng.random() < UP_SHARE, updated_by=user)
+        for i, interval in enumerate(intervals)
+    ]
+
+
+def measure_path(run, repeat: int) -> dict:
+    """
+    Running `run(i)` `repeat` times. Returns the best and the mean time in seconds
+    and queries of the last run
+    """
+    timings = []
+    for i in range(repeat):
+        with CaptureQueriesContext(connection) as queries:
+            started_at = time.perf_counter()
+            run(i)
+            timings.append(time.perf_counter() - started_at)
+    return {
+        'best': round(min(timings), 4),
+        'mean': round(sum(timings) / len(timings), 4),
+        'queries': len(queries),
+    }
+
+
+def stub_probe(seed: int) -> object:
+    """ device_probe without pings: devices keep their status but FLIP_SHARE of them """
+    rng = random.Random(seed)
+
+    def probe(device: object, count='3') -> PingStats:
+        up = device.status != (rng.random() < FLIP_SHARE)
+        return PingStats(1, 1, 1.0, 1.0, 1.0) if up else PingStats(1, 0, None, None, None)
+
+    return probe
+
+
+def bench_paths(user: object, repeat: int, batch_size: int, page_size: int, seed=1) -> dict:
+    """ Measuring every path on devices of the database. Returns {path: measure_path} """
+    paths = {}
+    devices = Device.objects.values_list('id', 'name', 'check_interval')
+    now = time.time()
+
+    # The first reconciliation of a loop and the periodic ones of the same devices
+    paths['loop_reconcile_cold'] = measure_path(
+        lambda i: DeviceScheduler().reconcile(devices.iterator(), now), repeat
+    )
+    scheduler = DeviceScheduler()
+    scheduler.reconcile(devices.iterator(), now)
+    paths['loop_reconcile_warm'] = measure_path(
+        lambda i: scheduler.reconcile(devices.iterator(), now), repeat
+    )
+    # Claims of successive loop runs, devices are due by the middle of the next run
+    claimed = []
+
+    def claim(i: int) -> None:
+        loop_now = now + (i + 1) * CELERY_LOOP_TIME
+        _, due_devices = scheduler.claim(loop_now, tolerance=CELERY_LOOP_TIME / 2)
+        claimed.append(len(due_devices))
+
+    paths['loop_claim'] = measure_path(claim, repeat)
+    paths['loop_claim']['devices'] = max(claimed)
+
+    # A batch of the check loop, other batches are checked by every repeat
+    names = list(Device.objects.order_by('id').values_list('name', flat=True)[
+        :batch_size * repeat
+    ])
+    with mock.patch.object(devices_utils, 'device_probe', stub_probe(seed)):
+        paths['check_db_phase'] = measure_path(
+            lambda i: devices_utils.check_device_status(
+                names[i * batch_size:(i + 1) * batch_size], workers_limit=5
+            ),
+            repeat
+        )
+    paths['check_db_phase']['devices'] = batch_size
+
+    request = RequestFactory().get(reverse('sms_core:url_devices_overview'))
+    request.user = user
+    with override_settings(OVERVIEW_CARD_CACHE_TIMEOUT=0):
+        paths['overview'] = measure_path(
+            lambda i: SmsOverviewView.as_view()(request), repeat
+        )
+
+    request = APIRequestFactory().get(reverse('device-list'), {'page_size': page_size})
+    force_authenticate(request, user)
+    paths['api_list'] = measure_path(
+        lambda i: DeviceView.as_view({'get': 'list'})(request).render(), repeat
+    )
+    paths['api_list']['devices'] = page_size
+    return paths
@@ -12,4 +12,4 @@ echo '=== Preparing Static files ==='
 python manage.py collectstatic --noinput
 
 echo '=== Run APP ==='
-exec gunicorn --bind=0.0.0.0:8001 --workers=4 sms.wsgi
+exec gunicorn --bind=0.0.0.0:8001 --workers=4 --worker-class=uvicorn.workers.UvicornWorker sms.asgi:application
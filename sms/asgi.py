@@ -2,15 +2,145 @@
 ASGI config for sms project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Server-sent events of status changes are served next to the Django application.
+Streaming exports are served by the WSGI application in threads: Django 3.1 sends
+streaming responses in the event loop, where rows can not be read from the database.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
 """
 
+import asyncio
+import io
 import os
+import sys
+import threading
 
+from asgiref.sync import async_to_sync, sync_to_async
 from django.core.asgi import get_asgi_application
+from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sms.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+wsgi_application = get_wsgi_application()
+
+# Apps are loaded by get_asgi_application()
+from sms_api.export import EXPORT_PATHS  # noqa: E402
+from sms_core.streams import STATUS_STREAM_PATH, status_stream  # noqa: E402
+
+
+def build_environ(scope: dict, body: bytes) -> dict:
+    """ The WSGI environ of an HTTP request of ASGI """
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('ascii'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f'HTTP/{scope["http_version"]}',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        host, port = scope['client']
+        environ.update({'REMOTE_ADDR': host, 'REMOTE_PORT': str(port)})
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1').upper().replace('-', '_')
+        key = name if name in ('CONTENT_LENGTH', 'CONTENT_TYPE') else f'HTTP_{name}'
+        value = value.decode('latin1')
+        if key in environ:
+            # Cookies are joined as one Cookie header, other headers as lists
+            value = f'{environ[key]}{"; " if key == "HTTP_COOKIE" else ","}{value}'
+        environ[key] = value
+    return environ
+
+
+class ThreadedWsgiApplication:
+    """
+    The WSGI application under ASGI with a request in its own thread, so a long export
+    does not hold the thread shared by sync views. The response is closed to finish
+    the request and close its database connection, also when the client disconnects.
+    """
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        body = b''
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        # Servers drop messages sent after a disconnect, the response is not read further
+        disconnected = threading.Event()
+
+        async def wait_disconnect() -> None:
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+
+        listener = asyncio.ensure_future(wait_disconnect())
+        try:
+            await sync_to_async(self.run, thread_sensitive=False)(
+                scope, body, async_to_sync(send), disconnected
+            )
+        finally:
+            listener.cancel()
+
+    def run(self, scope: dict, body: bytes, send, disconnected: object) -> None:
+        response_start, started = {}, []
+
+        def start_response(status: str, headers: list, exc_info=None) -> None:
+            if exc_info and started:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response_start.update({
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [
+                    (name.lower().encode('latin1'), value.encode('latin1'))
+                    for name, value in headers
+                ],
+            })
+
+        def start() -> None:
+            """ The response starts with its first body, headers may change until then """
+            if not started:
+                started.append(True)
+                send(response_start)
+
+        response = self.application(build_environ(scope, body), start_response)
+        try:
+            for output in response:
+                if disconnected.is_set():
+                    return
+                start()
+                send({'type': 'http.response.body', 'body': output, 'more_body': True})
+        finally:
+            if hasattr(response, 'close'):
+                response.close()
+        start()
+        send({'type': 'http.response.body'})
+
+
+threaded_wsgi_application = ThreadedWsgiApplication(wsgi_application)
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] == STATUS_STREAM_PATH:
+        await status_stream(scope, receive, send)
+    elif scope['type'] == 'http' and scope['path'] in EXPORT_PATHS:
+        await threaded_wsgi_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -3,10 +3,16 @@
 
 import os
 from celery import Celery
-from celery.schedules import crontab
 
 
+# Seconds between runs of the monitoring loop
 CELERY_LOOP_TIME = 5
+# Seconds between runs of partitions maintenance and rollups of probe results
+TIMESERIES_MAINTENANCE_TIME = 15 * 60
+# Seconds between runs of availability rollups
+AVAILABILITY_ROLLUP_TIME = 5 * 60
+# Seconds between reconciliations of counters of devices with the database
+COUNTERS_RECONCILE_TIME = 10 * 60
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sms.settings')
 
@@ -18,6 +24,18 @@ celery_app.autodiscover_tasks()
 celery_app.conf.beat_schedule = {
     'device_check_loop': {
         'task': 'sms_core.tasks.task_device_check_loop',
-        'schedule': crontab(minute=f'*/{CELERY_LOOP_TIME}'),
+        'schedule': CELERY_LOOP_TIME,
+    },
+    'timeseries_maintenance': {
+        'task': 'sms_core.tasks.task_timeseries_maintenance',
+        'schedule': TIMESERIES_MAINTENANCE_TIME,
+    },
+    'availability_rollup': {
+        'task': 'sms_core.tasks.task_availability_rollup',
+        'schedule': AVAILABILITY_ROLLUP_TIME,
+    },
+    'counters_reconcile': {
+        'task': 'sms_core.tasks.task_counters_reconcile',
+        'schedule': COUNTERS_RECONCILE_TIME,
     },
 }
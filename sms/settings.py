@@ -51,6 +51,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'sms_core.middleware.MetricsMiddleware',
+    'sms_core.middleware.TimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -120,9 +122,9 @@ AUTH_USER_MODEL = 'sms_core.SmsUser'
 # Rest API settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.BasicAuthentication',
+        'sms_api.authentication.CachedBasicAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'sms_api.authentication.CachedTokenAuthentication',
     ],
     'TEST_REQUEST_DEFAULT_FORMAT': 'json',
     'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.coreapi.AutoSchema',
@@ -166,3 +168,119 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 CELERY_IGNORE_RESULT = True
 
+
+# Probe engine settings
+# 'subprocess' - a `ping` process per device, 'icmp' - the asynchronous ICMP engine
+PROBE_ENGINE = environ.get('PROBE_ENGINE', default='subprocess')
+# 'fast' - `ping` exits at the first reply, 'full' - `ping` always sends 3 requests
+PROBE_PING_MODE = environ.get('PROBE_PING_MODE', default='fast')
+# Defaults of the per-device ping deadline and interval in seconds
+PROBE_PING_DEADLINE = int(environ.get('PROBE_PING_DEADLINE', default='3'))
+PROBE_PING_INTERVAL = float(environ.get('PROBE_PING_INTERVAL', default='1'))
+PROBE_ICMP_TIMEOUT = float(environ.get('PROBE_ICMP_TIMEOUT', default='1'))
+PROBE_ICMP_COUNT = int(environ.get('PROBE_ICMP_COUNT', default='3'))
+PROBE_ICMP_CONCURRENCY = int(environ.get('PROBE_ICMP_CONCURRENCY', default='2000'))
+
+
+# Scheduler settings
+# 'redis' - a schedule shared by workers and their processes,
+# 'memory' - a schedule of a single worker of one process (--concurrency=1)
+SCHEDULER_BACKEND = environ.get('SCHEDULER_BACKEND', default='redis')
+# Seconds before devices claimed by a lost worker return to the schedule
+SCHEDULER_LEASE_TIME = int(environ.get('SCHEDULER_LEASE_TIME', default='300'))
+SCHEDULER_BATCH_SIZE = int(environ.get('SCHEDULER_BATCH_SIZE', default='500'))
+# Seconds between syncs of the schedule with the database
+SCHEDULER_RECONCILE_INTERVAL = int(environ.get('SCHEDULER_RECONCILE_INTERVAL', default='60'))
+# Claiming tasks started by every monitoring loop run
+SCHEDULER_CLAIM_TASKS = int(environ.get('SCHEDULER_CLAIM_TASKS', default='4'))
+# Snapshots of the 'memory' schedule restored on worker start: 'redis', 'file' or 'none'.
+# Every worker keeps its own snapshot by its node name, files are next to the path
+SCHEDULER_SNAPSHOT_STORE = environ.get('SCHEDULER_SNAPSHOT_STORE', default='redis')
+SCHEDULER_SNAPSHOT_PATH = environ.get(
+    'SCHEDULER_SNAPSHOT_PATH', default=os.path.join(BASE_DIR, 'schedule_snapshot.json')
+)
+# Seconds between snapshots of the schedule
+SCHEDULER_SNAPSHOT_INTERVAL = int(environ.get('SCHEDULER_SNAPSHOT_INTERVAL', default='60'))
+# Seconds to spread checks of devices overdue at worker start over
+SCHEDULER_RAMP_WINDOW = int(environ.get('SCHEDULER_RAMP_WINDOW', default='60'))
+
+
+# Time series of probe results
+# Days of raw probe results, a partition of a day is dropped after them
+TIMESERIES_RETENTION_DAYS = int(environ.get('TIMESERIES_RETENTION_DAYS', default='7'))
+# Partitions created in advance, in days
+TIMESERIES_PARTITIONS_AHEAD = int(environ.get('TIMESERIES_PARTITIONS_AHEAD', default='2'))
+# Rows per INSERT of probe results
+TIMESERIES_BATCH_SIZE = int(environ.get('TIMESERIES_BATCH_SIZE', default='1000'))
+# Rollups of probe results: 'hour' or 'day' periods kept for TIMESERIES_ROLLUP_RETENTION_DAYS
+TIMESERIES_ROLLUP_PERIOD = environ.get('TIMESERIES_ROLLUP_PERIOD', default='hour')
+TIMESERIES_ROLLUP_RETENTION_DAYS = int(environ.get('TIMESERIES_ROLLUP_RETENTION_DAYS', default='365'))
+# Points of a window query, longer windows are downsampled into buckets of several points
+TIMESERIES_MAX_POINTS = int(environ.get('TIMESERIES_MAX_POINTS', default='1000'))
+
+
+# Availability rollups of status events
+# Days of hourly availability, daily availability is kept
+AVAILABILITY_HOURLY_RETENTION_DAYS = int(environ.get('AVAILABILITY_HOURLY_RETENTION_DAYS', default='90'))
+# Seconds of status events left to the next rollup, so events committed late are not missed
+AVAILABILITY_ROLLUP_LAG = int(environ.get('AVAILABILITY_ROLLUP_LAG', default='60'))
+
+
+# Live status stream of the overview page, see sms/asgi.py
+# Seconds between keepalive comments of an idle stream
+STATUS_STREAM_KEEPALIVE = int(environ.get('STATUS_STREAM_KEEPALIVE', default='15'))
+# Messages kept for a slow browser before it is told to reload the page
+STATUS_STREAM_QUEUE_SIZE = int(environ.get('STATUS_STREAM_QUEUE_SIZE', default='100'))
+
+
+# Overview page
+# Seconds rendered device cards are kept in Redis, 0 disables the cache
+OVERVIEW_CARD_CACHE_TIMEOUT = int(environ.get('OVERVIEW_CARD_CACHE_TIMEOUT', default='86400'))
+# Devices per page
+OVERVIEW_PAGE_SIZE = int(environ.get('OVERVIEW_PAGE_SIZE', default='100'))
+
+
+# Changes of devices for API pollers
+# Seconds of changes sent again by the next cursor, so late commits are not missed
+DEVICE_CHANGES_LAG = int(environ.get('DEVICE_CHANGES_LAG', default='5'))
+
+
+# Bulk requests of the devices API
+# Devices per request
+API_BULK_MAX_DEVICES = int(environ.get('API_BULK_MAX_DEVICES', default='5000'))
+# Rows per INSERT / UPDATE of a batch
+API_BULK_WRITE_SIZE = int(environ.get('API_BULK_WRITE_SIZE', default='1000'))
+
+
+# Export of devices and status events
+# Rows per fetch of the server-side cursor and per written chunk
+EXPORT_CHUNK_SIZE = int(environ.get('EXPORT_CHUNK_SIZE', default='2000'))
+
+
+# Verified credentials of API requests
+# Seconds users of Basic and Token credentials are kept in Redis, 0 disables the cache
+AUTH_CACHE_TIMEOUT = int(environ.get('AUTH_CACHE_TIMEOUT', default='300'))
+
+
+# Metrics of probes, the check loop and views at /metrics
+# Metrics of all processes are kept in Redis, 'False' disables them
+METRICS_ENABLED = environ.get('METRICS_ENABLED', default='True') == 'True'
+# Comma separated addresses or networks of scrapers allowed to read metrics
+METRICS_ALLOWED_IPS = environ.get('METRICS_ALLOWED_IPS', default='127.0.0.1,::1').split(',')
+# Comma separated addresses or networks of reverse proxies, e.g. nginx. The address of
+# a scraper behind them is the X-Real-IP header the proxy sets, no proxy is trusted by default
+METRICS_TRUSTED_PROXIES = [
+    proxy for proxy in environ.get('METRICS_TRUSTED_PROXIES', default='').split(',') if proxy
+]
+
+
+# Timing of requests, see TimingMiddleware
+# 'True' adds Server-Timing headers, the top of slow endpoints and logs of slow requests
+REQUEST_TIMING_ENABLED = environ.get('REQUEST_TIMING_ENABLED', default='False') == 'True'
+# Milliseconds of a request that is logged with its slowest SQL statements
+REQUEST_TIMING_SLOW_MS = int(environ.get('REQUEST_TIMING_SLOW_MS', default='1000'))
+REQUEST_TIMING_SLOW_QUERIES = int(environ.get('REQUEST_TIMING_SLOW_QUERIES', default='5'))
+# Recent requests of a process the top of slow endpoints is made of
+REQUEST_TIMING_WINDOW = int(environ.get('REQUEST_TIMING_WINDOW', default='1000'))
+# Endpoints of the top
+REQUEST_TIMING_TOP = int(environ.get('REQUEST_TIMING_TOP', default='10'))
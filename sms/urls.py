@@ -19,7 +19,7 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.urls import path, include
 
-from .views import redirect_sms_login, redirect_sms_overview
+from .views import redirect_sms_login, redirect_sms_overview, metrics, slow_endpoints
 
 
 urlpatterns = [
@@ -30,4 +30,6 @@ urlpatterns = [
     path('api/v1/auth-base/', include('rest_framework.urls')),
     path('api/v1/auth-token/', include('djoser.urls.authtoken')),
     path('api/v1/sms/', include('sms_api.urls')),
+    path('metrics', metrics, name='metrics'),
+    path('metrics/slow', slow_endpoints, name='slow_endpoints'),
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
@@ -1,7 +1,15 @@
 """ Project's core views """
 
 
+import ipaddress
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse
 from django.shortcuts import redirect
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from sms_core.middleware import SLOW_ENDPOINTS
+from sms_core.utils.metrics_utils import metrics_registry
 
 
 def redirect_sms_overview(request):
@@ -12,3 +20,41 @@ def redirect_sms_overview(request):
 def redirect_sms_login(request):
     """ Permanent redirect to a login page """
     return redirect('sms_core:url_login', permanent=True)
+
+
+def address_in(address: str, networks: list) -> bool:
+    """ The address belongs to one of addresses or networks """
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network, strict=False) for network in networks)
+
+
+def scraper_allowed(request) -> bool:
+    """
+    The client is one of METRICS_ALLOWED_IPS. Behind a proxy of METRICS_TRUSTED_PROXIES
+    the client is X-Real-IP, the proxy replaces the header sent by the client.
+    """
+    address = request.META.get('REMOTE_ADDR', '')
+    if address_in(address, settings.METRICS_TRUSTED_PROXIES):
+        address = request.META.get('HTTP_X_REAL_IP', '')
+    return address_in(address, settings.METRICS_ALLOWED_IPS)
+
+
+def metrics(request):
+    """ Metrics of all processes in the Prometheus format for scrapers of METRICS_ALLOWED_IPS """
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if not scraper_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(generate_latest(metrics_registry()), content_type=CONTENT_TYPE_LATEST)
+
+
+def slow_endpoints(request):
+    """ The top of slow endpoints of this process as JSON, see TimingMiddleware """
+    if not settings.REQUEST_TIMING_ENABLED:
+        raise Http404
+    if not scraper_allowed(request):
+        return HttpResponseForbidden()
+    return JsonResponse({'endpoints': SLOW_ENDPOINTS.top(settings.REQUEST_TIMING_TOP)})
@@ -0,0 +1,34 @@
+"""
+Authentication of REST API requests with verified credentials cached in Redis.
+A password is hashed and a token is looked up once per AUTH_CACHE_TIMEOUT,
+cached users are dropped when they are saved or removed or their tokens are removed.
+"""
+
+from rest_framework.authentication import BasicAuthentication, TokenAuthentication
+
+from sms_core.utils.auth_utils import credentials_digest, get_cached_user, cache_user
+
+
+class CachedBasicAuthentication(BasicAuthentication):
+    """ Basic authentication without hashing of passwords verified recently """
+
+    def authenticate_credentials(self, userid, password, request=None):
+        digest = credentials_digest('basic', userid, password)
+        user, generation = get_cached_user(digest)
+        if user is None:
+            # Wrong credentials are not cached, every attempt is hashed
+            user, _ = super().authenticate_credentials(userid, password, request)
+            cache_user(digest, user, generation)
+        return user, None
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """ Token authentication without queries for tokens used recently, `auth` is the key """
+
+    def authenticate_credentials(self, key):
+        digest = credentials_digest('token', key)
+        user, generation = get_cached_user(digest)
+        if user is None:
+            user, _ = super().authenticate_credentials(key)
+            cache_user(digest, user, generation)
+        return user, key
@@ -0,0 +1,102 @@
+""" Batches of devices of bulk requests: validation by the whole batch and per-item results """
+
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from sms_core.models import Device
+from sms_core.tasks import dispatch_device_checks
+
+
+def get_batch(data, key: str) -> list:
+    """ Items of a batch by the key of the request data """
+    items = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise ValidationError({key: ['A non-empty list is expected.']})
+    if len(items) > settings.API_BULK_MAX_DEVICES:
+        raise ValidationError({key: [f'Up to {settings.API_BULK_MAX_DEVICES} items are expected.']})
+    return items
+
+
+def get_batch_devices(ids: list) -> tuple:
+    """
+    Devices of a batch by their ids with one query.
+    Returns a list of devices and a list of errors, None for found devices.
+    """
+    valid_ids = [pk for pk in ids if isinstance(pk, int) and not isinstance(pk, bool)]
+    found = Device.objects.in_bulk(valid_ids)
+    devices, errors, seen = [], [], set()
+    for pk in ids:
+        error = None
+        if not isinstance(pk, int) or isinstance(pk, bool):
+            error = 'A valid integer is required.'
+        elif pk in seen:
+            error = 'The device is repeated in the batch.'
+        elif pk not in found:
+            error = 'Not found.'
+        else:
+            seen.add(pk)
+        devices.append(None if error else found[pk])
+        errors.append({'id': [error]} if error else None)
+    return devices, errors
+
+
+def check_unique(serializers: list, errors: list, fields: tuple) -> None:
+    """
+    Setting errors of items whose values of unique fields are repeated in the batch
+    or taken by other devices, with one query per field instead of one per item
+    """
+    for field in fields:
+        values = {}
+        for index, serializer in enumerate(serializers):
+            if errors[index] is None:
+                value = serializer.validated_data.get(field, getattr(serializer.instance, field, None))
+                values.setdefault(value, []).append(index)
+        # Updated devices may keep their values
+        batch_ids = [
+            serializers[index].instance.pk for indexes in values.values() for index in indexes
+            if serializers[index].instance is not None
+        ]
+        taken = set(
+            Device.objects.filter(**{f'{field}__in': list(values)})
+            .exclude(pk__in=batch_ids).values_list(field, flat=True)
+        )
+        message = f'Device with this {Device._meta.get_field(field).verbose_name} already exists.'
+        for value, indexes in values.items():
+            if value in taken or len(indexes) > 1:
+                for index in indexes:
+                    errors[index] = {field: [message]}
+
+
+@contextmanager
+def batch_transaction():
+    """
+    The transaction of a batch. Values taken by concurrent requests after the check
+    fail the whole batch, it can be sent again.
+    """
+    try:
+        with transaction.atomic():
+            yield
+    except IntegrityError:
+        raise ValidationError(
+            {'devices': ['The batch conflicts with concurrent changes of devices, send it again.']}
+        )
+
+
+def check_after_commit(devices: list) -> None:
+    """ One batched check of new and updated devices instead of a task per device """
+    names = [device.name for device in devices]
+    if names:
+        transaction.on_commit(lambda: dispatch_device_checks(names, 'bulk'))
+
+
+def batch_response(results: list, done: str, count: int) -> Response:
+    """ Per-item results in the order of the batch, 400 if no item succeeded """
+    failed = sum(1 for result in results if 'errors' in result)
+    return Response(
+        {'devices': results, done: count, 'failed': failed},
+        status=200 if count else 400
+    )
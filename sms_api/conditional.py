@@ -0,0 +1,36 @@
+""" Validators of REST API responses for conditional GET requests """
+
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def devices_validators(devices: list, *variants) -> tuple:
+    """
+    A strong ETag and the Last-Modified time of a response made of devices.
+    A device changes its representation only with `updated_at` or
+    `last_status_changed`, `variants` - anything else the response depends on.
+    Devices are models or rows with the same attributes.
+    Returns (ETag, Last-Modified timestamp or None)
+    """
+    digest = hashlib.sha1(repr(variants).encode())
+    last_modified = None
+    for device in devices:
+        modified = max(device.updated_at, device.last_status_changed)
+        digest.update(f'{device.id}:{modified.isoformat()};'.encode())
+        last_modified = modified if last_modified is None else max(last_modified, modified)
+    return f'"{digest.hexdigest()}"', last_modified and int(last_modified.timestamp())
+
+
+def not_modified(request, etag: str, last_modified) -> object:
+    """ The 304 response if the client has the current representation or None """
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def set_validators(response, etag: str, last_modified) -> object:
+    """ Adding the ETag and Last-Modified headers to a response """
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
@@ -0,0 +1,48 @@
+"""
+Streaming responses of exports. Rows are read while the response is sent,
+so under ASGI the export paths are served by the WSGI application in threads, see sms/asgi.py
+"""
+
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from sms_core.utils.export_utils import (
+    EXPORT_FORMATS, CONTENT_TYPES, export_chunks, encode_chunks, export_filename
+)
+
+
+EXPORT_PATHS = ('/api/v1/sms/devices/export', '/api/v1/sms/devices/events/export')
+
+
+def get_time_param(request, name: str) -> object:
+    """ An aware time of a query parameter or None """
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    try:
+        time = parse_datetime(value)
+    except ValueError:
+        time = None
+    if time is None or time.tzinfo is None:
+        raise ValidationError({name: ['An ISO 8601 time with a time zone is expected.']})
+    return time
+
+
+def export_response(request, name: str, fields: tuple, rows: object) -> StreamingHttpResponse:
+    """
+    A file of rows streamed by chunks.
+    ?output=ndjson|csv - NDJSON by default ?gzip=1 - a gzip file
+    """
+    output = request.query_params.get('output', 'ndjson')
+    if output not in EXPORT_FORMATS:
+        raise ValidationError({'output': [f'One of {", ".join(EXPORT_FORMATS)} is expected.']})
+    compress = request.query_params.get('gzip') in ('1', 'true')
+    response = StreamingHttpResponse(
+        encode_chunks(export_chunks(fields, rows, output), compress),
+        content_type=CONTENT_TYPES['gzip' if compress else output]
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{export_filename(name, output, compress)}"'
+    )
+    return response
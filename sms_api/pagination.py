@@ -0,0 +1,24 @@
+""" Pagination of REST API lists """
+
+from collections import OrderedDict
+
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class DeviceCursorPagination(CursorPagination):
+    """
+    Pages of devices ordered by id. A page is read after the last id of
+    the previous one, so deep pages cost the same as the first one.
+    """
+    ordering = 'id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('devices', data)
+        ]))
@@ -1,6 +1,11 @@
 """ API serializers for the application sms_core """
 
-from rest_framework import serializers
+import datetime
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
 
 from sms_core.models import Device
 
@@ -23,3 +28,74 @@ class DeviceUpdateSerializer(DeviceSerializer):
         model = Device
         fields = ('__all__')
         read_only_fields = ('name', 'status', 'last_status_changed')
+
+
+class DeviceRowsSerializer:
+    """
+    A read-only serializer of device listings with the output of DeviceSerializer.
+    Rows are read by `values_list` of the shown fields and only times are converted,
+    other values of the database are the same in JSON.
+    """
+
+    def __init__(self):
+        fields = DeviceSerializer().fields
+        self.fields = tuple(name for name, field in fields.items() if not field.write_only)
+        self.converters = tuple(
+            self.get_time_converter(fields[name])
+            if isinstance(fields[name], serializers.DateTimeField) else None
+            for name in self.fields
+        )
+
+    @staticmethod
+    def get_time_converter(field: serializers.DateTimeField) -> object:
+        """
+        DateTimeField.to_representation for aware times of the database. DRF looks up
+        the current time zone for every value, here it is found once per listing.
+        """
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        if not settings.USE_TZ or output_format is None or output_format.lower() != ISO_8601:
+            return field.to_representation
+        field_timezone = getattr(field, 'timezone', None) or timezone.get_current_timezone()
+
+        def convert(value: datetime.datetime) -> str:
+            value = value.astimezone(field_timezone).isoformat()
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+        return convert
+
+    def get_rows(self, queryset) -> object:
+        """ Named rows of devices, they have attributes of models for pagination and ETags """
+        return queryset.values_list(*self.fields, named=True)
+
+    def to_representation(self, rows: list) -> list:
+        return [
+            {
+                name: value if convert is None or value is None else convert(value)
+                for name, convert, value in zip(self.fields, self.converters, row)
+            } for row in rows
+        ]
+
+
+class DeviceBulkSerializer(DeviceSerializer):
+    """ A serializer for batches of new devices, unique values are checked by the whole batch """
+
+    class Meta(DeviceSerializer.Meta):
+        extra_kwargs = {'name': {'validators': []}, 'ip_fqdn': {'validators': []}}
+
+
+class DeviceBulkUpdateSerializer(DeviceUpdateSerializer):
+    """ A serializer for batches of updated devices, unique values are checked by the whole batch """
+
+    class Meta(DeviceUpdateSerializer.Meta):
+        extra_kwargs = {'ip_fqdn': {'validators': []}}
+
+
+class ProbePointSerializer(serializers.Serializer):
+    """ A serializer for probe results of a time window """
+
+    time = serializers.DateTimeField()
+    rtt_min = serializers.FloatField(allow_null=True)
+    rtt_avg = serializers.FloatField(allow_null=True)
+    rtt_max = serializers.FloatField(allow_null=True)
+    loss = serializers.FloatField()
+    # Probes aggregated into the point, rollups and downsampled windows only
+    samples = serializers.IntegerField(default=1)
@@ -1,8 +1,31 @@
 """ Tests of using common API methods for unauthorized user """
 
+import asyncio
+import base64
+import datetime
+import gzip
+import json
+import unittest
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+
+from django.core.management.color import no_style
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.authentication import BasicAuthentication
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APITestCase
 
+from sms.asgi import application, build_environ, ThreadedWsgiApplication
+from sms_api.serializers import DeviceSerializer
+from sms_core.forms import UserChangeForm
 from sms_core.models import SmsUser, Device
+from sms_core.utils.auth_utils import get_cached_user, cache_user, drop_cached_user
+from sms_core.utils.icmp_utils import PingStats
+from sms_core.utils.redis_utils import get_redis, redis_available
+from sms_core.utils.timeseries_utils import record_probe_results
 
 
 class APICommonTests(APITestCase):
@@ -55,6 +78,15 @@ class APICommonTestsAdmin(APICommonTests):
                 devices[i].check_interval
             )
 
+    def test_device_list_representation(self) -> None:
+        device = Device.objects.get(pk=2)
+        device.ping_interval, device.ping_deadline = 0.5, 2
+        device.save()
+        device.set_status(True)
+        response = self.client.get(path='/api/v1/sms/devices')
+        expected = DeviceSerializer(Device.objects.order_by('id'), many=True).data
+        self.assertEqual(json.loads(response.content)['devices'], json.loads(json.dumps(expected)))
+
     def test_device_detail(self, pk=1) -> None:
         device = Device.objects.get(pk=pk)
         response = self.client.get(path=f'/api/v1/sms/devices/{pk}')
@@ -64,6 +96,19 @@ class APICommonTestsAdmin(APICommonTests):
         self.assertEqual(response.data['device']['description'], device.description)
         self.assertEqual(int(response.data['device']['check_interval']), device.check_interval)
 
+    def test_device_detail_probes(self, pk=1) -> None:
+        record_probe_results([(pk, PingStats(3, 2, 1.0, 2.0, 3.0))])
+        response = self.client.get(path=f'/api/v1/sms/devices/{pk}')
+        self.assertNotIn('probes', response.data)
+        response = self.client.get(path=f'/api/v1/sms/devices/{pk}', data={'window': '1h'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['probes']['resolution'], 'raw')
+        self.assertEqual(len(response.data['probes']['points']), 1)
+        self.assertEqual(response.data['probes']['points'][0]['loss'], 33)
+        self.assertEqual(response.data['probes']['points'][0]['rtt_avg'], 2.0)
+        response = self.client.get(path=f'/api/v1/sms/devices/{pk}', data={'window': 'week'})
+        self.assertEqual(response.status_code, 400)
+
     def test_device_create(self) -> None:
         data = {
             "name": "device3",
@@ -134,6 +179,14 @@ class APICommonTestsUser(APICommonTests):
                 devices[i].check_interval
             )
 
+    @mock.patch('sms_core.utils.counters_utils.COUNTERS_KEY', 'sms:test:counters')
+    def test_device_summary(self) -> None:
+        self.addCleanup(get_redis().delete, 'sms:test:counters')
+        Device.objects.get(pk=1).set_status(True)
+        response = self.client.get(path='/api/v1/sms/devices/summary')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['summary'], {'total': 2, 'up': 1, 'down': 1})
+
     def test_device_detail(self, pk=1) -> None:
         device = Device.objects.get(pk=pk)
         response = self.client.get(path=f'/api/v1/sms/devices/{pk}')
@@ -177,3 +230,402 @@ class APICommonTestsUser(APICommonTests):
             str(response.content, encoding='utf8'),
             {"detail": "You do not have permission to perform this action."}
         )
+
+    def test_device_bulk(self) -> None:
+        response = self.client.post(path='/api/v1/sms/devices/bulk', data={'devices': []})
+        self.assertEqual(response.status_code, 403)
+
+
+@mock.patch('django.db.transaction.on_commit', side_effect=lambda func: func())
+@mock.patch('sms_api.bulk.dispatch_device_checks')
+@mock.patch('sms_core.managers.change_counters')
+class APIBulkTests(APICommonTests):
+    """ Tests of bulk requests for batches of devices """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        super().setUpTestData()
+        # Devices are created with explicit ids, new ids go after them
+        with connection.cursor() as cursor:
+            cursor.execute(connection.ops.sequence_reset_sql(no_style(), [Device])[0])
+
+    def setUp(self):
+        self.client.login(username='test_admin', password='test_admin')
+
+    def tearDown(self) -> None:
+        self.client.logout()
+
+    def test_bulk_create(self, change_counters_mock, dispatch_mock, *mocks) -> None:
+        devices = [
+            {'name': 'device3', 'ip_fqdn': '3.3.3.3', 'check_interval': 15},
+            {'name': 'device1', 'ip_fqdn': '4.4.4.4'},
+            {'name': 'device5', 'ip_fqdn': '5.5.5.5'},
+            {'name': 'device6', 'ip_fqdn': '5.5.5.5'},
+            {'name': 'bad name', 'ip_fqdn': '7.7.7.7'},
+            'device8',
+        ]
+        # The session, the user, unique names and IPs, and the insert
+        with self.assertNumQueries(7):
+            response = self.client.post(
+                path='/api/v1/sms/devices/bulk', data={'devices': devices}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['failed']), (1, 5))
+        results = response.data['devices']
+        self.assertEqual(results[0], {'id': Device.objects.get(name='device3').pk, 'name': 'device3'})
+        self.assertIn('name', results[1]['errors'])
+        self.assertIn('ip_fqdn', results[2]['errors'])
+        self.assertIn('ip_fqdn', results[3]['errors'])
+        self.assertIn('name', results[4]['errors'])
+        self.assertIn('errors', results[5])
+        self.assertEqual(Device.objects.get(name='device3').check_interval, 15)
+        # One check of the batch
+        dispatch_mock.assert_called_once_with(['device3'], 'bulk')
+        change_counters_mock.assert_called_once_with({'total': 1, 'up': 0, 'down': 1})
+
+        response = self.client.post(path='/api/v1/sms/devices/bulk', data={'devices': ['x']})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(path='/api/v1/sms/devices/bulk', data={'devices': {}})
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_update(self, change_counters_mock, dispatch_mock, *mocks) -> None:
+        devices = [
+            {'id': 1, 'ip_fqdn': '11.11.11.11', 'description': 'New 1'},
+            {'id': 2, 'ip_fqdn': '2.2.2.2', 'name': 'renamed'},
+            {'id': 3, 'description': 'Missing'},
+            {'id': 2},
+            {'description': 'No id'},
+        ]
+        response = self.client.patch(path='/api/v1/sms/devices/bulk', data={'devices': devices})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['updated'], response.data['failed']), (2, 3))
+        self.assertEqual(response.data['devices'][:2], [{'id': 1}, {'id': 2}])
+        self.assertEqual(
+            [result['errors']['id'] for result in response.data['devices'][2:]],
+            [['Not found.'], ['The device is repeated in the batch.'],
+             ['A valid integer is required.']]
+        )
+        # A device keeps its IP, the name is read only
+        device1, device2 = Device.objects.get(pk=1), Device.objects.get(pk=2)
+        self.assertEqual((device1.ip_fqdn, device1.description), ('11.11.11.11', 'New 1'))
+        self.assertEqual((device2.name, device2.ip_fqdn), ('device2', '2.2.2.2'))
+        self.assertEqual(device1.updated_by.name, 'test_admin')
+        dispatch_mock.assert_called_once_with(['device1', 'device2'], 'bulk')
+
+        devices = [{'id': 1, 'ip_fqdn': '3.3.3.3'}, {'id': 2, 'ip_fqdn': '3.3.3.3'}]
+        response = self.client.patch(path='/api/v1/sms/devices/bulk', data={'devices': devices})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ip_fqdn', response.data['devices'][0]['errors'])
+
+    def test_bulk_delete(self, change_counters_mock, dispatch_mock, *mocks) -> None:
+        response = self.client.delete(path='/api/v1/sms/devices/bulk', data={'ids': [1, 2, 3]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['deleted'], response.data['failed']), (2, 1))
+        self.assertEqual(response.data['devices'][2], {'id': 3, 'errors': {'id': ['Not found.']}})
+        self.assertFalse(Device.objects.exists())
+        change_counters_mock.assert_called_once_with({'total': -2, 'up': 0, 'down': -2})
+        dispatch_mock.assert_not_called()
+
+    @mock.patch('django.conf.settings.API_BULK_MAX_DEVICES', 2)
+    def test_bulk_limit(self, *mocks) -> None:
+        response = self.client.delete(path='/api/v1/sms/devices/bulk', data={'ids': [1, 2, 3]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Device.objects.count(), 2)
+
+
+class APIConditionalTests(APICommonTests):
+    """ Tests of pages of devices and conditional GET requests """
+
+    def setUp(self):
+        self.client.login(username='test_user', password='test_user')
+
+    def tearDown(self) -> None:
+        self.client.logout()
+
+    def test_device_list_pages(self) -> None:
+        response = self.client.get(path='/api/v1/sms/devices', data={'page_size': 1})
+        self.assertEqual([device['name'] for device in response.data['devices']], ['device1'])
+        self.assertIsNone(response.data['previous'])
+        response = self.client.get(path=response.data['next'])
+        self.assertEqual([device['name'] for device in response.data['devices']], ['device2'])
+        self.assertIsNone(response.data['next'])
+
+    def test_device_list_not_modified(self) -> None:
+        response = self.client.get(path='/api/v1/sms/devices')
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('"'))
+        self.assertIn('Last-Modified', response)
+        # The session, the user and the page of devices
+        with self.assertNumQueries(3):
+            response = self.client.get(path='/api/v1/sms/devices', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+        # A status change makes a new representation
+        Device.objects.get(pk=2).set_status(True)
+        response = self.client.get(path='/api/v1/sms/devices', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_device_detail_not_modified(self, pk=1) -> None:
+        response = self.client.get(path=f'/api/v1/sms/devices/{pk}')
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        response = self.client.get(path=f'/api/v1/sms/devices/{pk}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(
+            path=f'/api/v1/sms/devices/{pk}', HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEqual(response.status_code, 304)
+        # The other device has another ETag
+        self.assertNotEqual(self.client.get(path='/api/v1/sms/devices/2')['ETag'], etag)
+
+        # An update changes the ETag of the device
+        self.client.logout()
+        self.client.login(username='test_admin', password='test_admin')
+        self.client.patch(path=f'/api/v1/sms/devices/{pk}', data={'description': 'New'})
+        response = self.client.get(path=f'/api/v1/sms/devices/{pk}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['device']['description'], 'New')
+
+    def test_device_changes(self) -> None:
+        # Changes of the last seconds are sent again, the devices are created earlier
+        Device.objects.update(updated_at=timezone.now() - datetime.timedelta(minutes=1))
+        response = self.client.get(path='/api/v1/sms/devices/changes')
+        self.assertEqual(response.data['devices'], [])
+        cursor = response.data['cursor']
+        self.client.logout()
+        self.client.login(username='test_admin', password='test_admin')
+        self.client.patch(path='/api/v1/sms/devices/2', data={'description': 'New'})
+        response = self.client.get(path='/api/v1/sms/devices/changes', data={'since': cursor})
+        self.assertEqual([device['name'] for device in response.data['devices']], ['device2'])
+        self.assertTrue(response.data['cursor'])
+        response = self.client.get(path='/api/v1/sms/devices/changes', data={'since': 'broken'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('since', response.data)
+
+
+class APIExportTests(APICommonTests):
+    """ Tests of streaming exports of devices and status events """
+
+    def setUp(self):
+        self.client.login(username='test_user', password='test_user')
+
+    def tearDown(self) -> None:
+        self.client.logout()
+
+    def test_device_export(self) -> None:
+        response = self.client.get(path='/api/v1/sms/devices/export')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertIn('filename="devices.ndjson"', response['Content-Disposition'])
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual([json.loads(line)['name'] for line in lines], ['device1', 'device2'])
+
+        response = self.client.get(path='/api/v1/sms/devices/export', data={'output': 'csv'})
+        self.assertEqual(b''.join(response.streaming_content).splitlines()[0][:14], b'id,name,ip_fqd')
+        response = self.client.get(
+            path='/api/v1/sms/devices/export', data={'output': 'csv', 'gzip': '1'}
+        )
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('filename="devices.csv.gz"', response['Content-Disposition'])
+        self.assertEqual(len(gzip.decompress(b''.join(response.streaming_content)).splitlines()), 3)
+        response = self.client.get(path='/api/v1/sms/devices/export', data={'output': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_event_export(self) -> None:
+        Device.objects.get(pk=1).set_status(True)
+        response = self.client.get(path='/api/v1/sms/devices/events/export')
+        self.assertEqual(response.status_code, 200)
+        event = json.loads(b''.join(response.streaming_content))
+        self.assertEqual((event['device'], event['device_name'], event['status']), (1, 'device1', True))
+        since = (timezone.now() + datetime.timedelta(minutes=1)).isoformat()
+        response = self.client.get(path='/api/v1/sms/devices/events/export', data={'since': since})
+        self.assertEqual(b''.join(response.streaming_content), b'')
+        response = self.client.get(path='/api/v1/sms/devices/events/export', data={'since': 'now'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(AUTH_CACHE_TIMEOUT=0)
+@mock.patch('sms_core.models.change_counters')
+class APIExportASGITests(TransactionTestCase):
+    """ Tests of exports served by threads of the ASGI application """
+
+    def test_device_export(self, *mocks) -> None:
+        SmsUser.objects.create_user(name='test_user', password='test_user')
+        Device.objects.create(name='device1', ip_fqdn='1.1.1.1',
+                              updated_by=SmsUser.objects.get(name='test_user'))
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': '/api/v1/sms/devices/export',
+            'query_string': b'output=csv', 'root_path': '', 'server': ('testserver', 80),
+            'http_version': '1.1', 'scheme': 'http',
+            'headers': [(b'authorization', b'Basic ' + base64.b64encode(b'test_user:test_user'))],
+        }
+        received, sent = [], []
+
+        async def receive() -> dict:
+            if received:
+                await asyncio.Event().wait()
+            received.append(True)
+            return {'type': 'http.request'}
+
+        async def send(message: dict) -> None:
+            sent.append(message)
+
+        async_to_sync(application)(scope, receive, send)
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertIn((b'content-type', b'text/csv'), sent[0]['headers'])
+        body = b''.join(message.get('body', b'') for message in sent[1:])
+        self.assertEqual(len(body.splitlines()), 2)
+        self.assertFalse(sent[-1].get('more_body'))
+
+    def test_disconnect(self, *mocks) -> None:
+        read, closed = [], []
+
+        class Response:
+            def __iter__(self):
+                for i in range(1000):
+                    read.append(i)
+                    yield b'row\n'
+
+            def close(self):
+                closed.append(True)
+
+        def wsgi_application(environ: dict, start_response) -> object:
+            start_response('200 OK', [('Content-Type', 'text/csv')])
+            return Response()
+
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': '/api/v1/sms/devices/export',
+            'query_string': b'', 'http_version': '1.1', 'headers': [],
+        }
+        received, sent = [], []
+
+        async def receive() -> dict:
+            if not received:
+                received.append(True)
+                return {'type': 'http.request'}
+            # The client goes away after the first rows
+            while len(sent) < 3:
+                await asyncio.sleep(0.001)
+            return {'type': 'http.disconnect'}
+
+        async def send(message: dict) -> None:
+            sent.append(message)
+            await asyncio.sleep(0.001)
+
+        async_to_sync(ThreadedWsgiApplication(wsgi_application))(scope, receive, send)
+        self.assertLess(len(read), 1000)
+        self.assertEqual(closed, [True])
+        self.assertTrue(sent[-1].get('more_body'))
+
+    def test_cookie_headers(self, *mocks) -> None:
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': '/', 'query_string': b'',
+            'http_version': '1.1',
+            'headers': [(b'cookie', b'a=1'), (b'cookie', b'b=2'), (b'accept', b'text/csv'),
+                        (b'accept', b'*/*')],
+        }
+        environ = build_environ(scope, b'')
+        self.assertEqual(environ['HTTP_COOKIE'], 'a=1; b=2')
+        self.assertEqual(environ['HTTP_ACCEPT'], 'text/csv,*/*')
+
+
+@unittest.skipUnless(redis_available(), 'Redis server is not available')
+@mock.patch('django.db.transaction.on_commit', side_effect=lambda func: func())
+@mock.patch('sms_core.utils.auth_utils.AUTH_KEY', 'sms:test:auth')
+class APICachedAuthTests(APICommonTests):
+    """ Tests of Basic and Token authentication with cached credentials """
+
+    def setUp(self) -> None:
+        self.addCleanup(self.clean_cache)
+
+    @staticmethod
+    def clean_cache() -> None:
+        keys = list(get_redis().scan_iter('sms:test:auth*'))
+        if keys:
+            get_redis().delete(*keys)
+
+    def get_changes(self, **headers) -> object:
+        return self.client.get(path='/api/v1/sms/devices/changes', **headers)
+
+    def basic(self, password: str) -> dict:
+        credentials = base64.b64encode(f'test_user:{password}'.encode()).decode()
+        return {'HTTP_AUTHORIZATION': f'Basic {credentials}'}
+
+    def test_basic(self, *mocks) -> None:
+        with mock.patch.object(SmsUser, 'check_password', autospec=True,
+                               side_effect=SmsUser.check_password) as check_mock:
+            self.assertEqual(self.get_changes(**self.basic('test_user')).status_code, 200)
+            self.assertEqual(self.get_changes(**self.basic('test_user')).status_code, 200)
+            self.assertEqual(check_mock.call_count, 1)
+            # Wrong passwords are always checked
+            self.assertEqual(self.get_changes(**self.basic('wrong')).status_code, 401)
+            self.assertEqual(self.get_changes(**self.basic('wrong')).status_code, 401)
+            self.assertEqual(check_mock.call_count, 3)
+        self.assertFalse(any('test_user' in key for key in get_redis().scan_iter('sms:test:auth*')))
+
+        form = UserChangeForm(
+            data={'name': 'test_user', 'password1': 'New_password1', 'password2': 'New_password1'},
+            instance=SmsUser.objects.get(name='test_user')
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        self.assertEqual(self.get_changes(**self.basic('test_user')).status_code, 401)
+        self.assertEqual(self.get_changes(**self.basic('New_password1')).status_code, 200)
+
+        SmsUser.objects.get(name='test_user').set_deleted()
+        self.assertEqual(self.get_changes(**self.basic('New_password1')).status_code, 401)
+
+    def test_token(self, *mocks) -> None:
+        token = Token.objects.create(user=SmsUser.objects.get(name='test_user'))
+        headers = {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+        self.assertEqual(self.get_changes(**headers).status_code, 200)
+        # The token and the user are not read again
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_changes(**headers).status_code, 200)
+        token.delete()
+        self.assertEqual(self.get_changes(**headers).status_code, 401)
+
+    def test_change_while_authenticating(self, *mocks) -> None:
+        user = SmsUser.objects.get(name='test_user')
+        authenticate = BasicAuthentication.authenticate_credentials
+
+        def change_password(*args, **kwargs) -> tuple:
+            # The user is verified before the new password is committed
+            result = authenticate(*args, **kwargs)
+            user.set_password('New_password1')
+            user.save()
+            return result
+
+        with mock.patch.object(BasicAuthentication, 'authenticate_credentials', autospec=True,
+                               side_effect=change_password):
+            self.assertEqual(self.get_changes(**self.basic('test_user')).status_code, 200)
+        # The old password is not cached after the change
+        self.assertEqual(self.get_changes(**self.basic('test_user')).status_code, 401)
+        self.assertEqual(self.get_changes(**self.basic('New_password1')).status_code, 200)
+
+    def test_dropped_generation(self, *mocks) -> None:
+        user = SmsUser.objects.get(name='test_user')
+        self.assertEqual(get_cached_user('digest'), (None, 0))
+        self.assertTrue(cache_user('digest', user, 0))
+        self.assertEqual(get_cached_user('digest')[0].pk, user.pk)
+        # A user cached before a drop is not returned, even if its entry is left
+        get_redis().set(f'sms:test:auth:user:{user.pk}:generation', 1)
+        self.assertEqual(get_cached_user('digest'), (None, 0))
+        self.assertFalse(cache_user('digest', user, 0))
+
+    def test_drop(self, *mocks) -> None:
+        user = SmsUser.objects.get(name='test_user')
+        self.assertTrue(cache_user('digest1', user, 0))
+        self.assertTrue(cache_user('digest2', user, 0))
+        self.assertTrue(drop_cached_user(user.pk))
+        self.assertFalse(get_redis().exists('sms:test:auth:digest1', 'sms:test:auth:digest2'))
+        self.assertFalse(get_redis().smembers(f'sms:test:auth:user:{user.pk}'))
+        self.assertEqual(get_cached_user('digest1'), (None, 1))
+
+    def test_deleted_user(self, *mocks) -> None:
+        self.assertEqual(self.get_changes(**self.basic('test_user')).status_code, 200)
+        SmsUser.objects.filter(name='test_user').delete()
+        self.assertEqual(self.get_changes(**self.basic('test_user')).status_code, 401)
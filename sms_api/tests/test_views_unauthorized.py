@@ -14,6 +14,10 @@ class APICommonTests(APISimpleTestCase):
             {"detail": "Authentication credentials were not provided."}
         )
 
+    def test_device_summary(self) -> None:
+        response = self.client.get(path='/api/v1/sms/devices/summary')
+        self.assertEqual(response.status_code, 401)
+
     def test_device_detail(self, pk=1) -> None:
         response = self.client.get(path=f'/api/v1/sms/devices/{pk}')
         self.assertEqual(response.status_code, 401)
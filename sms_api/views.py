@@ -3,36 +3,109 @@ Views of REST API interface.
 I use a ViewSet instead a ModelViewSet to do customisation of responses
 """
 
+from django.conf import settings
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 
 from sms_core.models import Device
-from .serializers import DeviceSerializer, DeviceUpdateSerializer
+from sms_core.utils.changes_utils import current_changes_cursor, get_changes
+from sms_core.utils.counters_utils import get_counters
+from sms_core.utils.export_utils import device_rows, event_rows
+from sms_core.utils.timeseries_utils import parse_window, get_window_points
+from .bulk import (
+    get_batch, get_batch_devices, check_unique, batch_transaction, check_after_commit,
+    batch_response
+)
+from .conditional import devices_validators, not_modified, set_validators
+from .export import get_time_param, export_response
+from .pagination import DeviceCursorPagination
+from .serializers import (
+    DeviceSerializer, DeviceUpdateSerializer, DeviceRowsSerializer, DeviceBulkSerializer,
+    DeviceBulkUpdateSerializer, ProbePointSerializer
+)
 
 
 class DeviceView(viewsets.ViewSet):
     """
     A REST API class that contains methods for working with devices: GET, PUT, PATCH, DELETE
+    and their bulk versions for batches of devices
     """
+    pagination_class = DeviceCursorPagination
 
     def get_permissions(self):
         """
         Instantiates and returns the list of permissions that this view requires.
         """
-        if self.action in ('list', 'retrieve'):
+        if self.action in ('list', 'retrieve', 'summary', 'changes', 'export', 'export_events'):
             permission_classes = [IsAuthenticated]
         else:
             permission_classes = [IsAdminUser]
         return [permission() for permission in permission_classes]
 
     def list(self, request):
-        """ Getting information about all devices. GET method """
-        queryset = Device.objects.all()
-        serializer = DeviceSerializer(queryset, many=True)
-        return Response({'devices': serializer.data})
+        """
+        Getting information about all devices by pages ordered by id. GET method
+        ?cursor=<the next or the previous link> ?page_size=<devices, up to 1000>
+        """
+        paginator = self.pagination_class()
+        # Rows without models and DRF fields, the output is the same as of DeviceSerializer
+        serializer = DeviceRowsSerializer()
+        devices = paginator.paginate_queryset(
+            serializer.get_rows(Device.objects.all()), request, view=self
+        )
+        etag, last_modified = devices_validators(
+            devices, request.accepted_renderer.format,
+            paginator.has_next, paginator.has_previous
+        )
+        response = not_modified(request, etag, last_modified)
+        if response is None:
+            response = paginator.get_paginated_response(serializer.to_representation(devices))
+        return set_validators(response, etag, last_modified)
+
+    @action(detail=False)
+    def summary(self, request):
+        """ Getting numbers of all, UP and DOWN devices. GET method """
+        return Response({'summary': get_counters()})
+
+    @action(detail=False)
+    def changes(self, request):
+        """
+        Getting devices whose status or config changed since a cursor. GET method
+        ?since=<the cursor of the previous response>, without it only the cursor
+        of changes from now on is returned. Removed devices are not reported.
+        """
+        since = request.query_params.get('since')
+        if not since:
+            return Response({'devices': [], 'cursor': current_changes_cursor()})
+        try:
+            devices, cursor = get_changes(since)
+        except ValueError as error:
+            raise ValidationError({'since': str(error)})
+        serializer = DeviceSerializer(devices, many=True)
+        return Response({'devices': serializer.data, 'cursor': cursor})
+
+    @action(detail=False)
+    def export(self, request):
+        """
+        Exporting all devices as a stream. GET method
+        ?output=ndjson|csv ?gzip=1
+        """
+        return export_response(request, 'devices', *device_rows())
+
+    @action(detail=False, url_path='events/export')
+    def export_events(self, request):
+        """
+        Exporting status changes of devices as a stream. GET method
+        ?since=<ISO time> ?until=<ISO time> ?output=ndjson|csv ?gzip=1
+        """
+        since, until = get_time_param(request, 'since'), get_time_param(request, 'until')
+        return export_response(request, 'status_events', *event_rows(since, until))
 
     def create(self, request):
         """ Creating a new device. POST method """
@@ -42,11 +115,29 @@ class DeviceView(viewsets.ViewSet):
         return Response({'success': f'Device "{device_saved.name}" created successfully.'})
 
     def retrieve(self, request, pk=None):
-        """ Getting information about  a specific device. GET method """
+        """
+        Getting information about  a specific device. GET method
+        ?window=<seconds or a number with a unit: s, m, h, d> - probe results of the time window,
+        downsampled to TIMESERIES_MAX_POINTS points
+        """
         queryset = Device.objects.all()
         device = get_object_or_404(queryset, pk=pk)
+        if 'window' not in request.query_params:
+            # Probe results change all the time, only the device is validated
+            etag, last_modified = devices_validators([device], request.accepted_renderer.format)
+            response = not_modified(request, etag, last_modified)
+            if response is None:
+                response = Response({'device': DeviceSerializer(device).data})
+            return set_validators(response, etag, last_modified)
+
+        try:
+            window = parse_window(request.query_params['window'])
+        except ValueError as error:
+            raise ValidationError({'window': str(error)})
         serializer = DeviceSerializer(device)
-        return Response({'device': serializer.data})
+        probes = get_window_points(device, window)
+        probes['points'] = ProbePointSerializer(probes['points'], many=True).data
+        return Response({'device': serializer.data, 'probes': probes})
 
     def partial_update(self, request, pk=None):
         """ Updating device properties. PATCH method """
@@ -58,7 +149,8 @@ class DeviceView(viewsets.ViewSet):
             partial=True
         )
         if serializer.is_valid(raise_exception=True):
-            device_saved = serializer.save()
+            # The new time changes ETags of the device
+            device_saved = serializer.save(updated_at=timezone.now())
         return Response({'success': f'Device with id "{pk}" updated successfully.'})
 
     def destroy(self, request, pk=None):
@@ -67,3 +159,91 @@ class DeviceView(viewsets.ViewSet):
         device = get_object_or_404(queryset, pk=pk)
         device.delete()
         return Response({'message': f'Device with id "{pk}" has been deleted'}, status=204)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Creating a batch of devices. POST method
+        {"devices": [<devices>]} - valid devices are created with one transaction,
+        results are in the order of the batch
+        """
+        items = get_batch(request.data, 'devices')
+        serializers = [
+            DeviceBulkSerializer(data=item, context={'request': request}) for item in items
+        ]
+        errors = [None if serializer.is_valid() else serializer.errors for serializer in serializers]
+        check_unique(serializers, errors, ('name', 'ip_fqdn'))
+        devices = [
+            Device(**serializer.validated_data)
+            for serializer, error in zip(serializers, errors) if error is None
+        ]
+        if devices:
+            with batch_transaction():
+                devices = Device.objects.bulk_add(devices, batch_size=settings.API_BULK_WRITE_SIZE)
+                check_after_commit(devices)
+        created, results = iter(devices), []
+        for error in errors:
+            if error:
+                results.append({'errors': error})
+            else:
+                device = next(created)
+                results.append({'id': device.pk, 'name': device.name})
+        return batch_response(results, 'created', len(devices))
+
+    @bulk.mapping.patch
+    def bulk_update(self, request):
+        """
+        Updating properties of a batch of devices. PATCH method
+        {"devices": [{"id": <id>, <properties>}]}
+        """
+        items = get_batch(request.data, 'devices')
+        ids = [item.get('id') if isinstance(item, dict) else None for item in items]
+        devices, errors = get_batch_devices(ids)
+        serializers = [
+            DeviceBulkUpdateSerializer(
+                device, data=item, context={'request': request}, partial=True
+            ) for device, item in zip(devices, items)
+        ]
+        for index, serializer in enumerate(serializers):
+            if errors[index] is None and not serializer.is_valid():
+                errors[index] = serializer.errors
+        check_unique(serializers, errors, ('ip_fqdn',))
+
+        # The new time changes ETags of devices
+        fields, updated_at = {'updated_by', 'updated_at'}, timezone.now()
+        updated = []
+        for serializer, error in zip(serializers, errors):
+            if error is None:
+                device = serializer.instance
+                for field, value in serializer.validated_data.items():
+                    setattr(device, field, value)
+                    fields.add(field)
+                device.updated_by, device.updated_at = request.user, updated_at
+                updated.append(device)
+        if updated:
+            with batch_transaction():
+                Device.objects.bulk_update(
+                    updated, list(fields), batch_size=settings.API_BULK_WRITE_SIZE
+                )
+                check_after_commit(updated)
+        results = [
+            {'id': pk, 'errors': error} if error else {'id': pk} for pk, error in zip(ids, errors)
+        ]
+        return batch_response(results, 'updated', len(updated))
+
+    @bulk.mapping.delete
+    def bulk_destroy(self, request):
+        """
+        Removing a batch of devices. DELETE method
+        {"ids": [<ids>]}
+        """
+        ids = get_batch(request.data, 'ids')
+        devices, errors = get_batch_devices(ids)
+        removed = [device for device in devices if device is not None]
+        if removed:
+            with batch_transaction():
+                Device.objects.bulk_remove(removed)
+        results = [
+            {'id': pk, 'errors': error} if error else {'id': pk} for pk, error in zip(ids, errors)
+        ]
+        return batch_response(results, 'deleted', len(removed))
@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete
 
 
 class SmsCoreConfig(AppConfig):
     name = 'sms_core'
     verbose_name = 'Simple Monitoring System Core'
+
+    def ready(self):
+        # Cached credentials are dropped with API users and their tokens
+        from rest_framework.authtoken.models import Token
+        from .models import SmsUser
+        from .utils.auth_utils import drop_token_user, drop_deleted_user
+        post_delete.connect(drop_token_user, sender=Token, dispatch_uid='sms_core_drop_token_user')
+        post_delete.connect(
+            drop_deleted_user, sender=SmsUser, dispatch_uid='sms_core_drop_deleted_user'
+        )
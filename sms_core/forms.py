@@ -61,7 +61,7 @@ class UserCreationForm(forms.ModelForm):
     def clean_name(self) -> str:
         new_name = self.cleaned_data.get('name')
 
-        if new_name.lower() in ['create', 'add', 'edit']:
+        if new_name.lower() in SmsUser.RESERVED_NAMES:
             raise ValidationError('Please, use other username')
 
         if SmsUser.objects.filter(name__iexact=new_name).count():
@@ -123,7 +123,9 @@ class DeviceForm(forms.ModelForm):
 
     class Meta:
         model = Device
-        fields = ['name', 'ip_fqdn', 'description', 'check_interval']
+        fields = [
+            'name', 'ip_fqdn', 'description', 'check_interval', 'ping_deadline', 'ping_interval'
+        ]
         error_messages = {
             'name': {
                 'invalid': 'Enter a valid “Device name” consisting of letters, numbers,'
@@ -147,12 +149,23 @@ class DeviceForm(forms.ModelForm):
                 attrs={
                     'class': "form-control",
                     'placeholder': "Description",
-                    'maxlength': "255"})
+                    'maxlength': "255"}),
+            'ping_deadline': forms.NumberInput(
+                attrs={
+                    'class': "form-control",
+                    'placeholder': "Default",
+                    'min': "1"}),
+            'ping_interval': forms.NumberInput(
+                attrs={
+                    'class': "form-control",
+                    'placeholder': "Default",
+                    'min': "0.2",
+                    'step': "0.1"})
         }
 
     def clean_name(self) -> str:
         new_name = self.cleaned_data.get('name')
-        if new_name.lower() in ['create', 'add', 'edit']:
+        if new_name.lower() in Device.RESERVED_NAMES:
             raise ValidationError('Please, use other name')
         return new_name
 
@@ -0,0 +1,63 @@
+"""
+A command to measure serializing of device listings by DeviceSerializer
+and by rows of DeviceRowsSerializer on synthetic fleets. Fleets are created
+in a transaction that is rolled back.
+"""
+
+import time
+
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+
+from sms_api.serializers import DeviceSerializer, DeviceRowsSerializer
+from sms_core.models import SmsUser, Device
+
+
+class Command(BaseCommand):
+    help = 'Measures serializing of device listings by models and by rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000',
+                            help='Comma separated numbers of devices of fleets')
+        parser.add_argument('--repeat', type=int, default=3, help='Listings per measurement')
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        with transaction.atomic():
+            user = SmsUser.objects.create_user(name='bench_list', password='bench_list')
+            created = 0
+            for size in sizes:
+                # Fleets grow up to the next size
+                Device.objects.bulk_create([
+                    Device(name=f'bench{i}', ip_fqdn=f'bench{i}.invalid', status=i % 10 != 0,
+                           ping_interval=0.5 if i % 2 else None, updated_by=user)
+                    for i in range(created, size)
+                ], batch_size=1000)
+                created = size
+                devices = Device.objects.order_by('id')[:size]
+                serializer = self.measure(size, 'serializer', options['repeat'], lambda: (
+                    DeviceSerializer(devices.all(), many=True).data
+                ))
+                rows = self.measure(size, 'rows', options['repeat'], lambda: (
+                    DeviceRowsSerializer().to_representation(
+                        DeviceRowsSerializer().get_rows(devices)
+                    )
+                ))
+                self.stdout.write(f'{size:>8} devices: rows are {serializer / rows:.1f}x faster')
+            transaction.set_rollback(True)
+
+    def measure(self, size: int, name: str, repeat: int, serialize) -> float:
+        """ Printing the best time of a listing rendered as JSON, returns the time """
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                started_at = time.perf_counter()
+                content = JSONRenderer().render(serialize())
+                timings.append(time.perf_counter() - started_at)
+        self.stdout.write(
+            f'{size:>8} devices, {name:>10}: {min(timings) * 1000:9.1f} ms, '
+            f'{len(queries)} queries, {len(content) // 1024} KiB'
+        )
+        return min(timings)
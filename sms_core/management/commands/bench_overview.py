@@ -0,0 +1,65 @@
+"""
+A command to measure rendering of the overview page with and without
+the cache of device cards on a synthetic fleet. The fleet is created
+in a transaction that is rolled back.
+"""
+
+import time
+
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from sms_core.models import SmsUser, Device
+from sms_core.utils.cards_utils import card_key, CARD_FIELDS
+from sms_core.utils.redis_utils import get_redis
+from sms_core.views import SmsOverviewView
+
+
+class Command(BaseCommand):
+    help = 'Measures rendering of the overview page with and without the cache of device cards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--devices', type=int, default=10000, help='Devices of the fleet')
+        parser.add_argument('--repeat', type=int, default=3, help='Requests per measurement')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = SmsUser.objects.create_user(name='bench_overview', password='bench_overview')
+            Device.objects.bulk_create([
+                Device(name=f'bench{i}', ip_fqdn=f'bench{i}.invalid', status=i % 10 != 0,
+                       updated_by=user)
+                for i in range(options['devices'])
+            ], batch_size=1000)
+            rows = list(Device.objects.values_list(*CARD_FIELDS))
+            try:
+                # All devices are rendered on one page
+                with override_settings(OVERVIEW_PAGE_SIZE=options['devices']):
+                    with override_settings(OVERVIEW_CARD_CACHE_TIMEOUT=0):
+                        self.measure('uncached', user, options['repeat'])
+                    self.measure('cold cache', user, 1)
+                    self.measure('warm cache', user, options['repeat'])
+                self.measure('first page', user, options['repeat'])
+            finally:
+                keys = [card_key(row, user.is_staff) for row in rows]
+                for i in range(0, len(keys), 1000):
+                    get_redis().delete(*keys[i:i + 1000])
+                transaction.set_rollback(True)
+
+    def measure(self, name: str, user: object, repeat: int) -> None:
+        """ Printing the best time and queries of overview requests """
+        request = RequestFactory().get(reverse('sms_core:url_devices_overview'))
+        request.user = user
+        view = SmsOverviewView.as_view()
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                started_at = time.perf_counter()
+                response = view(request)
+                timings.append(time.perf_counter() - started_at)
+        self.stdout.write(
+            f'{name:>12}: {min(timings) * 1000:9.1f} ms, {len(queries)} queries, '
+            f'{len(response.content) // 1024} KiB'
+        )
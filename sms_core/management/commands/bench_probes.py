@@ -0,0 +1,81 @@
+"""
+A command to measure probe engines on synthetic fleets. Targets are fake,
+simulated with a latency and a loss, or loopback addresses answering real
+pings. Fleets are created in a transaction that is rolled back.
+"""
+
+import json
+
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+
+from benchmarks.harness import TargetProfile, fleet_addresses
+from benchmarks.probes import ENGINES, bench_probes
+from sms_core.models import SmsUser, Device
+
+
+class Command(BaseCommand):
+    help = 'Measures probe engines on synthetic fleets of fake or loopback targets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,1000',
+                            help='Comma separated numbers of devices of fleets')
+        parser.add_argument('--engines', default=','.join(ENGINES),
+                            help='Comma separated engines: ' + ', '.join(ENGINES))
+        parser.add_argument('--target', choices=('fake', 'loopback'), default='fake',
+                            help='Fake targets or real pings of loopback addresses')
+        parser.add_argument('--latency', type=float, default=5, help='Latency of replies, ms')
+        parser.add_argument('--jitter', type=float, default=2, help='Jitter of latency, ms')
+        parser.add_argument('--loss', type=float, default=10,
+                            help='Percent of devices that do not answer')
+        parser.add_argument('--deadline', type=int, default=1,
+                            help='Ping deadline of devices, seconds')
+        parser.add_argument('--workers', type=int, default=5,
+                            help='Threads of the subprocess engine')
+        parser.add_argument('--seed', type=int, default=1, help='Seed of latency and loss')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        engines = options['engines'].split(',')
+        unknown = set(engines) - set(ENGINES)
+        if unknown:
+            raise CommandError(f'Unknown engines: {", ".join(sorted(unknown))}')
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        profile = TargetProfile(options['latency'], options['jitter'], options['loss'] / 100,
+                                options['seed'])
+        loopback = options['target'] == 'loopback'
+
+        results = []
+        with transaction.atomic():
+            user = SmsUser.objects.create_user(name='bench_probes', password='bench_probes')
+            for size in sizes:
+                Device.objects.filter(updated_by=user).delete()
+                Device.objects.bulk_create([
+                    Device(name=f'bench{i}', ip_fqdn=address, ping_deadline=options['deadline'],
+                           updated_by=user)
+                    for i, address in enumerate(fleet_addresses(size, profile, loopback))
+                ], batch_size=1000)
+                names = [f'bench{i}' for i in range(size)]
+                for result in bench_probes(names, engines, None if loopback else profile,
+                                           options['workers']):
+                    result.update(target=options['target'], devices=size)
+                    results.append(result)
+                    if not options['json']:
+                        self.write_result(result)
+            transaction.set_rollback(True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+
+    def write_result(self, result: dict) -> None:
+        if result.get('skipped'):
+            self.stdout.write(f'{result["devices"]:>7} {result["engine"]:>10}: skipped, '
+                              f'no ping or ICMP socket')
+            return
+        self.stdout.write(
+            f'{result["devices"]:>7} {result["engine"]:>10}: '
+            f'{result["probes_per_second"]:9.1f} probes/s, '
+            f'p50 {result["p50"] * 1000:8.1f} ms, p99 {result["p99"] * 1000:8.1f} ms, '
+            f'cpu {result["cpu"]:.2f} s + {result["children_cpu"]:.2f} s, '
+            f'rss {result["rss_mb"]} MiB, up {result["up"]}'
+        )
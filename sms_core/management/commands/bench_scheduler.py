@@ -0,0 +1,57 @@
+"""
+A command to measure paths of the check loop and of pages on a synthetic
+fleet with a mix of check intervals. Results are printed as JSON to follow
+them between releases. The fleet is created in a transaction that is rolled back.
+"""
+
+import json
+import platform
+from collections import Counter
+
+import django
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from benchmarks.scheduler import fleet_devices, bench_paths
+from sms_core.models import SmsUser, Device
+
+
+class Command(BaseCommand):
+    help = 'Measures paths of the check loop, the overview page and the API listing as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--devices', type=int, default=100000, help='Devices of the fleet')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per path')
+        parser.add_argument('--batch-size', type=int, default=settings.SCHEDULER_BATCH_SIZE,
+                            help='Devices of a checked batch')
+        parser.add_argument('--page-size', type=int, default=1000,
+                            help='Devices of a page of the API listing')
+        parser.add_argument('--seed', type=int, default=1, help='Seed of intervals and statuses')
+        parser.add_argument('--file', help='A file to write results to instead of stdout')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = SmsUser.objects.create_user(name='bench_scheduler', password='bench_scheduler')
+            devices = fleet_devices(user, options['devices'], options['seed'])
+            Device.objects.bulk_create(devices, batch_size=1000)
+            intervals = Counter(device.check_interval for device in devices)
+            results = {
+                'time': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'devices': options['devices'],
+                'intervals': dict(sorted(intervals.items())),
+                'repeat': options['repeat'],
+                'paths': bench_paths(user, options['repeat'], options['batch_size'],
+                                     options['page_size'], options['seed']),
+            }
+            transaction.set_rollback(True)
+
+        output = json.dumps(results, indent=2)
+        if options['file']:
+            with open(options['file'], 'w') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
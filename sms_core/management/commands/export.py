@@ -0,0 +1,48 @@
+"""
+A command to export devices or status events as NDJSON or CSV. Rows are read
+by a server-side cursor and written by chunks, so memory does not depend on the table size.
+"""
+
+from django.core.management import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from sms_core.utils.export_utils import (
+    EXPORT_FORMATS, device_rows, event_rows, export_chunks, encode_chunks
+)
+
+
+class Command(BaseCommand):
+    help = 'Exports devices or status events as NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('data', choices=('devices', 'events'), help='Data to export')
+        parser.add_argument('--output', choices=EXPORT_FORMATS, default='ndjson',
+                            help='The file format')
+        parser.add_argument('--file', help='A file to write, the standard output by default')
+        parser.add_argument('--gzip', action='store_true', help='Compress the file with gzip')
+        parser.add_argument('--since', type=self.time, help='Events since an ISO 8601 time')
+        parser.add_argument('--until', type=self.time, help='Events until an ISO 8601 time')
+
+    @staticmethod
+    def time(value: str) -> object:
+        time = parse_datetime(value)
+        if time is None or time.tzinfo is None:
+            raise ValueError(value)
+        return time
+
+    def handle(self, *args, **options):
+        if options['data'] == 'devices':
+            fields, rows = device_rows()
+        else:
+            fields, rows = event_rows(options['since'], options['until'])
+        chunks = export_chunks(fields, rows, options['output'])
+
+        if options['file']:
+            with open(options['file'], 'wb') as file:
+                for chunk in encode_chunks(chunks, options['gzip']):
+                    file.write(chunk)
+        elif options['gzip']:
+            raise CommandError('A gzip export is written to a file, use --file')
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,69 @@
+"""
+A command to import devices from CSV, NDJSON, JSON or YAML files (YAML needs PyYAML).
+Rows are read as a stream and written by chunks: new devices are created, devices
+with known names are updated. First checks of new devices are spread over a window.
+"""
+
+import csv
+import os
+import sys
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from sms_core.models import SmsUser
+from sms_core.tasks import spread_device_checks
+from sms_core.utils.import_utils import READERS, DeviceImport
+
+
+EXTENSIONS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson', '.json': 'json',
+              '.yaml': 'yaml', '.yml': 'yaml'}
+
+
+class Command(BaseCommand):
+    help = 'Imports devices from a CSV, NDJSON, JSON or YAML file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='A file to read, "-" for the standard input')
+        parser.add_argument('--format', choices=tuple(READERS),
+                            help='The file format, by the extension of the file by default')
+        parser.add_argument('--user', help='The name of the user who updates devices, '
+                                           'the first superuser by default')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows per transaction')
+        parser.add_argument('--spread', type=int, default=settings.SCHEDULER_RAMP_WINDOW,
+                            help='Seconds first checks of new devices are spread over')
+        parser.add_argument('--no-check', action='store_true',
+                            help='New devices are checked by the monitoring loop only')
+        parser.add_argument('--dry-run', action='store_true', help='Validate rows only')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or EXTENSIONS.get(os.path.splitext(options['file'])[1])
+        if file_format is None:
+            raise CommandError('The file format is unknown, use --format')
+        users = SmsUser.objects.filter(is_active=True)
+        user = users.filter(name=options['user']).first() if options['user'] else \
+            users.filter(is_superuser=True).order_by('pk').first()
+        if user is None:
+            raise CommandError('The user is not found')
+
+        device_import = DeviceImport(user, dry_run=options['dry_run'])
+        stream = sys.stdin if options['file'] == '-' else \
+            open(options['file'], newline='', encoding='utf-8')
+        try:
+            device_import.import_rows(READERS[file_format](stream), options['chunk_size'])
+        except (ValueError, csv.Error) as error:
+            raise CommandError(f'The file can not be read: {error}')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        for number, message in sorted(device_import.errors):
+            self.stderr.write(f'Row {number}: {message}')
+        if device_import.created and not options['dry_run'] and not options['no_check']:
+            spread_device_checks(device_import.created, options['spread'])
+        self.stdout.write(
+            f'{len(device_import.created)} devices created, {device_import.updated} updated'
+            f'{" (dry run)" if options["dry_run"] else ""}'
+        )
+        if device_import.errors:
+            raise CommandError(f'{len(device_import.errors)} rows are not imported')
@@ -1,8 +1,13 @@
-""" A custom manager for the custom user model """
+""" Custom managers for the custom user model, the device model and probe results """
 
 
+from django.db import models, transaction
 from django.contrib.auth.base_user import BaseUserManager
 
+from .utils.counters_utils import added_deltas, status_change_deltas, change_counters
+from .utils.metrics_utils import count_status_changes
+from .utils.stream_utils import publish_status_changes
+
 
 class SmsUserManager(BaseUserManager):
     """
@@ -37,3 +42,89 @@ class SmsUserManager(BaseUserManager):
             raise ValueError('Superuser must have is_superuser=True.')
 
         return self.create_user(name, password, **extra_fields)
+
+
+class DeviceManager(models.Manager):
+    """
+    Device model manager with batched operations for the monitoring loop.
+    """
+
+    def bulk_set_status(self, devices: list, statuses: dict) -> list:
+        """
+        Set statuses of devices by their names and write all changed devices
+        with one query that updates only status columns and one query
+        that appends their status events. Changes are published and counted
+        after the commit.
+        Returns a list of changed devices.
+        """
+        changed_devices = [
+            device for device in devices if device.apply_status(statuses[device.name])
+        ]
+        if changed_devices:
+            event_model = self.model._meta.get_field('status_events').related_model
+            with transaction.atomic(savepoint=False):
+                # Counters are changed once by the deltas of the batch
+                super().bulk_update(changed_devices, self.model.STATUS_FIELDS)
+                event_model.objects.bulk_create([
+                    event_model(
+                        device=device, time=device.last_status_changed, status=device.status
+                    ) for device in changed_devices
+                ])
+                transaction.on_commit(lambda: publish_status_changes(changed_devices))
+                deltas = status_change_deltas(changed_devices)
+                transaction.on_commit(lambda: change_counters(deltas))
+                transaction.on_commit(lambda: count_status_changes(changed_devices))
+        return changed_devices
+
+    def bulk_update(self, devices: list, fields: list, batch_size=None) -> None:
+        """ Update devices, a new version of devices is made after the commit """
+        with transaction.atomic(savepoint=False):
+            super().bulk_update(devices, fields, batch_size=batch_size)
+            transaction.on_commit(lambda: change_counters({}))
+
+    def bulk_add(self, devices: list, batch_size=None) -> list:
+        """
+        Create devices with one query. They are counted after the commit,
+        save() is not called by bulk_create.
+        Returns a list of created devices with their ids.
+        """
+        with transaction.atomic(savepoint=False):
+            devices = self.bulk_create(devices, batch_size=batch_size)
+            deltas = added_deltas(devices)
+            transaction.on_commit(lambda: change_counters(deltas))
+        return devices
+
+    def bulk_remove(self, devices: list) -> None:
+        """
+        Delete devices with their related objects by one queryset delete.
+        They are uncounted after the commit.
+        """
+        with transaction.atomic(savepoint=False):
+            self.filter(pk__in=[device.pk for device in devices]).delete()
+            deltas = added_deltas(devices, sign=-1)
+            transaction.on_commit(lambda: change_counters(deltas))
+
+
+class ProbeResultManager(models.Manager):
+    """
+    Probe results manager with time window queries.
+    """
+    time_field = 'time'
+
+    def window(self, device, start, end):
+        """
+        Results of a device from start to end ordered by time.
+        The time range lets the database skip partitions of other days.
+        """
+        return self.filter(**{
+            'device': device,
+            f'{self.time_field}__gte': start,
+            f'{self.time_field}__lt': end
+        }).order_by(self.time_field)
+
+
+class ProbeRollupManager(ProbeResultManager):
+    """
+    Probe rollups manager with time window queries.
+    """
+    time_field = 'period_start'
@@ -0,0 +1,169 @@
+""" Middleware of the application sms_core """
+
+
+import heapq
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .utils.metrics_utils import REQUEST_DURATION, RESPONSES, execute
+from .utils.redis_utils import get_redis
+
+
+logger = logging.getLogger(__name__)
+
+
+def view_label(request) -> str:
+    """ The view of a request: a class, e.g. SmsOverviewView, with the action of a viewset """
+    match = request.resolver_match
+    if match is None:
+        return 'unmatched'
+    view_class = getattr(match.func, 'cls', None) or getattr(match.func, 'view_class', None)
+    if view_class is None:
+        func = match.func
+        return f"{func.__module__}.{getattr(func, '__qualname__', type(func).__qualname__)}"
+    actions = getattr(match.func, 'actions', None)
+    if actions:
+        method = request.method.lower()
+        return f'{view_class.__name__}.{actions.get(method, method)}'
+    return view_class.__name__
+
+
+class MetricsMiddleware:
+    """
+    Durations and status codes of responses by the view, see view_label,
+    enabled by METRICS_ENABLED. Paths that match no pattern share one label,
+    so scanners do not add labels. A streaming response is measured until its headers.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started_at = time.perf_counter()
+        response = self.get_response(request)
+        view = view_label(request)
+        pipe = get_redis().pipeline(transaction=False)
+        REQUEST_DURATION.observe(
+            time.perf_counter() - started_at, pipe=pipe, view=view, method=request.method
+        )
+        RESPONSES.inc(pipe=pipe, view=view, method=request.method, status=response.status_code)
+        execute(pipe)
+        return response
+
+
+class QueryTimer:
+    """ A wrapper of database queries that counts them and keeps the slowest ones """
+
+    def __init__(self, keep: int):
+        self.keep = keep
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started_at
+            self.count += 1
+            self.duration += duration
+            if self.keep:
+                item = (duration, self.count, sql)
+                if len(self.slowest) < self.keep:
+                    heapq.heappush(self.slowest, item)
+                else:
+                    heapq.heappushpop(self.slowest, item)
+
+
+class SlowEndpoints:
+    """
+    Recent requests of the process, the window is REQUEST_TIMING_WINDOW requests.
+    Every process keeps its own window.
+    """
+
+    def __init__(self, size: int):
+        self._requests = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, view: str, duration: float, db_duration: float, queries: int) -> None:
+        with self._lock:
+            self._requests.append((view, duration, db_duration, queries))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._requests.clear()
+
+    def top(self, size: int) -> list:
+        """ Endpoints of the window by the mean duration, slowest first """
+        with self._lock:
+            requests = list(self._requests)
+        endpoints = {}
+        for view, duration, db_duration, queries in requests:
+            endpoint = endpoints.setdefault(view, {
+                'view': view, 'requests': 0, 'mean_ms': 0.0, 'max_ms': 0.0,
+                'db_mean_ms': 0.0, 'queries_mean': 0.0
+            })
+            endpoint['requests'] += 1
+            endpoint['mean_ms'] += duration * 1000
+            endpoint['max_ms'] = max(endpoint['max_ms'], duration * 1000)
+            endpoint['db_mean_ms'] += db_duration * 1000
+            endpoint['queries_mean'] += queries
+        for endpoint in endpoints.values():
+            for field in ('mean_ms', 'db_mean_ms', 'queries_mean'):
+                endpoint[field] = round(endpoint[field] / endpoint['requests'], 1)
+            endpoint['max_ms'] = round(endpoint['max_ms'], 1)
+        return sorted(endpoints.values(), key=lambda endpoint: -endpoint['mean_ms'])[:size]
+
+
+SLOW_ENDPOINTS = SlowEndpoints(settings.REQUEST_TIMING_WINDOW)
+
+
+class TimingMiddleware:
+    """
+    Wall time, database time and queries of requests by the view, enabled by
+    REQUEST_TIMING_ENABLED. They are sent as the Server-Timing header, added
+    to SLOW_ENDPOINTS, and requests over REQUEST_TIMING_SLOW_MS are logged
+    with their slowest SQL statements without parameters. Queries of
+    a streaming response after its headers are not counted.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer(settings.REQUEST_TIMING_SLOW_QUERIES)
+        started_at = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started_at
+
+        view = view_label(request)
+        response['Server-Timing'] = (
+            f'total;dur={duration * 1000:.1f}, '
+            f'db;dur={timer.duration * 1000:.1f};desc="{timer.count} queries"'
+        )
+        SLOW_ENDPOINTS.add(view, duration, timer.duration, timer.count)
+        if duration * 1000 >= settings.REQUEST_TIMING_SLOW_MS:
+            logger.warning(
+                'Slow request %s %s (%s): %.1f ms, %d queries for %.1f ms%s',
+                request.method, request.path, view, duration * 1000, timer.count,
+                timer.duration * 1000, ''.join(
+                    f'\n  {query_duration * 1000:.1f} ms: {sql}'
+                    for query_duration, _, sql in sorted(timer.slowest, reverse=True)
+                )
+            )
+        return response
@@ -0,0 +1,31 @@
+# Generated by Django 3.1.6 on 2026-10-18 12:00
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def minutes_to_seconds(apps, schema_editor):
+    Device = apps.get_model('sms_core', 'Device')
+    Device.objects.update(check_interval=F('check_interval') * 60)
+
+
+def seconds_to_minutes(apps, schema_editor):
+    Device = apps.get_model('sms_core', 'Device')
+    Device.objects.filter(check_interval__lt=300).update(check_interval=300)
+    Device.objects.update(check_interval=F('check_interval') / 60)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='device',
+            name='check_interval',
+            field=models.PositiveIntegerField(choices=[(5, '5 seconds'), (10, '10 seconds'), (15, '15 seconds'), (30, '30 seconds'), (60, '1 minute'), (300, '5 minutes'), (600, '10 minutes'), (900, '15 minutes'), (1800, '30 minutes'), (3600, '60 minutes')], default=3600, verbose_name='Check interval'),
+        ),
+        migrations.RunPython(minutes_to_seconds, seconds_to_minutes),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.1.6 on 2026-10-18 12:00
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_core', '0002_check_interval_seconds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='ping_deadline',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Seconds to wait for the first reply before the device is considered DOWN.', null=True, validators=[django.core.validators.MinValueValidator(1)], verbose_name='Ping deadline'),
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='ping_interval',
+            field=models.FloatField(blank=True, help_text='Seconds between echo requests while the device does not answer.', null=True, validators=[django.core.validators.MinValueValidator(0.2)], verbose_name='Ping interval'),
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 3.1.6 on 2026-10-18 12:00
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Probe results are partitioned by day. A partition of a primary key must
+# include the partition key, so the table is created by SQL; partitions of
+# days are created and dropped by sms_core.utils.timeseries_utils.
+CREATE_PROBE_RESULT_SQL = '''
+CREATE TABLE "sms_core_proberesult" (
+    "id" bigserial NOT NULL,
+    "time" timestamp with time zone NOT NULL,
+    "device_id" integer NOT NULL
+        REFERENCES "sms_core_device" ("id") ON DELETE CASCADE,
+    "rtt_min" double precision NULL,
+    "rtt_avg" double precision NULL,
+    "rtt_max" double precision NULL,
+    "loss" smallint NOT NULL CHECK ("loss" >= 0),
+    PRIMARY KEY ("id", "time")
+) PARTITION BY RANGE ("time");
+CREATE TABLE "sms_core_proberesult_default"
+    PARTITION OF "sms_core_proberesult" DEFAULT;
+'''
+
+DROP_PROBE_RESULT_SQL = 'DROP TABLE "sms_core_proberesult" CASCADE;'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_core', '0003_device_ping_options'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(CREATE_PROBE_RESULT_SQL, DROP_PROBE_RESULT_SQL),
+            ],
+            state_operations=[
+                migrations.CreateModel(
+                    name='ProbeResult',
+                    fields=[
+                        ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                        ('time', models.DateTimeField()),
+                        ('rtt_min', models.FloatField(null=True)),
+                        ('rtt_avg', models.FloatField(null=True)),
+                        ('rtt_max', models.FloatField(null=True)),
+                        ('loss', models.PositiveSmallIntegerField()),
+                        ('device', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='sms_core.device')),
+                    ],
+                    options={
+                        'verbose_name': 'Probe result',
+                        'verbose_name_plural': 'Probe results',
+                        'get_latest_by': 'time',
+                    },
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='proberesult',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['time'], name='sms_probe_time_brin'),
+        ),
+        migrations.AddIndex(
+            model_name='proberesult',
+            index=models.Index(fields=['device', 'time'], name='sms_probe_device_time_idx'),
+        ),
+        migrations.CreateModel(
+            name='ProbeRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateTimeField()),
+                ('samples', models.PositiveIntegerField()),
+                ('rtt_min', models.FloatField(null=True)),
+                ('rtt_avg', models.FloatField(null=True)),
+                ('rtt_max', models.FloatField(null=True)),
+                ('loss', models.FloatField()),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sms_core.device')),
+            ],
+            options={
+                'verbose_name': 'Probe rollup',
+                'verbose_name_plural': 'Probe rollups',
+                'get_latest_by': 'period_start',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='proberollup',
+            constraint=models.UniqueConstraint(fields=('device', 'period_start'), name='sms_rollup_device_period'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 3.1.6 on 2026-10-18 13:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_core', '0004_probe_results'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.SlugField(unique=True)),
+                ('event_id', models.BigIntegerField(default=0)),
+                ('time', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Rollup watermark',
+                'verbose_name_plural': 'Rollup watermarks',
+            },
+        ),
+        migrations.CreateModel(
+            name='StatusEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('time', models.DateTimeField()),
+                ('status', models.BooleanField()),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_events', to='sms_core.device')),
+            ],
+            options={
+                'verbose_name': 'Status event',
+                'verbose_name_plural': 'Status events',
+                'get_latest_by': 'id',
+            },
+        ),
+        migrations.CreateModel(
+            name='AvailabilityRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('period_start', models.DateTimeField()),
+                ('up_seconds', models.FloatField(default=0)),
+                ('seconds', models.FloatField(default=0)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sms_core.device')),
+            ],
+            options={
+                'verbose_name': 'Availability rollup',
+                'verbose_name_plural': 'Availability rollups',
+                'get_latest_by': 'period_start',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='statusevent',
+            index=models.Index(fields=['device', 'time'], name='sms_event_device_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='availabilityrollup',
+            index=models.Index(fields=['period', 'period_start'], name='sms_availability_period_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='availabilityrollup',
+            constraint=models.UniqueConstraint(fields=('device', 'period', 'period_start'), name='sms_availability_device_period'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.1.6 on 2026-10-18 13:25
+
+from django.db import migrations, models
+
+
+# Search by name runs UPPER("name"::text) LIKE UPPER('%...%'), a trigram index
+# of the same expression serves it. pg_trgm is optional: without the extension
+# or the right to create it search keeps the sequential scan.
+CREATE_NAME_TRGM_INDEX_SQL = '''
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX IF NOT EXISTS "sms_device_name_trgm_idx"
+            ON "sms_core_device" USING gin (UPPER("name"::text) gin_trgm_ops);
+    ELSE
+        RAISE NOTICE 'pg_trgm is not available, search by name is not indexed';
+    END IF;
+EXCEPTION WHEN insufficient_privilege THEN
+    RAISE NOTICE 'pg_trgm can not be created, search by name is not indexed';
+END
+$$;
+'''
+
+DROP_NAME_TRGM_INDEX_SQL = 'DROP INDEX IF EXISTS "sms_device_name_trgm_idx";'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_core', '0005_status_events'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='device',
+            index=models.Index(fields=['status', 'last_status_changed'], name='sms_device_status_changed_idx'),
+        ),
+        migrations.RunSQL(CREATE_NAME_TRGM_INDEX_SQL, DROP_NAME_TRGM_INDEX_SQL),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.6 on 2026-10-18 13:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_core', '0006_overview_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='device',
+            index=models.Index(fields=['updated_at'], name='sms_device_updated_at_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.6 on 2026-10-18 14:06
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_core', '0007_device_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='statusevent',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['time'], name='sms_event_time_brin'),
+        ),
+    ]
@@ -1,14 +1,20 @@
 """ Models for the application sms_core """
 
 
-from django.db import models
+from django.db import models, transaction
+from django.contrib.postgres.indexes import BrinIndex
+from django.core.validators import MinValueValidator
 from django.shortcuts import reverse
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
 from django.utils import timezone, dateformat
 
 
-from .managers import SmsUserManager
+from .managers import SmsUserManager, DeviceManager, ProbeResultManager, ProbeRollupManager
+from .utils.auth_utils import drop_cached_user
+from .utils.counters_utils import added_deltas, status_change_deltas, change_counters
+from .utils.metrics_utils import count_status_changes
+from .utils.stream_utils import publish_status_changes
 
 
 class SmsUser(AbstractUser):
@@ -36,11 +42,24 @@ class SmsUser(AbstractUser):
     USERNAME_FIELD = 'name'
     REQUIRED_FIELDS = []
 
+    # Names taken by URLs of user pages
+    RESERVED_NAMES = ('create', 'add', 'edit')
+
     objects = SmsUserManager()
 
     def __str__(self) -> str:
         return str(self.name)
 
+    def save(self, *args, **kwargs) -> None:
+        """
+        Cached API credentials of the user are dropped after changes are committed,
+        e.g. a new password or removal of the user
+        """
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if not adding:
+            transaction.on_commit(lambda: drop_cached_user(self.pk))
+
     def get_absolute_url(self) -> str:
         """ Get absolute URL to edit model's instance """
         return reverse('sms_core:url_user_edit', kwargs={'slug': self.name})
@@ -66,6 +85,15 @@ class Device(models.Model):
         get_latest_by = '-last_status_changed'
         verbose_name = 'Device'
         verbose_name_plural = 'Devices'
+        # Pages of the overview filtered by status and sorted by the last change.
+        # Search by name uses a trigram index if pg_trgm is available, see the migration 0006.
+        indexes = [
+            models.Index(
+                fields=['status', 'last_status_changed'], name='sms_device_status_changed_idx'
+            ),
+            # Config changes of devices since a time, see changes_utils
+            models.Index(fields=['updated_at'], name='sms_device_updated_at_idx'),
+        ]
 
     # We will use name as a slug.
     name = models.SlugField(
@@ -90,15 +118,38 @@ class Device(models.Model):
     status = models.BooleanField(default=False)
     last_status_changed = models.DateTimeField(auto_now_add=True)
 
+    # Fields written by status changes
+    STATUS_FIELDS = ('status', 'last_status_changed')
+
+    # Names taken by URLs of device pages
+    RESERVED_NAMES = ('create', 'add', 'edit')
+
+    # Intervals in seconds
     CHECK_INTERVALS = (
-        (5, '5 minutes'), (10, '10 minutes'), (15, '15 minutes'),
-        (30, '30 minutes'), (60, '60 minutes')
+        (5, '5 seconds'), (10, '10 seconds'), (15, '15 seconds'), (30, '30 seconds'),
+        (60, '1 minute'), (300, '5 minutes'), (600, '10 minutes'), (900, '15 minutes'),
+        (1800, '30 minutes'), (3600, '60 minutes')
     )
     check_interval = models.PositiveIntegerField(
         choices=CHECK_INTERVALS,
-        default=60,
+        default=3600,
         verbose_name='Check interval'
     )
+    # Probe overrides, the PROBE_PING_* settings are used if they are empty
+    ping_deadline = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(1)],
+        verbose_name='Ping deadline',
+        help_text='Seconds to wait for the first reply before the device is considered DOWN.'
+    )
+    ping_interval = models.FloatField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(0.2)],
+        verbose_name='Ping interval',
+        help_text='Seconds between echo requests while the device does not answer.'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now_add=True)
     # Audit trail
@@ -107,9 +158,31 @@ class Device(models.Model):
         on_delete=models.PROTECT
     )
 
+    objects = DeviceManager()
+
     def __str__(self) -> str:
         return str(self.name)
 
+    def save(self, *args, **kwargs) -> None:
+        """
+        Counters of devices are changed after a new device is committed,
+        other changes make a new version of devices. Status changes are counted
+        by set_status with their deltas.
+        """
+        adding = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        super().save(*args, **kwargs)
+        if adding:
+            transaction.on_commit(lambda: change_counters(added_deltas([self])))
+        elif update_fields is None or not set(update_fields) <= set(self.STATUS_FIELDS):
+            transaction.on_commit(lambda: change_counters({}))
+
+    def delete(self, *args, **kwargs) -> tuple:
+        deltas = added_deltas([self], sign=-1)
+        result = super().delete(*args, **kwargs)
+        transaction.on_commit(lambda: change_counters(deltas))
+        return result
+
     def get_absolute_url(self) -> str:
         """ Get absolute URL to show model's instance details """
         return reverse('sms_core:url_device_detail', kwargs={'slug': self.name})
@@ -122,16 +195,169 @@ class Device(models.Model):
         """ Get absolute URL to delete model's instance """
         return reverse('sms_core:url_device_dell', kwargs={'slug': self.name})
 
+    def apply_status(self, status: bool) -> bool:
+        """
+        Setting model's instance status without saving.
+        Returns True if the status has been changed.
+        """
+        if not isinstance(status, bool):
+            raise ValueError('The status must be boolean')
+        if status == self.status:
+            return False
+        self.status = status
+        self.last_status_changed = timezone.now()
+        return True
+
     def set_status(self, status: bool) -> None:
         """
         Setting model's instance status:
         True - UP, reachable
         False - DOWN, unreachable
         """
-        if isinstance(status, bool):
-            if status != self.status:
-                self.status = status
-                self.last_status_changed = timezone.now()
-                self.save()
-        else:
-            raise ValueError('The status must be boolean')
+        if self.apply_status(status):
+            with transaction.atomic(savepoint=False):
+                self.save(update_fields=self.STATUS_FIELDS)
+                StatusEvent.objects.create(
+                    device=self, time=self.last_status_changed, status=status
+                )
+                transaction.on_commit(lambda: publish_status_changes([self]))
+                transaction.on_commit(lambda: change_counters(status_change_deltas([self])))
+                transaction.on_commit(lambda: count_status_changes([self]))
+
+
+class ProbeResult(models.Model):
+    """
+    The model that describe of results of device probes.
+    The table is partitioned by day of `time`, see the migration 0004.
+    """
+
+    class Meta:
+        get_latest_by = 'time'
+        verbose_name = 'Probe result'
+        verbose_name_plural = 'Probe results'
+        indexes = [
+            BrinIndex(fields=['time'], name='sms_probe_time_brin'),
+            models.Index(fields=['device', 'time'], name='sms_probe_device_time_idx'),
+        ]
+
+    id = models.BigAutoField(primary_key=True)
+    time = models.DateTimeField()
+    # Rows are removed by the database with the device or its partition
+    device = models.ForeignKey(Device, on_delete=models.DO_NOTHING, db_constraint=False)
+    # Round-trip times in milliseconds, empty if the device does not answer
+    rtt_min = models.FloatField(null=True)
+    rtt_avg = models.FloatField(null=True)
+    rtt_max = models.FloatField(null=True)
+    # Packet loss in percent
+    loss = models.PositiveSmallIntegerField()
+
+    objects = ProbeResultManager()
+
+    def __str__(self) -> str:
+        return f'{self.device_id} at {self.time}'
+
+
+class ProbeRollup(models.Model):
+    """
+    The model that describe of probe results of a device
+    aggregated over a TIMESERIES_ROLLUP_PERIOD.
+    """
+
+    class Meta:
+        get_latest_by = 'period_start'
+        verbose_name = 'Probe rollup'
+        verbose_name_plural = 'Probe rollups'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['device', 'period_start'], name='sms_rollup_device_period'
+            ),
+        ]
+
+    device = models.ForeignKey(Device, on_delete=models.CASCADE)
+    period_start = models.DateTimeField()
+    samples = models.PositiveIntegerField()
+    rtt_min = models.FloatField(null=True)
+    rtt_avg = models.FloatField(null=True)
+    rtt_max = models.FloatField(null=True)
+    # Average packet loss in percent
+    loss = models.FloatField()
+
+    objects = ProbeRollupManager()
+
+    def __str__(self) -> str:
+        return f'{self.device_id} at {self.period_start}'
+
+
+class StatusEvent(models.Model):
+    """
+    The model that describe of status changes of devices.
+    Events are only appended, availability rollups are built from them.
+    """
+
+    class Meta:
+        get_latest_by = 'id'
+        verbose_name = 'Status event'
+        verbose_name_plural = 'Status events'
+        indexes = [
+            models.Index(fields=['device', 'time'], name='sms_event_device_time_idx'),
+            # Availability rollups read events by time, events are appended in time order
+            BrinIndex(fields=['time'], name='sms_event_time_brin'),
+        ]
+
+    id = models.BigAutoField(primary_key=True)
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='status_events')
+    time = models.DateTimeField()
+    # The new status of the device
+    status = models.BooleanField()
+
+    def __str__(self) -> str:
+        return f'{self.device_id} {"UP" if self.status else "DOWN"} at {self.time}'
+
+
+class AvailabilityRollup(models.Model):
+    """
+    The model that describe of availability of a device in an hour or a day:
+    seconds the device was UP of seconds it was monitored.
+    """
+
+    class Meta:
+        get_latest_by = 'period_start'
+        verbose_name = 'Availability rollup'
+        verbose_name_plural = 'Availability rollups'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['device', 'period', 'period_start'], name='sms_availability_device_period'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['period', 'period_start'], name='sms_availability_period_idx'),
+        ]
+
+    PERIODS = (('hour', 'Hour'), ('day', 'Day'))
+
+    device = models.ForeignKey(Device, on_delete=models.CASCADE)
+    period = models.CharField(max_length=4, choices=PERIODS)
+    period_start = models.DateTimeField()
+    up_seconds = models.FloatField(default=0)
+    seconds = models.FloatField(default=0)
+
+    def __str__(self) -> str:
+        return f'{self.device_id} {self.period} at {self.period_start}'
+
+
+class RollupWatermark(models.Model):
+    """
+    The model that describe of progress of an incremental rollup:
+    the last processed event and the time the rollup is complete until.
+    """
+
+    class Meta:
+        verbose_name = 'Rollup watermark'
+        verbose_name_plural = 'Rollup watermarks'
+
+    name = models.SlugField(max_length=50, unique=True)
+    event_id = models.BigIntegerField(default=0)
+    time = models.DateTimeField()
+
+    def __str__(self) -> str:
+        return str(self.name)
@@ -0,0 +1,103 @@
+""" Streaming endpoints of the application sms_core served by sms/asgi.py """
+
+
+import asyncio
+from importlib import import_module
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import close_old_connections
+from django.http import HttpRequest
+from django.http.cookie import parse_cookie
+
+from .utils.stream_utils import BROADCASTER
+
+
+STATUS_STREAM_PATH = '/sms/overview/events/'
+
+
+def get_scope_user(scope: dict) -> object:
+    """ The user of the session of an ASGI connection """
+    cookies = {}
+    for name, value in scope.get('headers', []):
+        if name == b'cookie':
+            cookies.update(parse_cookie(value.decode('latin1')))
+    request = HttpRequest()
+    engine = import_module(settings.SESSION_ENGINE)
+    request.session = engine.SessionStore(cookies.get(settings.SESSION_COOKIE_NAME))
+    close_old_connections()
+    try:
+        user = get_user(request)
+    finally:
+        close_old_connections()
+    return user
+
+
+async def send_response(send, status: int, body=b'') -> None:
+    """ A plain text response """
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'text/plain; charset=utf-8')]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def wait_disconnect(receive) -> None:
+    """ Waiting until the client goes away """
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+def status_event(data) -> bytes:
+    """ A server-sent event of a message about status changes """
+    if data is None:
+        return b'event: reload\ndata: \n\n'
+    return f'event: status\ndata: {data}\n\n'.encode()
+
+
+async def status_stream(scope: dict, receive, send) -> None:
+    """
+    Server-sent events with status changes of devices for the overview page.
+    A comment is sent when nothing happens for STATUS_STREAM_KEEPALIVE seconds,
+    so proxies keep the connection open.
+    """
+    if scope['method'] != 'GET':
+        await send_response(send, 405)
+        return
+    user = await sync_to_async(get_scope_user, thread_sensitive=True)(scope)
+    if not user.is_authenticated:
+        await send_response(send, 403)
+        return
+
+    loop = asyncio.get_running_loop()
+    queue = BROADCASTER.subscribe(loop)
+    disconnect = asyncio.ensure_future(wait_disconnect(receive))
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ]
+        })
+        await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+        while not disconnect.done():
+            message = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait(
+                {message, disconnect}, timeout=settings.STATUS_STREAM_KEEPALIVE,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if message in done:
+                body = status_event(message.result())
+            else:
+                message.cancel()
+                body = b': keepalive\n\n'
+            if not disconnect.done():
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+    finally:
+        BROADCASTER.unsubscribe(loop, queue)
+        disconnect.cancel()
@@ -1,77 +1,225 @@
 """ Celery tasks """
 
 
-from celery.signals import worker_ready
-from sms.celery import celery_app
-
-from .utils.devices_utils import check_device_status
+import logging
+import math
+import time
+
+from celery import chord
+from celery.exceptions import SoftTimeLimitExceeded
+from celery.concurrency import get_implementation
+from celery.concurrency.prefork import TaskPool as PreforkPool
+from celery.signals import worker_init, worker_ready
+from django.conf import settings
+from sms.celery import celery_app, CELERY_LOOP_TIME
+
+from .utils.availability_utils import rollup_availability
+from .utils.counters_utils import reconcile_counters
+from .utils.devices_utils import check_devices
+from .utils.metrics_utils import CHECK_LAG, LOOP_DURATION, OVERDUE_DEVICES, observe_run
+from .utils.runs_utils import (
+    split_batches, batch_stats, batch_error_stats, aggregate_run_stats, save_run_stats
+)
+from .utils import scheduler_utils
+from .utils.scheduler_utils import get_scheduler, save_snapshot, load_snapshot
+from .utils.timeseries_utils import maintain_timeseries
 from .models import Device
 
 
-DEVICES = {}
+logger = logging.getLogger(__name__)
+
+
+@worker_init.connect
+def task_worker_processes(sender=None, **kwargs) -> None:
+    """
+    Keeping the number of processes of the worker: the 'memory' schedule
+    is refused by a prefork worker of many processes, see get_scheduler.
+    """
+    if issubclass(get_implementation(sender.pool_cls), PreforkPool):
+        scheduler_utils.WORKER_PROCESSES = sender.concurrency
+    if settings.SCHEDULER_BACKEND != 'redis' and scheduler_utils.WORKER_PROCESSES > 1:
+        logger.error('The memory scheduler needs a worker of one process, devices are not '
+                     'checked: run the worker with --concurrency=1 or set SCHEDULER_BACKEND=redis')
+
+
+@worker_init.connect
+def task_worker_name(sender=None, **kwargs) -> None:
+    """ Keeping the node name of the worker, its schedule snapshot is kept by the name """
+    scheduler_utils.WORKER_NAME = sender.hostname
 
 
 @worker_ready.connect
 def task_initial_device_check(**kwargs) -> None:
-    """ Checking all devices after the Celery initiation """
-    devices_for_checking = []
-    devices = Device.objects.all()
-    if devices:
-        for device in devices:
-            devices_for_checking.append(device.name)
-        check_device_status(devices_for_checking)
-    del devices_for_checking
-    del devices
+    """
+    Spreading checks of devices overdue after the Celery initiation over
+    SCHEDULER_RAMP_WINDOW instead of checking all devices at once.
+    The 'memory' schedule is restored by the first run of the loop, see warm_start.
+    """
+    if settings.SCHEDULER_BACKEND == 'redis':
+        get_scheduler().ramp(time.time(), settings.SCHEDULER_RAMP_WINDOW, grace=CELERY_LOOP_TIME)
+
+
+@celery_app.task(time_limit=200, soft_time_limit=180, ignore_result=False)
+def task_device_check_batch(devices_list: list) -> dict:
+    """ Checking a batch of devices of a run. Returns statistics of the batch """
+    try:
+        return batch_stats(check_devices(devices_list))
+    except SoftTimeLimitExceeded:
+        logger.error('A batch of %d devices has not been checked in time', len(devices_list))
+        return batch_error_stats(devices_list)
+
+
+@celery_app.task(time_limit=20)
+def task_check_run_stats(results: list, run: str, started_at: float, budget=None) -> dict:
+    """ Aggregating statistics of batches of a check run, the callback of the run chord """
+    stats = aggregate_run_stats(results, started_at, time.time(), budget)
+    log = logger.warning if stats['overrun'] or stats['errors'] else logger.info
+    log('Check run "%s": %d devices in %d batches for %.1f s, %d down, %d errors, '
+        'overrun %.1f s', run, stats['checked'], stats['batches'], stats['duration'],
+        stats['down'], stats['errors'], stats['overrun'])
+    save_run_stats(run, stats)
+    observe_run(run, stats)
+    return stats
+
+
+def dispatch_device_checks(devices_list: list, run: str, budget=None) -> object:
+    """
+    Checking devices by batches of SCHEDULER_BATCH_SIZE spread over workers:
+    a chord of batch tasks with the callback that aggregates statistics of the run.
+    """
+    batches = split_batches(devices_list, settings.SCHEDULER_BATCH_SIZE)
+    if not batches:
+        return None
+    return chord(task_device_check_batch.s(batch) for batch in batches)(
+        task_check_run_stats.s(run, time.time(), budget)
+    )
+
+
+def spread_device_checks(devices_list: list, window: float) -> int:
+    """
+    Checking devices by batches of SCHEDULER_BATCH_SIZE spread evenly over
+    the window, e.g. first checks of imported devices. Returns the number of batches.
+    """
+    batches = split_batches(devices_list, settings.SCHEDULER_BATCH_SIZE)
+    for i, batch in enumerate(batches):
+        task_device_check_batch.apply_async((batch,), countdown=window * i / len(batches))
+    return len(batches)
 
 
 @celery_app.task(time_limit=20, default_retry_delay=5, max_retries=2)
 def task_device_check_after_update(device_name: str) -> None:
     """ Checking the device after update properties """
     new_device = Device.objects.filter(name__iexact=device_name)[0]
-    check_device_status([new_device.name], workers_limit=1)
+    check_devices([new_device.name], workers_limit=1)
     del new_device
 
 
+def check_due_devices(scheduler: object, horizon: float) -> dict:
+    """
+    Claiming batches of devices due by the horizon and checking them.
+    Returns statistics of checked batches.
+    """
+    stats = batch_stats({})
+    while True:
+        now = time.time()
+        token, due_devices = scheduler.claim(
+            now,
+            tolerance=max(horizon - now, 0),
+            limit=settings.SCHEDULER_BATCH_SIZE
+        )
+        if not due_devices:
+            return stats
+        CHECK_LAG.observe_many([device.lateness for device in due_devices])
+        try:
+            results = batch_stats(check_devices([device.name for device in due_devices]))
+        except SoftTimeLimitExceeded:
+            # Devices of the batch return to the schedule when the lease expires
+            stats['errors'] += len(due_devices)
+            return stats
+        for field in results:
+            stats[field] += results[field]
+        scheduler.complete(token, due_devices, time.time())
+
+
+@celery_app.task(time_limit=200, soft_time_limit=180, max_retries=1, ignore_result=False)
+def task_device_check_due(horizon: float) -> dict:
+    """ Checking devices of the shared schedule that are due by the horizon """
+    return check_due_devices(get_scheduler(), horizon)
+
+
+def warm_start(scheduler: object, now: float, loop_time: float) -> None:
+    """
+    Restoring the schedule of the process memory from the last snapshot.
+    Devices that became overdue meanwhile, and all devices if there is
+    no snapshot, are spread over SCHEDULER_RAMP_WINDOW.
+    """
+    devices = load_snapshot()
+    if devices:
+        scheduler.restore(devices)
+    scheduler.reconcile(
+        Device.objects.values_list('id', 'name', 'check_interval').iterator(),
+        now
+    )
+    # Devices are genuinely overdue if they should have been checked by a past
+    # loop run. Without a snapshot statuses of all devices are unknown.
+    grace = loop_time if devices else -math.inf
+    moved = scheduler.ramp(now, settings.SCHEDULER_RAMP_WINDOW, grace=grace)
+    logger.info('The schedule of %d devices is restored, %d overdue devices are spread '
+                'over %d s', len(scheduler), moved, settings.SCHEDULER_RAMP_WINDOW)
+
+
 @celery_app.task(time_limit=200, max_retries=1)
-def task_device_check_loop(global_device_dict=DEVICES, loop_time=5) -> None:
-    """ Devices monitoring loop """
-    devices_for_checking = []
-    devices_for_removing = []
-
-    # Checking the database to find new devices
-    devices_query_set = Device.objects.all()
-
-    # Devices that are not exists in the database we select for removing
-    if global_device_dict:
-        for device in global_device_dict.keys():
-            if device not in [d.name for d in devices_query_set]:
-                devices_for_removing.append(device)
-        if devices_for_removing:
-            for device in devices_for_removing:
-                global_device_dict.pop(device)
-
-    if devices_query_set:
-
-        # Decreasing countdown timer for devices that were found or already
-        # existed
-        for device in devices_query_set:
-            if device.name not in global_device_dict.keys():
-                global_device_dict[device.name] = device.check_interval - loop_time
-            else:
-                if device.check_interval < global_device_dict[device.name]:
-                    global_device_dict[device.name] = device.check_interval - loop_time
-                global_device_dict[device.name] -= loop_time
-
-        # Devices whose timer has expired, we select for checking
-        if global_device_dict:
-            for device_name, countdown_timer in global_device_dict.items():
-                if countdown_timer <= 0:
-                    devices_for_checking.append(device_name)
-        if devices_for_checking:
-            for device in devices_for_checking:
-                global_device_dict.pop(device)
-            check_device_status(devices_for_checking)
-
-    del devices_for_checking
-    del devices_for_removing
-    del devices_query_set
+def task_device_check_loop(scheduler=None, loop_time=CELERY_LOOP_TIME) -> None:
+    """ Devices monitoring loop, runs every `loop_time` seconds """
+    if scheduler is None:
+        scheduler = get_scheduler()
+    started_at = time.perf_counter()
+    now = time.time()
+
+    if scheduler.reconciled_at is None and settings.SCHEDULER_BACKEND != 'redis':
+        warm_start(scheduler, now, loop_time)
+
+    # Syncing the schedule with the database: new devices are added,
+    # changed intervals are applied, removed devices are dropped.
+    if scheduler.reconciled_at is None or \
+            now - scheduler.reconciled_at >= settings.SCHEDULER_RECONCILE_INTERVAL:
+        scheduler.reconcile(
+            Device.objects.values_list('id', 'name', 'check_interval').iterator(),
+            now
+        )
+    OVERDUE_DEVICES.set(scheduler.count_overdue(now, grace=loop_time))
+
+    # A device due before the next loop run is checked by this one.
+    horizon = now + loop_time / 2
+    if settings.SCHEDULER_BACKEND == 'redis':
+        # Workers of any node claim batches of the shared schedule
+        chord(
+            task_device_check_due.s(horizon) for _ in range(settings.SCHEDULER_CLAIM_TASKS)
+        )(task_check_run_stats.s('loop', now, loop_time))
+    else:
+        # The schedule is kept by this worker, batches are spread over workers
+        _, due_devices = scheduler.claim(now, tolerance=horizon - now)
+        CHECK_LAG.observe_many([device.lateness for device in due_devices])
+        dispatch_device_checks([device.name for device in due_devices], 'loop', loop_time)
+        if scheduler.snapshot_at is None or \
+                now - scheduler.snapshot_at >= settings.SCHEDULER_SNAPSHOT_INTERVAL:
+            save_snapshot(scheduler, now)
+    LOOP_DURATION.observe(time.perf_counter() - started_at)
+
+
+@celery_app.task(time_limit=600, max_retries=1)
+def task_timeseries_maintenance() -> None:
+    """ Creating and dropping partitions of probe results and rolling them up """
+    maintain_timeseries()
+
+
+@celery_app.task(time_limit=600, max_retries=1)
+def task_availability_rollup() -> None:
+    """ Adding new status events to hourly and daily availability of devices """
+    rollup_availability()
+
+
+@celery_app.task(time_limit=60, max_retries=1)
+def task_counters_reconcile() -> None:
+    """ Fixing counters of devices missed by bulk changes or lost Redis writes """
+    reconcile_counters()
@@ -0,0 +1,104 @@
+""" Tests for availability rollups of status events. """
+
+import datetime
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from sms_core.models import SmsUser, Device, StatusEvent, AvailabilityRollup, RollupWatermark
+from sms_core.utils.availability_utils import rollup_availability, get_availability
+
+
+START = datetime.datetime(2021, 3, 10, 23, 0, tzinfo=datetime.timezone.utc)
+
+
+def at(minutes: int) -> datetime.datetime:
+    """ The time some minutes after START """
+    return START + datetime.timedelta(minutes=minutes)
+
+
+@override_settings(AVAILABILITY_HOURLY_RETENTION_DAYS=1, AVAILABILITY_ROLLUP_LAG=0)
+class AvailabilityRollupTests(TestCase):
+    """ Tests for the incremental availability rollups """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        user = SmsUser.objects.create_user(name='user', password='user')
+        cls.device1 = Device.objects.create(name='device1', ip_fqdn='1.1.1.1', updated_by=user)
+        cls.device2 = Device.objects.create(name='device2', ip_fqdn='2.2.2.2', updated_by=user)
+        Device.objects.update(created_at=START - datetime.timedelta(days=1))
+        RollupWatermark.objects.create(name='availability', time=START)
+
+    def set_status(self, device: object, status: bool, minutes: int) -> None:
+        """ Setting the status of a device some minutes after START """
+        with mock.patch('sms_core.models.timezone.now', return_value=at(minutes)):
+            device.set_status(status)
+
+    def rollup(self, device: object, period: str, period_start: datetime.datetime) -> tuple:
+        """ (up seconds, seconds) of a rollup """
+        return AvailabilityRollup.objects.values_list('up_seconds', 'seconds').get(
+            device=device, period=period, period_start=period_start
+        )
+
+    def test_rollup_availability(self) -> None:
+        # device1 is UP from 23:15 to 23:45 and from 00:30, device2 is DOWN
+        self.set_status(self.device1, True, 15)
+        self.set_status(self.device1, False, 45)
+        self.assertEqual(rollup_availability(now=at(50)), 2)
+        self.assertEqual(self.rollup(self.device1, 'hour', START), (1800, 3000))
+        self.assertEqual(self.rollup(self.device2, 'hour', START), (0, 3000))
+
+        # Only new events are read, the time after the watermark is added
+        self.set_status(self.device1, True, 90)
+        with self.assertNumQueries(8):
+            self.assertEqual(rollup_availability(now=at(120)), 1)
+        self.assertEqual(self.rollup(self.device1, 'hour', START), (1800, 3600))
+        self.assertEqual(self.rollup(self.device1, 'hour', at(60)), (1800, 3600))
+        # The hours are in different days
+        self.assertEqual(self.rollup(self.device1, 'day', START.replace(hour=0)), (1800, 3600))
+        self.assertEqual(self.rollup(self.device1, 'day', at(60)), (1800, 3600))
+
+        # Without events the devices keep their statuses
+        self.assertEqual(rollup_availability(now=at(180)), 0)
+        self.assertEqual(self.rollup(self.device1, 'hour', at(120)), (3600, 3600))
+        self.assertEqual(self.rollup(self.device2, 'day', at(60)), (0, 7200))
+
+        # A run without new time changes nothing
+        self.assertEqual(rollup_availability(now=at(180)), 0)
+        self.assertEqual(self.rollup(self.device1, 'day', at(60)), (5400, 7200))
+
+        availability = get_availability(days=2, now=at(180))
+        self.assertAlmostEqual(availability[self.device1.pk], 100 * 7200 / 10800)
+        self.assertEqual(availability[self.device2.pk], 0)
+        self.assertEqual(get_availability(days=1, devices=[self.device1], now=at(180)),
+                         {self.device1.pk: 75})
+
+    @override_settings(AVAILABILITY_ROLLUP_LAG=5 * 60)
+    def test_events_committed_out_of_order(self) -> None:
+        # device1 is UP from 23:40, the run at 23:46 rolls up the time until 23:41
+        StatusEvent.objects.create(pk=1000, device=self.device1, time=at(40), status=True)
+        Device.objects.filter(pk=self.device1.pk).update(status=True)
+        self.assertEqual(rollup_availability(now=at(46)), 1)
+        self.assertEqual(self.rollup(self.device1, 'hour', START), (60, 41 * 60))
+        # An event with a lower id of a batch started earlier is committed after the run
+        StatusEvent.objects.create(pk=500, device=self.device2, time=at(43), status=True)
+        Device.objects.filter(pk=self.device2.pk).update(status=True)
+        self.assertEqual(rollup_availability(now=at(65)), 1)
+        self.assertEqual(self.rollup(self.device2, 'hour', START), (17 * 60, 3600))
+        self.assertEqual(self.rollup(self.device1, 'hour', START), (20 * 60, 3600))
+        self.assertEqual(RollupWatermark.objects.get().time, at(60))
+
+    def test_rollup_retention(self) -> None:
+        rollup_availability(now=at(60))
+        rollup_availability(now=at(60 * 25))
+        # Hourly rollups older than the retention days are removed, daily ones are kept
+        self.assertFalse(AvailabilityRollup.objects.filter(period='hour', period_start=START))
+        self.assertTrue(AvailabilityRollup.objects.filter(period='day', period_start=at(60)))
+
+    def test_status_events_of_batches(self) -> None:
+        Device.objects.bulk_set_status(
+            list(Device.objects.all()), {'device1': True, 'device2': False}
+        )
+        self.assertEqual(
+            list(StatusEvent.objects.values_list('device__name', 'status')), [('device1', True)]
+        )
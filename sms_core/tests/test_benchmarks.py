@@ -0,0 +1,58 @@
+""" Tests for the harness of probe benchmarks. """
+
+from django.test import TestCase
+
+from benchmarks.harness import TargetProfile, FakeTargets, fleet_addresses, percentile
+from benchmarks.probes import bench_probes
+from benchmarks.scheduler import fleet_devices, bench_paths
+from sms_core.models import SmsUser, Device
+
+
+class ProbeBenchmarkTests(TestCase):
+    """ Tests for engines probing fake targets """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.profile = TargetProfile(latency=1, jitter=0.5, loss=0.25, seed=1)
+        user = SmsUser.objects.create_user(name='user', password='user')
+        for i, address in enumerate(fleet_addresses(20, cls.profile)):
+            Device.objects.create(name=f'device{i}', ip_fqdn=address, ping_deadline=1,
+                                  updated_by=user)
+
+    def test_fleet_addresses(self) -> None:
+        self.assertEqual(len(set(fleet_addresses(1000, self.profile))), 1000)
+        addresses = fleet_addresses(100, self.profile, loopback=True)
+        self.assertTrue(all(address.startswith(('127.', '192.0.2.')) for address in addresses))
+        self.assertEqual(percentile([3, 1, 2], 0.5), 2)
+
+    def test_engines_on_fake_targets(self) -> None:
+        targets = FakeTargets(self.profile)
+        up = sum(map(targets.answers, fleet_addresses(20, self.profile)))
+        self.assertTrue(0 < up < 20)
+        results = bench_probes([f'device{i}' for i in range(20)], ['subprocess', 'icmp'],
+                               self.profile, workers=20)
+        for result in results:
+            # Both engines see the same answers of the targets
+            self.assertEqual(result['up'], up)
+            self.assertEqual(result['devices'], 20)
+            self.assertLessEqual(result['p50'], result['p99'])
+        self.assertEqual(
+            Device.objects.filter(status=True).count(), up
+        )
+
+
+class SchedulerBenchmarkTests(TestCase):
+    """ Tests for paths of the check loop and pages on a fleet """
+
+    def test_bench_paths(self) -> None:
+        user = SmsUser.objects.create_user(name='user', password='user')
+        Device.objects.bulk_create(fleet_devices(user, 50))
+        self.assertGreater(Device.objects.values('check_interval').distinct().count(), 1)
+        paths = bench_paths(user, repeat=2, batch_size=10, page_size=20)
+        self.assertEqual(set(paths), {
+            'loop_reconcile_cold', 'loop_reconcile_warm', 'loop_claim', 'check_db_phase',
+            'overview', 'api_list'
+        })
+        self.assertEqual(paths['loop_reconcile_cold']['queries'], 1)
+        self.assertEqual(paths['loop_claim']['queries'], 0)
+        self.assertTrue(all(path['best'] <= path['mean'] for path in paths.values()))
@@ -0,0 +1,127 @@
+""" Tests for the cache of device cards of the overview page. """
+
+import unittest
+from unittest import mock
+
+import redis
+from django.test import TestCase, override_settings
+from django.urls import NoReverseMatch
+
+from sms_core.models import SmsUser, Device
+from sms_core.utils.cards_utils import (
+    CARD_KEY, card_rows, device_urls, get_device_cards, get_search_summary
+)
+from sms_core.utils.redis_utils import get_redis, redis_available
+
+
+@unittest.skipUnless(redis_available(), 'Redis server is not available')
+class DeviceCardsTests(TestCase):
+    """ Tests for get_device_cards """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        user = SmsUser.objects.create_user(name='user', password='user')
+        Device.objects.create(name='device1', ip_fqdn='1.1.1.1', updated_by=user)
+        Device.objects.create(name='device2', ip_fqdn='2.2.2.2', updated_by=user)
+
+    def setUp(self) -> None:
+        self.addCleanup(self.delete_cards)
+
+    @staticmethod
+    def delete_cards() -> None:
+        for device_id in Device.objects.values_list('pk', flat=True):
+            for key in get_redis().scan_iter(f'{CARD_KEY}:*:{device_id}:*'):
+                get_redis().delete(key)
+
+    def get_cards(self, is_staff=False) -> list:
+        return get_device_cards(card_rows(Device.objects.order_by('name')), is_staff)
+
+    @mock.patch('sms_core.utils.cards_utils.render_cards',
+                side_effect=lambda rows, is_staff: [str(row) for row in rows])
+    def test_cards_are_cached(self, render_mock) -> None:
+        cards = self.get_cards()
+        self.assertEqual([str(card) for card in cards], ['device1', 'device2'])
+        # Missing cards are rendered together
+        self.assertEqual(render_mock.call_count, 1)
+        # Cached cards are not rendered again
+        self.assertEqual(self.get_cards(), cards)
+        self.assertEqual(render_mock.call_count, 1)
+
+        # Only the card of a changed device is rendered
+        Device.objects.get(name='device2').set_status(True)
+        with self.assertNumQueries(1):
+            cards = self.get_cards()
+        self.assertEqual(render_mock.call_count, 2)
+        self.assertEqual([row[1] for row in render_mock.call_args[0][0]], ['device2'])
+        self.assertTrue(cards[1].status)
+
+    def test_cards_of_staff(self) -> None:
+        self.assertNotIn('/sms/device/edit/', self.get_cards()[0].html)
+        self.assertIn('href="/sms/device/edit/device1/"', self.get_cards(is_staff=True)[0].html)
+
+    def test_device_urls(self) -> None:
+        # URLs are the ones of reverse() for any name
+        devices = [Device(name=name) for name in ('device1', 'a b%c?#ü', 'device-name')]
+        self.assertEqual(
+            device_urls('sms_core:url_device_detail', [device.name for device in devices]),
+            [device.get_absolute_url() for device in devices]
+        )
+        with self.assertRaises(NoReverseMatch):
+            device_urls('sms_core:url_device_detail', ['a/b'])
+
+    @mock.patch('sms_core.utils.cards_utils.get_cached_cards', side_effect=redis.RedisError)
+    def test_cards_without_redis(self, get_cached_cards_mock) -> None:
+        cards = self.get_cards()
+        self.assertIn('device1 -- In status', cards[0].html)
+        self.assertFalse(list(get_redis().scan_iter(f'{CARD_KEY}:*:{cards[0].pk}:*')))
+
+    @override_settings(OVERVIEW_CARD_CACHE_TIMEOUT=0)
+    @mock.patch('sms_core.utils.cards_utils.get_cached_cards')
+    def test_cache_disabled(self, get_cached_cards_mock) -> None:
+        self.assertEqual(len(self.get_cards()), 2)
+        get_cached_cards_mock.assert_not_called()
+
+
+@unittest.skipUnless(redis_available(), 'Redis server is not available')
+@mock.patch('django.db.transaction.on_commit', side_effect=lambda func: func())
+@mock.patch('sms_core.utils.counters_utils.COUNTERS_KEY', 'sms:test:counters')
+@mock.patch('sms_core.utils.cards_utils.CARD_KEY', 'sms:test:cards')
+class SearchSummaryTests(TestCase):
+    """ Tests for get_search_summary """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        user = SmsUser.objects.create_user(name='user', password='user')
+        Device.objects.create(name='device1', ip_fqdn='1.1.1.1', updated_by=user)
+        Device.objects.create(name='device2', ip_fqdn='2.2.2.2', updated_by=user)
+
+    def setUp(self) -> None:
+        self.addCleanup(self.delete_summaries)
+
+    @staticmethod
+    def delete_summaries() -> None:
+        keys = list(get_redis().scan_iter('sms:test:cards:summary:*')) + ['sms:test:counters']
+        get_redis().delete(*keys)
+
+    def get_summary(self, search='device') -> dict:
+        return get_search_summary(Device.objects.filter(name__icontains=search), search)
+
+    def test_summary_is_cached(self, *mocks) -> None:
+        self.assertEqual(self.get_summary(), {'total': 2, 'up': 0})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_summary(), {'total': 2, 'up': 0})
+        # Any change of devices counts summaries again
+        Device.objects.get(name='device1').set_status(True)
+        self.assertEqual(self.get_summary(), {'total': 2, 'up': 1})
+        device = Device.objects.get(name='device2')
+        device.name = 'other'
+        device.save()
+        self.assertEqual(self.get_summary(), {'total': 1, 'up': 1})
+        Device.objects.bulk_update([Device(pk=device.pk, name='device3')], ['name'])
+        self.assertEqual(self.get_summary(), {'total': 2, 'up': 1})
+
+    @override_settings(OVERVIEW_CARD_CACHE_TIMEOUT=0)
+    def test_cache_disabled(self, *mocks) -> None:
+        self.assertEqual(self.get_summary(), {'total': 2, 'up': 0})
+        with self.assertNumQueries(1):
+            self.get_summary()
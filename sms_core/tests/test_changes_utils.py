@@ -0,0 +1,63 @@
+""" Tests for changes of devices since a cursor. """
+
+import datetime
+
+from django.test import TestCase
+from django.utils import timezone
+
+from sms_core.models import SmsUser, Device, StatusEvent
+from sms_core.utils.changes_utils import changes_cursor, current_changes_cursor, get_changes
+
+
+class ChangesTests(TestCase):
+    """ Tests for devices changed since a cursor """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        user = SmsUser.objects.create_user(name='user', password='user')
+        Device.objects.create(name='device1', ip_fqdn='1.1.1.1', updated_by=user)
+        Device.objects.create(name='device2', ip_fqdn='2.2.2.2', updated_by=user)
+
+    def names(self, cursor: str, now=None) -> tuple:
+        devices, cursor = get_changes(cursor, now)
+        return [device.name for device in devices], cursor
+
+    def test_no_changes(self) -> None:
+        later = timezone.now() + datetime.timedelta(minutes=1)
+        names, _ = self.names(current_changes_cursor(later), later)
+        self.assertEqual(names, [])
+
+    def test_status_and_config_changes(self) -> None:
+        later = timezone.now() + datetime.timedelta(minutes=1)
+        cursor = current_changes_cursor(later)
+        Device.objects.get(name='device2').apply_status(True)
+        StatusEvent.objects.create(device=Device.objects.get(name='device2'),
+                                   time=timezone.now(), status=True)
+        names, cursor = self.names(cursor, later + datetime.timedelta(minutes=1))
+        self.assertEqual(names, ['device2'])
+        # The settled event is not read again
+        much_later = later + datetime.timedelta(minutes=2)
+        names, cursor = self.names(cursor, much_later)
+        self.assertEqual(names, [])
+
+        # Config changes are found by the time of update
+        device = Device.objects.get(name='device1')
+        device.description = 'New'
+        device.save()
+        names, _ = self.names(changes_cursor(0, timezone.now() - datetime.timedelta(minutes=1)))
+        self.assertEqual(names, ['device1', 'device2'])
+
+    def test_unsettled_changes_are_read_again(self) -> None:
+        event = StatusEvent.objects.create(device=Device.objects.get(name='device1'),
+                                           time=timezone.now(), status=True)
+        cursor = changes_cursor(event.pk - 1, timezone.now() + datetime.timedelta(minutes=1))
+        names, next_cursor = self.names(cursor)
+        self.assertEqual(names, ['device1'])
+        names, _ = self.names(next_cursor)
+        self.assertEqual(names, ['device1'])
+
+    def test_broken_cursor(self) -> None:
+        naive = datetime.datetime(2021, 3, 10)
+        for broken in ('broken', changes_cursor('1', timezone.now()), changes_cursor(1, naive)):
+            with self.assertRaises(ValueError):
+                get_changes(broken)
@@ -0,0 +1,73 @@
+""" Tests for counters of devices by status. """
+
+import unittest
+from unittest import mock
+
+import redis
+from django.test import TestCase
+
+from sms_core.models import SmsUser, Device
+from sms_core.tasks import task_counters_reconcile
+from sms_core.utils.counters_utils import get_counters, change_counters
+from sms_core.utils.redis_utils import get_redis, redis_available
+
+
+TEST_COUNTERS_KEY = 'sms:test:counters'
+
+
+@unittest.skipUnless(redis_available(), 'Redis server is not available')
+@mock.patch('sms_core.utils.counters_utils.COUNTERS_KEY', TEST_COUNTERS_KEY)
+class CountersTests(TestCase):
+    """ Tests for counters kept by changes of devices """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.user = SmsUser.objects.create_user(name='user', password='user')
+        Device.objects.create(name='device1', ip_fqdn='1.1.1.1', updated_by=cls.user)
+
+    def setUp(self) -> None:
+        self.addCleanup(get_redis().delete, TEST_COUNTERS_KEY)
+        # Counters are changed by callbacks of committed transactions
+        on_commit = mock.patch('django.db.transaction.on_commit', side_effect=lambda func: func())
+        on_commit.start()
+        self.addCleanup(on_commit.stop)
+
+    def test_counters_follow_changes(self) -> None:
+        # Missing counters are created by the database
+        self.assertEqual(get_counters(), {'total': 1, 'up': 0, 'down': 1})
+        device2 = Device.objects.create(name='device2', ip_fqdn='2.2.2.2', updated_by=self.user)
+        self.assertEqual(get_counters(), {'total': 2, 'up': 0, 'down': 2})
+        device2.set_status(True)
+        self.assertEqual(get_counters(), {'total': 2, 'up': 1, 'down': 1})
+        Device.objects.bulk_set_status(
+            list(Device.objects.all()), {'device1': True, 'device2': False}
+        )
+        self.assertEqual(get_counters(), {'total': 2, 'up': 1, 'down': 1})
+        Device.objects.get(name='device1').delete()
+        self.assertEqual(get_counters(), {'total': 1, 'up': 0, 'down': 1})
+        # Counters are read without queries
+        with self.assertNumQueries(0):
+            get_counters()
+
+    @mock.patch('sms_core.managers.change_counters')
+    @mock.patch('sms_core.models.change_counters')
+    def test_one_change_per_status_change(self, models_mock, managers_mock) -> None:
+        device = Device.objects.get(name='device1')
+        device.set_status(True)
+        models_mock.assert_called_once_with({'up': 1, 'down': -1})
+        Device.objects.bulk_set_status([device], {'device1': False})
+        managers_mock.assert_called_once_with({'up': -1, 'down': 1})
+        # Other changes make a new version of devices
+        device.save()
+        models_mock.assert_called_with({})
+
+    def test_reconcile(self) -> None:
+        change_counters({'total': 5, 'up': 5, 'down': 0})
+        task_counters_reconcile()
+        self.assertEqual(get_counters(), {'total': 1, 'up': 0, 'down': 1})
+
+    def test_counters_without_redis(self) -> None:
+        unreachable = redis.Redis(port=1, decode_responses=True)
+        with mock.patch('sms_core.utils.counters_utils.get_redis', return_value=unreachable):
+            self.assertEqual(get_counters(), {'total': 1, 'up': 0, 'down': 1})
+            self.assertFalse(change_counters({'up': 1}))
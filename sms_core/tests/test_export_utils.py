@@ -0,0 +1,68 @@
+""" Tests for the export of devices and status events. """
+
+import datetime
+import gzip
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command, CommandError
+from django.test import TestCase
+
+from sms_core.models import SmsUser, Device, StatusEvent
+from sms_core.utils.export_utils import (
+    DEVICE_FIELDS, device_rows, event_rows, export_chunks, encode_chunks
+)
+
+
+class ExportTests(TestCase):
+    """ Tests for streaming export of rows """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        user = SmsUser.objects.create_user(name='user', password='user')
+        for i in range(3):
+            Device.objects.create(name=f'device{i}', ip_fqdn=f'10.0.0.{i}', updated_by=user)
+        device = Device.objects.get(name='device1')
+        for day, status in ((1, True), (2, False)):
+            StatusEvent.objects.create(
+                device=device, status=status,
+                time=datetime.datetime(2021, 3, day, tzinfo=datetime.timezone.utc)
+            )
+
+    def test_ndjson(self) -> None:
+        chunks = list(export_chunks(*device_rows(), chunk_size=2))
+        self.assertEqual(len(chunks), 2)
+        devices = [json.loads(line) for line in ''.join(chunks).splitlines()]
+        self.assertEqual([device['name'] for device in devices], ['device0', 'device1', 'device2'])
+        self.assertEqual(tuple(devices[0]), DEVICE_FIELDS)
+        self.assertIsNone(devices[0]['ping_deadline'])
+
+    def test_csv(self) -> None:
+        lines = ''.join(export_chunks(*event_rows(), output='csv')).splitlines()
+        self.assertEqual(lines[0], 'id,device,device_name,time,status')
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].endswith(',device1,2021-03-01T00:00:00Z,True'))
+
+        since = datetime.datetime(2021, 3, 2, tzinfo=datetime.timezone.utc)
+        lines = ''.join(export_chunks(*event_rows(since=since), output='csv')).splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].endswith(',False'))
+
+    def test_gzip(self) -> None:
+        data = b''.join(encode_chunks(export_chunks(*device_rows(), chunk_size=1), compress=True))
+        self.assertEqual(len(gzip.decompress(data).splitlines()), 3)
+
+    def test_command(self) -> None:
+        out = StringIO()
+        call_command('export', 'events', '--output=csv', '--since=2021-03-02T00:00:00Z', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'devices.ndjson.gz')
+            call_command('export', 'devices', '--gzip', f'--file={path}')
+            with gzip.open(path, 'rt') as file:
+                self.assertEqual(len(file.readlines()), 3)
+        with self.assertRaises(CommandError):
+            call_command('export', 'devices', '--gzip')
@@ -174,3 +174,20 @@ class DeviceFormTests(TestCase):
                      'check_interval': '10'}
         form = self.form(data=form_data)
         self.assertTrue(form.is_valid())
+
+    def test_form_ping_options(self) -> None:
+        # Ping options are optional, the interval is at least 0.2 seconds
+        form_data = {'name': 'some_device', 'ip_fqdn': '3.3.3.3',
+                     'check_interval': '10', 'ping_deadline': '5', 'ping_interval': '0.5'}
+        form = self.form(data=form_data)
+        self.assertTrue(form.is_valid())
+
+        form_data = {'name': 'some_device', 'ip_fqdn': '3.3.3.3',
+                     'check_interval': '10', 'ping_interval': '0.1'}
+        form = self.form(data=form_data)
+        self.assertFalse(form.is_valid())
+
+        form_data = {'name': 'some_device', 'ip_fqdn': '3.3.3.3',
+                     'check_interval': '10', 'ping_deadline': '0'}
+        form = self.form(data=form_data)
+        self.assertFalse(form.is_valid())
@@ -0,0 +1,89 @@
+""" Tests for the asynchronous ICMP probe engine. """
+
+import unittest
+
+from django.test import TestCase, SimpleTestCase, override_settings
+
+from sms_core.models import SmsUser, Device
+from sms_core.utils.devices_utils import check_devices
+from sms_core.utils.icmp_utils import (
+    icmp_checksum, build_echo_request, parse_echo_reply, open_icmp_socket, ping_hosts
+)
+
+
+def icmp_socket_available() -> bool:
+    """ Checking that the process is allowed to open an ICMP socket """
+    try:
+        sock, _ = open_icmp_socket()
+    except OSError:
+        return False
+    sock.close()
+    return True
+
+
+class IcmpPacketTests(SimpleTestCase):
+    """ Tests for building and parsing ICMP packets """
+
+    def test_checksum(self) -> None:
+        packet = build_echo_request(ident=0x1234, seq=1)
+        # A checksum over a packet with a valid checksum is zero
+        self.assertEqual(icmp_checksum(packet), 0)
+        # Odd length data is padded
+        self.assertEqual(icmp_checksum(b'\x01'), icmp_checksum(b'\x01\x00'))
+
+    def test_parse_echo_reply(self) -> None:
+        request = build_echo_request(ident=0x1234, seq=7)
+        # An echo request is not a reply
+        self.assertIsNone(parse_echo_reply(request))
+        reply = b'\x00' + request[1:]
+        self.assertEqual(parse_echo_reply(reply), (0x1234, 7))
+        # Raw sockets receive packets with an IPv4 header (IHL = 5 words)
+        ip_header = b'\x45' + b'\x00' * 19
+        self.assertEqual(parse_echo_reply(ip_header + reply, has_ip_header=True), (0x1234, 7))
+        self.assertIsNone(parse_echo_reply(b'\x00\x00'))
+
+
+@unittest.skipUnless(icmp_socket_available(), 'ICMP sockets are not permitted')
+@override_settings(PROBE_ENGINE='icmp', PROBE_ICMP_TIMEOUT=0.5, PROBE_ICMP_COUNT=2)
+class IcmpProbeEngineTests(TestCase):
+    """ Tests for the ICMP probe engine """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        user = SmsUser.objects.create_user(name='user', password='user')
+        Device.objects.create(
+            name='device1',
+            ip_fqdn='127.0.0.1',  # Pingable
+            check_interval=5,
+            updated_by=user
+        )
+        Device.objects.create(
+            name='device2',
+            ip_fqdn='localhost',  # Pingable
+            check_interval=5,
+            updated_by=user
+        )
+        Device.objects.create(
+            name='device3',
+            ip_fqdn='not_localhost',  # Unpingable
+            check_interval=5,
+            updated_by=user
+        )
+
+    def test_ping_hosts(self) -> None:
+        results = ping_hosts(['127.0.0.1', 'localhost', 'not_localhost', '127.0.0.1'],
+                             timeout=0.5, count=2)
+        self.assertEqual(results, {'127.0.0.1': True, 'localhost': True, 'not_localhost': False})
+
+    def test_ping_many_hosts(self) -> None:
+        # Many probes in flight over one socket
+        hosts = [f'127.0.{i // 250}.{i % 250 + 1}' for i in range(1000)]
+        results = ping_hosts(hosts, timeout=2, count=1)
+        self.assertTrue(all(results.values()))
+
+    def test_check_devices(self) -> None:
+        results = check_devices(['device1', 'device2', 'device3'])
+        self.assertEqual(results, {'device1': True, 'device2': True, 'device3': False})
+        self.assertTrue(Device.objects.get(name='device1').status)
+        self.assertTrue(Device.objects.get(name='device2').status)
+        self.assertFalse(Device.objects.get(name='device3').status)
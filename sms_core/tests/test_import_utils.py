@@ -0,0 +1,107 @@
+""" Tests for the import of devices. """
+
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.management import call_command, CommandError
+from django.test import TestCase
+
+from sms_core.models import SmsUser, Device
+from sms_core.tasks import spread_device_checks
+from sms_core.utils.import_utils import DeviceImport
+
+
+CSV_FILE = '''name,ip_fqdn,description,check_interval,ping_deadline
+device1,1.1.1.1,Updated,,
+device2,2.2.2.2,,60,2
+device3,9.9.9.9,,,
+device4,4.4.4.4,,7,
+edit,5.5.5.5,,,
+device2,6.6.6.6,,,
+'''
+
+
+@mock.patch('sms_core.managers.change_counters')
+class ImportTests(TestCase):
+    """ Tests for the import of devices by chunks """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.user = SmsUser.objects.create_superuser(name='admin', password='admin')
+        Device.objects.create(name='device1', ip_fqdn='1.1.1.1', description='Old',
+                              check_interval=15, updated_by=cls.user)
+        Device.objects.create(name='device9', ip_fqdn='9.9.9.9', updated_by=cls.user)
+
+    def import_file(self, content: str, name: str, *args) -> tuple:
+        """ Output and errors of the command importing a file """
+        out, err = StringIO(), StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, name)
+            with open(path, 'w') as file:
+                file.write(content)
+            try:
+                call_command('import_devices', path, *args, stdout=out, stderr=err)
+            except CommandError as error:
+                err.write(str(error))
+        return out.getvalue(), err.getvalue()
+
+    @mock.patch('sms_core.management.commands.import_devices.spread_device_checks')
+    def test_csv(self, spread_mock, *mocks) -> None:
+        out, err = self.import_file(CSV_FILE, 'devices.csv', '--chunk-size=2')
+        self.assertIn('1 devices created, 1 updated', out)
+        errors = err.splitlines()
+        self.assertEqual(errors[0], 'Row 3: ip_fqdn: The IP / FQDN is taken by "device9"')
+        self.assertTrue(errors[1].startswith('Row 4: check_interval'))
+        self.assertTrue(errors[2].startswith('Row 5: name'))
+        self.assertEqual(errors[3], 'Row 6: The name or the IP / FQDN is repeated in the file')
+        self.assertEqual(errors[4], '4 rows are not imported')
+
+        # Fields missing in a row are kept
+        device1 = Device.objects.get(name='device1')
+        self.assertEqual((device1.description, device1.check_interval), ('Updated', 15))
+        device2 = Device.objects.get(name='device2')
+        self.assertEqual((device2.check_interval, device2.ping_deadline), (60, 2))
+        spread_mock.assert_called_once_with(['device2'], settings.SCHEDULER_RAMP_WINDOW)
+
+    def test_ndjson_stdin(self, *mocks) -> None:
+        rows = [{'id': 10, 'name': f'device{i}', 'ip_fqdn': f'10.0.0.{i}', 'status': True}
+                for i in range(2, 5)]
+        stdin = StringIO(''.join(json.dumps(row) + '\n' for row in rows))
+        with mock.patch('sys.stdin', stdin):
+            call_command('import_devices', '-', '--format=ndjson', '--no-check', stdout=StringIO())
+        self.assertEqual(Device.objects.count(), 5)
+        self.assertFalse(Device.objects.get(name='device2').status)
+
+    def test_dry_run(self, *mocks) -> None:
+        out, err = self.import_file(
+            json.dumps({'devices': [{'name': 'device2', 'ip_fqdn': '2.2.2.2'}]}),
+            'devices.json', '--dry-run'
+        )
+        self.assertIn('1 devices created, 0 updated (dry run)', out)
+        self.assertEqual(Device.objects.count(), 2)
+        out, err = self.import_file('[1, 2]', 'devices.txt')
+        self.assertIn('The file format is unknown', err)
+        out, err = self.import_file('{"devices": 1}', 'devices.json')
+        self.assertIn('A list of devices is expected', err)
+
+    def test_queries_per_chunk(self, *mocks) -> None:
+        rows = [{'name': f'new{i}', 'ip_fqdn': f'10.0.{i // 250}.{i % 250}'}
+                for i in range(2, 502)] + [{'name': 'device1', 'ip_fqdn': '1.1.1.1'}]
+        device_import = DeviceImport(self.user)
+        # Taken names and IPs, the savepoint, the insert and the update
+        with self.assertNumQueries(6):
+            device_import.import_chunk(rows, 1)
+        self.assertEqual((len(device_import.created), device_import.updated), (500, 1))
+
+    @mock.patch('sms_core.tasks.task_device_check_batch.apply_async')
+    @mock.patch('django.conf.settings.SCHEDULER_BATCH_SIZE', 2)
+    def test_spread_device_checks(self, apply_mock, *mocks) -> None:
+        self.assertEqual(spread_device_checks(['d1', 'd2', 'd3', 'd4', 'd5'], 60), 3)
+        self.assertEqual(
+            [(call[0][0], call[1]['countdown']) for call in apply_mock.call_args_list],
+            [((['d1', 'd2'],), 0), ((['d3', 'd4'],), 20), ((['d5'],), 40)]
+        )
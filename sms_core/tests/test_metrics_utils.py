@@ -0,0 +1,118 @@
+""" Tests for metrics of probes, the check loop and views. """
+
+import unittest
+from unittest import mock
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from sms_core.middleware import MetricsMiddleware
+from sms_core.models import SmsUser, Device
+from sms_core.utils.icmp_utils import PingStats
+from sms_core.utils.metrics_utils import (
+    METRICS, Histogram, PROBES, observe_probes, metrics_registry
+)
+from sms_core.utils.redis_utils import get_redis, redis_available
+
+
+TEST_METRICS_KEY = 'sms:test:metrics'
+
+
+@unittest.skipUnless(redis_available(), 'Redis server is not available')
+@mock.patch('sms_core.utils.metrics_utils.METRICS_KEY', TEST_METRICS_KEY)
+class MetricsTests(TestCase):
+    """ Tests for metrics shared by processes through Redis """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.user = SmsUser.objects.create_user(name='user', password='user')
+        Device.objects.create(name='device1', ip_fqdn='1.1.1.1', updated_by=cls.user)
+
+    def setUp(self) -> None:
+        # Cleanups run after the patch of the key
+        test_keys = [f'{TEST_METRICS_KEY}:{metric.name}' for metric in METRICS]
+        get_redis().delete(*test_keys)
+        self.addCleanup(get_redis().delete, *test_keys)
+        self.registry = metrics_registry()
+
+    def sample(self, name: str, **labels) -> float:
+        return self.registry.get_sample_value(name, labels)
+
+    def test_probes(self) -> None:
+        stats = {
+            'device1': PingStats(1, 1, 2.0, 2.0, 2.0),
+            'device2': PingStats(1, 1, 30.0, 30.0, 30.0),
+            'device3': PingStats(1, 0, None, None, None),
+        }
+        self.assertTrue(observe_probes('icmp', stats, 1.5))
+        self.assertTrue(observe_probes('icmp', {'device1': PingStats(1, 1, 4.0, 4.0, 4.0)}, 0.5))
+        self.assertEqual(self.sample('sms_probes_total', engine='icmp', result='up'), 3)
+        self.assertEqual(self.sample('sms_probes_total', engine='icmp', result='down'), 1)
+        # Buckets are cumulative
+        self.assertEqual(self.sample('sms_probe_rtt_seconds_bucket', engine='icmp', le='0.0025'), 1)
+        self.assertEqual(self.sample('sms_probe_rtt_seconds_bucket', engine='icmp', le='0.005'), 2)
+        self.assertEqual(self.sample('sms_probe_rtt_seconds_bucket', engine='icmp', le='+Inf'), 3)
+        self.assertEqual(self.sample('sms_probe_rtt_seconds_count', engine='icmp'), 3)
+        self.assertAlmostEqual(self.sample('sms_probe_rtt_seconds_sum', engine='icmp'), 0.036)
+        self.assertEqual(self.sample('sms_check_batch_duration_seconds_sum', engine='icmp'), 2)
+        self.assertEqual(self.sample('sms_devices', status='down'), 1)
+
+    def test_histogram_bounds(self) -> None:
+        with mock.patch('sms_core.utils.metrics_utils.METRICS', []):
+            histogram = Histogram('sms_test_seconds', 'Test', ('kind',), buckets=(1, 2))
+        self.addCleanup(get_redis().delete, histogram.key)
+        # A value equal to the bound falls into its bucket
+        histogram.observe_many([1, 1.5, 3], kind='test')
+        family = histogram.family(get_redis().hgetall(histogram.key))
+        self.assertEqual(
+            [(sample.labels.get('le'), sample.value) for sample in family.samples],
+            [('1.0', 1), ('2.0', 2), ('+Inf', 3), (None, 3), (None, 5.5)]
+        )
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self) -> None:
+        self.assertFalse(PROBES.inc(engine='icmp', result='up'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+        with self.assertRaises(MiddlewareNotUsed):
+            MetricsMiddleware(lambda request: None)
+
+    @mock.patch('django.db.transaction.on_commit', side_effect=lambda func: func())
+    def test_status_changes(self, *mocks) -> None:
+        Device.objects.get(name='device1').set_status(True)
+        Device.objects.bulk_set_status(list(Device.objects.all()), {'device1': False})
+        self.assertEqual(self.sample('sms_status_changes_total', status='up'), 1)
+        self.assertEqual(self.sample('sms_status_changes_total', status='down'), 1)
+
+    def test_metrics_view(self) -> None:
+        self.client.get(reverse('sms_core:url_login'))
+        self.client.get(reverse('sms_core:url_login'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            'sms_http_responses_total{method="GET",status="200",view="SmsLogInView"} 2.0',
+            response.content.decode()
+        )
+        # Scrapers of other addresses are forbidden
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS_ALLOWED_IPS=['192.168.0.0/24'],
+                       METRICS_TRUSTED_PROXIES=['10.0.0.1'])
+    def test_metrics_proxy(self) -> None:
+        # The address of a scraper behind a trusted proxy is set by the proxy
+        response = self.client.get(
+            reverse('metrics'), REMOTE_ADDR='10.0.0.1', HTTP_X_REAL_IP='192.168.0.5'
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(
+            reverse('metrics'), REMOTE_ADDR='10.0.0.1', HTTP_X_REAL_IP='172.16.0.5'
+        )
+        self.assertEqual(response.status_code, 403)
+        # The proxy itself is not a scraper, others can not pretend to be a proxy
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(
+            reverse('metrics'), REMOTE_ADDR='10.0.0.2', HTTP_X_REAL_IP='192.168.0.5'
+        )
+        self.assertEqual(response.status_code, 403)
@@ -0,0 +1,55 @@
+""" Tests for middleware of requests. """
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from sms_core.middleware import SLOW_ENDPOINTS
+from sms_core.models import SmsUser, Device
+
+
+@override_settings(REQUEST_TIMING_ENABLED=True, REQUEST_TIMING_SLOW_MS=0,
+                   REQUEST_TIMING_SLOW_QUERIES=2)
+class TimingMiddlewareTests(TestCase):
+    """ Tests for timing of requests """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.user = SmsUser.objects.create_user(name='user', password='user', is_staff=True)
+        Device.objects.create(name='device1', ip_fqdn='1.1.1.1', updated_by=cls.user)
+
+    def setUp(self) -> None:
+        self.client.force_login(self.user)
+        SLOW_ENDPOINTS.clear()
+        self.addCleanup(SLOW_ENDPOINTS.clear)
+
+    def test_server_timing(self) -> None:
+        with self.assertLogs('sms_core.middleware', 'WARNING') as logs:
+            response = self.client.get(reverse('sms_core:url_devices_overview'))
+        self.assertRegex(
+            response['Server-Timing'], r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries"$'
+        )
+        self.assertIn('(SmsOverviewView)', logs.output[0])
+        # The slowest statements are logged
+        self.assertEqual(logs.output[0].count(' ms: '), 2)
+
+    def test_slow_endpoints(self) -> None:
+        with self.assertLogs('sms_core.middleware', 'WARNING'):
+            self.client.get('/api/v1/sms/devices')
+            self.client.get('/api/v1/sms/devices')
+            self.client.get(reverse('sms_core:url_devices_overview'))
+            response = self.client.get(reverse('slow_endpoints'))
+        endpoints = {endpoint['view']: endpoint for endpoint in response.json()['endpoints']}
+        self.assertEqual(endpoints['DeviceView.list']['requests'], 2)
+        self.assertEqual(endpoints['SmsOverviewView']['requests'], 1)
+        self.assertGreater(endpoints['DeviceView.list']['queries_mean'], 0)
+
+    def test_function_view(self) -> None:
+        with self.assertLogs('sms_core.middleware', 'WARNING') as logs:
+            self.client.get('/')
+        self.assertIn('(sms.views.redirect_sms_overview)', logs.output[0])
+
+    @override_settings(REQUEST_TIMING_ENABLED=False)
+    def test_disabled(self) -> None:
+        response = self.client.get(reverse('sms_core:url_devices_overview'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(self.client.get(reverse('slow_endpoints')).status_code, 404)
@@ -3,7 +3,7 @@
 from django.test import TestCase
 from django.utils import timezone, dateformat
 
-from sms_core.models import SmsUser, Device
+from sms_core.models import SmsUser, Device, StatusEvent
 
 
 class SmsUserModelTests(TestCase):
@@ -89,6 +89,18 @@ class DeviceModelTests(TestCase):
         )
         self.assertTrue(device.status)
 
+    def test_set_status_events(self) -> None:
+        # Every change of the status is appended to the status events
+        device = self.model.objects.get(name='test_device')
+        device.set_status(True)
+        device.set_status(True)
+        device.set_status(False)
+        self.assertEqual(
+            list(StatusEvent.objects.filter(device=device).values_list('status', flat=True)),
+            [True, False]
+        )
+        self.assertEqual(StatusEvent.objects.latest().time, device.last_status_changed)
+
     def test_set_status_invalid(self) -> None:
         # The status must be a boolean
         device = self.model.objects.get(name='test_device')
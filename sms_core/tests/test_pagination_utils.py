@@ -0,0 +1,76 @@
+""" Tests for the keyset pagination. """
+
+import datetime
+
+from django.db.models import Q
+from django.test import TestCase, SimpleTestCase
+
+from sms_core.models import SmsUser, Device
+from sms_core.utils.pagination_utils import (
+    encode_cursor, decode_cursor, keyset_filter, keyset_page
+)
+
+
+class CursorTests(SimpleTestCase):
+    """ Tests for cursors of pages """
+
+    def test_cursor(self) -> None:
+        time = datetime.datetime(2021, 3, 10, 12, 30, tzinfo=datetime.timezone.utc)
+        cursor = encode_cursor((time, 5))
+        self.assertEqual(decode_cursor(cursor, 2), ['2021-03-10T12:30:00Z', 5])
+        cursor = encode_cursor((time.replace(microsecond=123456), 5))
+        self.assertEqual(decode_cursor(cursor, 2), ['2021-03-10T12:30:00.123456Z', 5])
+        for broken in ('broken', cursor[:-2], encode_cursor((1,)), encode_cursor({'a': 1})):
+            with self.assertRaises(ValueError):
+                decode_cursor(broken, 2)
+
+    def test_keyset_filter(self) -> None:
+        self.assertEqual(keyset_filter(('name',), ['a']), Q(name__gt='a'))
+        self.assertEqual(
+            str(keyset_filter(('-time', 'id'), ['t', 1])),
+            str(Q(time__lt='t') | Q(time='t', id__gt=1))
+        )
+
+
+class KeysetPageTests(TestCase):
+    """ Tests for pages of querysets """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        user = SmsUser.objects.create_user(name='user', password='user')
+        for i in range(5):
+            Device.objects.create(name=f'device{i}', ip_fqdn=f'10.0.0.{i}', updated_by=user)
+        # Rows with equal times are ordered by id
+        Device.objects.update(
+            last_status_changed=datetime.datetime(2021, 3, 10, tzinfo=datetime.timezone.utc)
+        )
+
+    def test_keyset_page(self) -> None:
+        ordering = ('-last_status_changed', '-pk')
+        names, cursor = [], None
+        for _ in range(3):
+            rows, cursor = keyset_page(Device.objects.all(), ordering, 2, cursor)
+            names.extend(str(row) for row in rows)
+            if cursor is None:
+                break
+        self.assertEqual(names, [f'device{i}' for i in reversed(range(5))])
+        self.assertIsNone(cursor)
+
+        rows, cursor = keyset_page(Device.objects.all(), ('name',), 5)
+        self.assertEqual(len(rows), 5)
+        self.assertIsNone(cursor)
+
+    def test_sub_millisecond_times(self) -> None:
+        # Statuses changed by one batch differ by microseconds
+        time = datetime.datetime(2021, 3, 10, tzinfo=datetime.timezone.utc)
+        for i, device in enumerate(Device.objects.order_by('pk')):
+            device.last_status_changed = time + datetime.timedelta(microseconds=10 * i)
+            device.save(update_fields=['last_status_changed'])
+        ordering = ('-last_status_changed', '-pk')
+        names, cursor = [], None
+        while True:
+            rows, cursor = keyset_page(Device.objects.all(), ordering, 1, cursor)
+            names.extend(str(row) for row in rows)
+            if cursor is None:
+                break
+        self.assertEqual(names, [f'device{i}' for i in reversed(range(5))])
@@ -0,0 +1,74 @@
+""" Tests for batches of device checks and statistics of check runs. """
+
+import unittest
+from unittest import mock
+
+from celery.exceptions import SoftTimeLimitExceeded
+from django.test import SimpleTestCase, override_settings
+
+from sms.celery import celery_app
+from sms_core.tasks import dispatch_device_checks
+from sms_core.utils.redis_utils import get_redis, redis_available
+from sms_core.utils.runs_utils import (
+    split_batches, batch_stats, aggregate_run_stats, save_run_stats, get_run_stats
+)
+
+
+class RunStatsTests(SimpleTestCase):
+    """ Tests for statistics of check runs """
+
+    def test_split_batches(self) -> None:
+        self.assertEqual(split_batches([1, 2, 3, 4, 5], 2), [[1, 2], [3, 4], [5]])
+        self.assertEqual(split_batches([], 2), [])
+
+    def test_aggregate_run_stats(self) -> None:
+        results = [
+            batch_stats({'device1': True, 'device2': False}),
+            batch_stats({'device3': False}),
+            {'checked': 0, 'down': 0, 'errors': 5}
+        ]
+        stats = aggregate_run_stats(results, started_at=100, finished_at=107.5, budget=5)
+        self.assertEqual(stats, {
+            'checked': 3, 'down': 2, 'errors': 5, 'batches': 3,
+            'started_at': 100, 'duration': 7.5, 'overrun': 2.5
+        })
+        stats = aggregate_run_stats(results, started_at=100, finished_at=103)
+        self.assertEqual(stats['overrun'], 0)
+
+    @unittest.skipUnless(redis_available(), 'Redis server is not available')
+    def test_save_run_stats(self) -> None:
+        self.addCleanup(get_redis().delete, 'sms:runs:test')
+        stats = aggregate_run_stats([batch_stats({'device1': True})], 100, 101, 5)
+        self.assertTrue(save_run_stats('test', stats))
+        self.assertEqual(get_run_stats('test'), stats)
+
+
+@override_settings(SCHEDULER_BATCH_SIZE=2)
+class DeviceCheckBatchesTests(SimpleTestCase):
+    """ Tests for checks of devices by batches spread over workers """
+
+    def setUp(self) -> None:
+        # Chords of batches run in the test process
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, 'task_always_eager', False)
+
+    @mock.patch('sms_core.tasks.save_run_stats')
+    @mock.patch('sms_core.tasks.check_devices')
+    def test_dispatch_device_checks(self, check_devices_mock, save_run_stats_mock) -> None:
+        def check_devices(devices_list: list) -> dict:
+            if 'device4' in devices_list:
+                raise SoftTimeLimitExceeded()
+            return {name: name == 'device0' for name in devices_list}
+
+        check_devices_mock.side_effect = check_devices
+        dispatch_device_checks([f'device{i}' for i in range(5)], 'test', budget=60)
+        self.assertEqual(
+            sorted(name for call in check_devices_mock.call_args_list for name in call[0][0]),
+            [f'device{i}' for i in range(5)]
+        )
+        # A batch out of time is counted as errors, the others are aggregated
+        run, stats = save_run_stats_mock.call_args[0]
+        self.assertEqual(run, 'test')
+        self.assertEqual(
+            (stats['batches'], stats['checked'], stats['down'], stats['errors']), (3, 4, 3, 1)
+        )
@@ -0,0 +1,416 @@
+""" Tests for the scheduler of device checks. """
+
+import os
+import tempfile
+import unittest
+from collections import Counter
+from unittest import mock
+
+from celery.concurrency.solo import TaskPool as SoloPool
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, SimpleTestCase, override_settings
+
+from sms.celery import celery_app
+from sms_core.models import SmsUser, Device
+from sms_core.tasks import (
+    task_initial_device_check, task_device_check_loop, task_worker_processes, task_worker_name
+)
+from sms_core.utils.redis_utils import get_redis, redis_available
+from sms_core.utils.scheduler_utils import (
+    MEMORY_SCHEDULER, DeviceScheduler, RedisDeviceScheduler, phase_offset, next_slot, ramp_dues,
+    save_snapshot, load_snapshot, get_scheduler, snapshot_path
+)
+
+
+# Due times of the tests are on the phase of devices
+on_phase = mock.patch('sms_core.utils.scheduler_utils.phase_offset',
+                      new=lambda device_id, interval: 0)
+
+
+class PhaseOffsetTests(SimpleTestCase):
+    """ Tests for spreading device checks over the interval """
+
+    def test_next_slot(self) -> None:
+        slot = next_slot(1, 300, 1000)
+        self.assertGreaterEqual(slot, 1000)
+        self.assertLess(slot, 1300)
+        self.assertAlmostEqual(slot % 300, phase_offset(1, 300))
+        # A slot is the next slot of itself
+        self.assertAlmostEqual(next_slot(1, 300, slot), slot)
+
+    def test_ramp_dues(self) -> None:
+        scheduler = DeviceScheduler()
+        for device_id, due in ((1, 50), (2, 10), (3, 30), (4, 20)):
+            scheduler.schedule(device_id, f'device{device_id}', 300, due)
+        # The most overdue devices are checked first
+        self.assertEqual(ramp_dues(scheduler.overdue(100), 100, 60),
+                         {2: 100, 4: 115, 3: 130, 1: 145})
+        self.assertEqual(ramp_dues([], 100, 60), {})
+
+    def test_probes_are_spread(self) -> None:
+        # 10 000 devices with a 10 seconds interval: 1000 probes per second
+        # and no second gets much more than its share.
+        per_second = Counter(int(phase_offset(device_id, 10)) for device_id in range(1, 10001))
+        self.assertEqual(len(per_second), 10)
+        self.assertLess(max(per_second.values()), 1100)
+        self.assertGreater(min(per_second.values()), 900)
+
+
+@on_phase
+class DeviceSchedulerTests(SimpleTestCase):
+    """ Tests for DeviceScheduler """
+
+    def setUp(self) -> None:
+        self.scheduler = DeviceScheduler()
+        self.scheduler.schedule(1, 'device1', 300, 300)
+        self.scheduler.schedule(2, 'device2', 600, 600)
+
+    def test_reconcile(self) -> None:
+        self.scheduler.reconcile(
+            [(1, 'device1', 300), (2, 'device2', 10), (3, 'device3', 10)], now=100
+        )
+        self.assertEqual(self.scheduler.reconciled_at, 100)
+        self.assertAlmostEqual(self.scheduler.probe_rate(), 1 / 300 + 1 / 10 + 1 / 10)
+        # Known devices keep their due times
+        self.assertEqual(self.scheduler.get(1).due, 300)
+        # A shorter interval pulls the check closer
+        self.assertEqual(self.scheduler.get(2).due, next_slot(2, 10, 100))
+        # New devices are added at their next slot
+        self.assertEqual(self.scheduler.get(3).due, next_slot(3, 10, 100))
+        # Removed devices are dropped
+        self.scheduler.reconcile([(2, 'device2', 10)], now=200)
+        self.assertNotIn(1, self.scheduler)
+        self.assertNotIn(3, self.scheduler)
+        self.assertEqual(len(self.scheduler), 1)
+
+    def test_pop_due(self) -> None:
+        self.assertEqual(self.scheduler.next_due(), 300)
+        self.assertEqual(self.scheduler.pop_due(299), [])
+        self.assertEqual(self.scheduler.pop_due(299, tolerance=1), [(1, 'device1', 300, 0)])
+        # The next check is one interval after the previous due time
+        self.assertEqual(self.scheduler.get(1).due, 600)
+        self.assertEqual(self.scheduler.pop_due(610), [(1, 'device1', 600, 10),
+                                                       (2, 'device2', 600, 10)])
+        self.assertEqual(self.scheduler.pop_due(1000, limit=1), [(1, 'device1', 900, 100)])
+
+    def test_pop_due_late_devices(self) -> None:
+        # A device late by more than a half of its interval is scheduled
+        # at its first slot a half of the interval from now
+        self.assertEqual(self.scheduler.pop_due(1000, limit=1)[0].lateness, 700)
+        self.assertEqual(self.scheduler.get(1).due, next_slot(1, 300, 1150))
+        # A device is taken once even if the tolerance exceeds its interval
+        self.scheduler.schedule(1, 'device1', 5, 2000)
+        due_devices = self.scheduler.pop_due(2010, tolerance=100)
+        self.assertEqual([device.id for device in due_devices].count(1), 1)
+
+    def test_overdue(self) -> None:
+        self.assertEqual(self.scheduler.overdue(300), [])
+        self.assertEqual(self.scheduler.overdue(400), [(1, 'device1', 300, 100)])
+        self.assertEqual(self.scheduler.overdue(700, grace=200), [(1, 'device1', 300, 400)])
+        self.assertEqual(len(self.scheduler.overdue(700)), 2)
+        # Looking at overdue devices doesn't take them
+        self.assertEqual(len(self.scheduler.pop_due(700)), 2)
+        self.assertEqual(self.scheduler.overdue(700), [])
+
+    def test_stale_items_compaction(self) -> None:
+        for i in range(1000):
+            self.scheduler.schedule(1, 'device1', 300, 1000 + i)
+        self.assertLess(len(self.scheduler._heap), 100)
+        self.assertEqual(self.scheduler.next_due(), 600)
+
+    def test_ramp(self) -> None:
+        self.scheduler.schedule(3, 'device3', 300, 950)
+        self.assertEqual(self.scheduler.ramp(1000, 60, grace=100), 2)
+        self.assertEqual([self.scheduler.get(i).due for i in (1, 2, 3)], [1000, 1030, 950])
+        # A ramped device returns to its phase after the check
+        self.scheduler.pop_due(1000)
+        self.assertEqual(self.scheduler.get(1).due, 1200)
+
+    def test_snapshot(self) -> None:
+        scheduler = DeviceScheduler()
+        scheduler.restore(self.scheduler.snapshot())
+        self.assertEqual(scheduler.snapshot(), [(1, 'device1', 300, 300), (2, 'device2', 600, 600)])
+
+
+@override_settings(SCHEDULER_BACKEND='memory')
+@mock.patch('sms_core.utils.scheduler_utils.WORKER_PROCESSES', 1)
+class SchedulerBackendTests(SimpleTestCase):
+    """ Tests for the choice of the schedule by workers """
+
+    @staticmethod
+    def start_worker(pool: object, concurrency: int) -> None:
+        task_worker_processes(sender=mock.Mock(pool_cls=pool, concurrency=concurrency))
+
+    @mock.patch('sms_core.utils.scheduler_utils.WORKER_NAME', 'default')
+    def test_worker_name(self) -> None:
+        task_worker_name(sender=mock.Mock(hostname='celery@node1'))
+        with override_settings(SCHEDULER_SNAPSHOT_PATH='/tmp/snapshot.json'):
+            self.assertEqual(snapshot_path(), '/tmp/snapshot.celery_node1.json')
+
+    def test_memory_schedule_of_one_process(self) -> None:
+        self.start_worker('prefork', 1)
+        self.assertIs(get_scheduler(), MEMORY_SCHEDULER)
+        # A solo worker is one process whatever the concurrency is
+        self.start_worker(SoloPool, 4)
+        self.assertIs(get_scheduler(), MEMORY_SCHEDULER)
+
+    def test_memory_schedule_of_prefork_processes(self) -> None:
+        # Every child would keep its own schedule and check devices again
+        with self.assertLogs('sms_core.tasks', 'ERROR'):
+            self.start_worker('prefork', 4)
+        with self.assertRaises(ImproperlyConfigured):
+            get_scheduler()
+        with override_settings(SCHEDULER_BACKEND='redis'):
+            self.assertIsInstance(get_scheduler(), RedisDeviceScheduler)
+
+
+class ScheduleSnapshotTests(SimpleTestCase):
+    """ Tests for snapshots of the schedule of the process memory """
+
+    def setUp(self) -> None:
+        self.scheduler = DeviceScheduler()
+        self.scheduler.schedule(1, 'device1', 300, 300)
+
+    def test_file_snapshot(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'snapshot.json')
+            with override_settings(SCHEDULER_SNAPSHOT_STORE='file', SCHEDULER_SNAPSHOT_PATH=path):
+                self.assertIsNone(load_snapshot())
+                self.assertTrue(save_snapshot(self.scheduler, now=100))
+                self.assertEqual(self.scheduler.snapshot_at, 100)
+                self.assertEqual(load_snapshot(), [[1, 'device1', 300, 300]])
+                self.assertTrue(os.path.exists(os.path.join(tmp_dir, 'snapshot.default.json')))
+                # A broken snapshot is ignored
+                with open(snapshot_path(), 'w') as snapshot_file:
+                    snapshot_file.write('{')
+                self.assertIsNone(load_snapshot())
+
+    @unittest.skipUnless(redis_available(), 'Redis server is not available')
+    @override_settings(SCHEDULER_SNAPSHOT_STORE='redis')
+    @mock.patch('sms_core.utils.scheduler_utils.SNAPSHOT_KEY', 'sms:test:schedule:snapshot')
+    def test_redis_snapshot(self) -> None:
+        self.addCleanup(get_redis().delete, 'sms:test:schedule:snapshot:default',
+                        'sms:test:schedule:snapshot:celery@node2')
+        self.assertTrue(save_snapshot(self.scheduler, now=100))
+        self.assertEqual(load_snapshot(), [[1, 'device1', 300, 300]])
+        # Workers do not overwrite snapshots of each other
+        with mock.patch('sms_core.utils.scheduler_utils.WORKER_NAME', 'celery@node2'):
+            self.assertIsNone(load_snapshot())
+            self.assertTrue(save_snapshot(DeviceScheduler(), now=200))
+            self.assertEqual(load_snapshot(), [])
+        self.assertEqual(load_snapshot(), [[1, 'device1', 300, 300]])
+
+    @override_settings(SCHEDULER_SNAPSHOT_STORE='none')
+    def test_no_snapshot(self) -> None:
+        self.assertFalse(save_snapshot(self.scheduler, now=100))
+        self.assertIsNone(self.scheduler.snapshot_at)
+        self.assertIsNone(load_snapshot())
+
+
+class DeviceCheckTestCase(TestCase):
+    """ Devices of tests for the devices monitoring loop """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        user = SmsUser.objects.create_user(name='user', password='user')
+        cls.device1 = Device.objects.create(
+            name='device1', ip_fqdn='1.1.1.1', check_interval=10, updated_by=user
+        )
+        cls.device2 = Device.objects.create(
+            name='device2', ip_fqdn='2.2.2.2', check_interval=300, updated_by=user
+        )
+
+    def setUp(self) -> None:
+        # Chords of batches run in the test process
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, 'task_always_eager', False)
+
+    @staticmethod
+    def check_all_up(devices_list: list, workers_limit=5) -> dict:
+        """ A stub of check_devices: all devices are UP """
+        return {name: True for name in devices_list}
+
+
+@override_settings(SCHEDULER_BACKEND='memory', SCHEDULER_SNAPSHOT_STORE='none',
+                   SCHEDULER_RAMP_WINDOW=60)
+class DeviceCheckLoopTests(DeviceCheckTestCase):
+    """ Tests for the devices monitoring loop """
+
+    @override_settings(SCHEDULER_RECONCILE_INTERVAL=60)
+    @mock.patch('sms_core.tasks.save_run_stats')
+    @mock.patch('sms_core.tasks.check_devices')
+    @mock.patch('sms_core.tasks.time.time')
+    def test_device_check_loop(self, time_mock, check_devices_mock, save_run_stats_mock) -> None:
+        check_devices_mock.side_effect = self.check_all_up
+        scheduler = DeviceScheduler()
+        due1 = next_slot(self.device1.pk, 10, 1000)
+
+        # Every run checks devices due within a half of the loop time.
+        # The cold start spreads both devices over the ramp window first.
+        for now in range(1000, 1300, 5):
+            time_mock.return_value = now
+            task_device_check_loop(scheduler=scheduler)
+        checked = Counter(name for call in check_devices_mock.call_args_list for name in call[0][0])
+        self.assertIn(checked['device1'], (30, 31))
+        self.assertIn(checked['device2'], (1, 2))
+        self.assertAlmostEqual(scheduler.get(self.device1.pk).due % 10, due1 % 10)
+        # Every run with due devices reports its statistics
+        run, stats = save_run_stats_mock.call_args[0]
+        self.assertEqual(run, 'loop')
+        self.assertEqual((stats['checked'], stats['batches'], stats['overrun']), (1, 1, 0))
+
+        # Removed devices leave the schedule on the next reconciliation
+        Device.objects.filter(name='device2').delete()
+        time_mock.return_value = 1300
+        task_device_check_loop(scheduler=scheduler)
+        self.assertEqual(len(scheduler), 1)
+        self.assertAlmostEqual(scheduler.probe_rate(), 1 / 10)
+
+
+@override_settings(SCHEDULER_BACKEND='memory', SCHEDULER_SNAPSHOT_STORE='none',
+                   SCHEDULER_RAMP_WINDOW=60)
+class DeviceCheckWarmStartTests(DeviceCheckTestCase):
+    """ Tests for the start of the monitoring loop with the schedule of the process memory """
+
+    @mock.patch('sms_core.tasks.save_run_stats')
+    @mock.patch('sms_core.tasks.check_devices')
+    @mock.patch('sms_core.tasks.time.time')
+    def test_warm_start(self, time_mock, check_devices_mock, save_run_stats_mock) -> None:
+        check_devices_mock.side_effect = self.check_all_up
+        due2 = next_slot(self.device2.pk, 300, 2000)
+        with mock.patch('sms_core.tasks.load_snapshot', return_value=[
+                (self.device1.pk, 'device1', 10, 900), (self.device2.pk, 'device2', 300, due2)
+        ]):
+            time_mock.return_value = 1000
+            scheduler = DeviceScheduler()
+            task_device_check_loop(scheduler=scheduler)
+        # The overdue device is checked in the ramp window, the other one keeps its due time
+        self.assertEqual(scheduler.get(self.device2.pk).due, due2)
+        check_devices_mock.assert_called_once_with(['device1'])
+
+    @mock.patch('sms_core.tasks.save_run_stats')
+    @mock.patch('sms_core.tasks.check_devices')
+    @mock.patch('sms_core.tasks.time.time')
+    def test_cold_start_ramp(self, time_mock, check_devices_mock, save_run_stats_mock) -> None:
+        check_devices_mock.side_effect = self.check_all_up
+        scheduler = DeviceScheduler()
+        # Without a snapshot all devices are spread over the ramp window
+        for now in range(1000, 1060, 5):
+            time_mock.return_value = now
+            task_device_check_loop(scheduler=scheduler)
+        calls = [call[0][0] for call in check_devices_mock.call_args_list]
+        self.assertEqual(calls[0], ['device1'])
+        self.assertEqual(sum(call.count('device2') for call in calls), 1)
+
+
+@unittest.skipUnless(redis_available(), 'Redis server is not available')
+@on_phase
+class RedisDeviceSchedulerTests(SimpleTestCase):
+    """ Tests for RedisDeviceScheduler """
+
+    prefix = 'sms:test:schedule'
+
+    def setUp(self) -> None:
+        self.scheduler = RedisDeviceScheduler(get_redis(), prefix=self.prefix, lease_time=60)
+        self.scheduler.schedule(1, 'device1', 300, 300)
+        self.scheduler.schedule(2, 'device2', 600, 600)
+
+    def tearDown(self) -> None:
+        for key in get_redis().scan_iter(f'{self.prefix}:*'):
+            get_redis().delete(key)
+
+    def test_reconcile(self) -> None:
+        self.scheduler.reconcile(
+            [(1, 'device1', 300), (2, 'device2', 10), (3, 'device3', 10)], now=100
+        )
+        self.assertEqual(self.scheduler.reconciled_at, 100)
+        self.assertAlmostEqual(self.scheduler.probe_rate(), 1 / 300 + 1 / 10 + 1 / 10)
+        self.assertEqual(len(self.scheduler), 3)
+        # Known devices keep their due times, a shorter interval pulls the
+        # check closer, new devices are added at their next slot
+        self.assertEqual(self.scheduler.overdue(300.5), [
+            (2, 'device2', next_slot(2, 10, 100), 300.5 - next_slot(2, 10, 100)),
+            (3, 'device3', next_slot(3, 10, 100), 300.5 - next_slot(3, 10, 100)),
+            (1, 'device1', 300, 0.5),
+        ])
+        # Removed devices are dropped
+        self.scheduler.reconcile([(2, 'device2', 10)], now=200)
+        self.assertNotIn(1, self.scheduler)
+        self.assertEqual([device.id for device in self.scheduler.overdue(1000)], [2])
+
+    def test_claim_is_exclusive(self) -> None:
+        token, due_devices = self.scheduler.claim(300)
+        self.assertEqual(due_devices, [(1, 'device1', 300, 0)])
+        # Another worker doesn't get claimed devices while the lease is held
+        self.assertEqual(self.scheduler.claim(350, tolerance=300)[1], [(2, 'device2', 600, 0)])
+        self.assertEqual(self.scheduler.claim(350, tolerance=1000)[1], [])
+
+        self.scheduler.complete(token, due_devices, now=310)
+        self.assertEqual(self.scheduler.next_due(), 600)
+        self.assertEqual(self.scheduler.overdue(700), [(1, 'device1', 600, 100)])
+
+    def test_claim_limit(self) -> None:
+        self.assertEqual(self.scheduler.claim(1000, limit=1)[1], [(1, 'device1', 300, 700)])
+        self.assertEqual(self.scheduler.claim(1000, limit=1)[1], [(2, 'device2', 600, 400)])
+        self.assertEqual(self.scheduler.claim(1000, limit=1)[1], [])
+
+    def test_expired_lease(self) -> None:
+        token, due_devices = self.scheduler.claim(300)
+        # The worker is lost: the lease expires and the device is due again
+        self.assertEqual(self.scheduler.claim(300 + 30)[1], [])
+        new_token, new_due_devices = self.scheduler.claim(300 + 61)
+        self.assertEqual(new_due_devices, [(1, 'device1', 300, 61)])
+        # The late completion of the lost worker is ignored
+        self.scheduler.complete(token, due_devices, now=400)
+        self.assertEqual(self.scheduler.overdue(1000), [(2, 'device2', 600, 400)])
+        self.scheduler.complete(new_token, new_due_devices, now=400)
+        self.assertEqual(self.scheduler.overdue(1000)[0], (1, 'device1', 600, 400))
+
+    def test_removed_while_claimed(self) -> None:
+        token, due_devices = self.scheduler.claim(300)
+        self.scheduler.reconcile([(2, 'device2', 600)], now=310)
+        self.scheduler.complete(token, due_devices, now=320)
+        self.assertEqual(self.scheduler.overdue(10000), [(2, 'device2', 600, 9400)])
+
+
+@unittest.skipUnless(redis_available(), 'Redis server is not available')
+@override_settings(SCHEDULER_BACKEND='redis', SCHEDULER_CLAIM_TASKS=2, SCHEDULER_RAMP_WINDOW=60)
+class RedisDeviceCheckLoopTests(DeviceCheckTestCase):
+    """ Tests for the devices monitoring loop with the shared schedule """
+
+    prefix = 'sms:test:schedule'
+
+    def tearDown(self) -> None:
+        for key in get_redis().scan_iter(f'{self.prefix}:*'):
+            get_redis().delete(key)
+
+    @mock.patch('sms_core.tasks.save_run_stats')
+    @mock.patch('sms_core.tasks.check_devices')
+    @mock.patch('sms_core.tasks.time.time')
+    def test_device_check_loop(self, time_mock, check_devices_mock, save_run_stats_mock) -> None:
+        check_devices_mock.side_effect = self.check_all_up
+        scheduler = RedisDeviceScheduler(get_redis(), prefix=self.prefix)
+        scheduler.reconcile([(self.device1.pk, 'device1', 10)], now=0)
+        due1 = next_slot(self.device1.pk, 10, 1000)
+        time_mock.return_value = due1
+        with mock.patch('sms_core.tasks.get_scheduler', return_value=scheduler):
+            task_device_check_loop()
+        # Claiming tasks are spread over workers, the device late
+        # since the first slot is checked once
+        check_devices_mock.assert_called_once_with(['device1'])
+        # device2 joins by the reconciliation, its slot depends on its id
+        self.assertAlmostEqual(
+            scheduler.client.zscore(scheduler.due_key, self.device1.pk), due1 + 10
+        )
+        stats = save_run_stats_mock.call_args[0][1]
+        self.assertEqual((stats['checked'], stats['batches']), (1, 2))
+
+    @mock.patch('sms_core.tasks.time.time', return_value=1000)
+    def test_initial_device_check(self, time_mock) -> None:
+        scheduler = RedisDeviceScheduler(get_redis(), prefix=self.prefix)
+        scheduler.reconcile([(self.device1.pk, 'device1', 10), (self.device2.pk, 'device2', 10)],
+                            now=0)
+        with mock.patch('sms_core.tasks.get_scheduler', return_value=scheduler):
+            task_initial_device_check()
+        # Devices overdue after the start are spread over the ramp window
+        self.assertEqual([device.due for device in scheduler.overdue(1060)], [1000, 1030])
@@ -0,0 +1,119 @@
+""" Tests for the live stream of status changes. """
+
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.test import TestCase
+
+from sms_core.models import SmsUser, Device
+from sms_core.streams import status_stream
+from sms_core.utils.redis_utils import get_redis, redis_available
+from sms_core.utils.stream_utils import (
+    STATUS_CHANNEL, StatusBroadcaster, status_message, publish_status_changes
+)
+
+
+class StatusChangesTests(TestCase):
+    """ Tests for publishing status changes of devices """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        user = SmsUser.objects.create_user(name='user', password='user')
+        Device.objects.create(name='device1', ip_fqdn='1.1.1.1', updated_by=user)
+        Device.objects.create(name='device2', ip_fqdn='2.2.2.2', updated_by=user)
+
+    def test_status_message(self) -> None:
+        device = Device.objects.get(name='device1')
+        device.apply_status(True)
+        message = json.loads(status_message([device]))
+        self.assertEqual(message['devices'][0]['id'], device.pk)
+        self.assertEqual(message['devices'][0]['status'], True)
+        self.assertTrue(message['devices'][0]['since'])
+
+    @mock.patch('django.db.transaction.on_commit', side_effect=lambda func: func())
+    @mock.patch('sms_core.models.change_counters')
+    @mock.patch('sms_core.managers.change_counters')
+    def test_publish_on_commit(self, *mocks) -> None:
+        with mock.patch('sms_core.models.publish_status_changes') as publish_mock:
+            Device.objects.get(name='device1').set_status(True)
+        self.assertEqual([device.name for device in publish_mock.call_args[0][0]], ['device1'])
+        # A batch of changes is published with one message
+        with mock.patch('sms_core.managers.publish_status_changes') as publish_mock:
+            Device.objects.bulk_set_status(
+                list(Device.objects.all()), {'device1': False, 'device2': True}
+            )
+        publish_mock.assert_called_once()
+        self.assertEqual(len(publish_mock.call_args[0][0]), 2)
+
+    @unittest.skipUnless(redis_available(), 'Redis server is not available')
+    def test_publish_status_changes(self) -> None:
+        pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+        self.addCleanup(pubsub.close)
+        pubsub.subscribe(STATUS_CHANNEL)
+        device = Device.objects.get(name='device2')
+        self.assertFalse(publish_status_changes([]))
+        self.assertTrue(publish_status_changes([device]))
+        message = None
+        for _ in range(10):
+            message = pubsub.get_message(timeout=0.5)
+            if message:
+                break
+        self.assertEqual(json.loads(message['data'])['devices'][0]['name'], 'device2')
+
+
+@mock.patch('sms_core.streams.close_old_connections')
+@mock.patch.object(StatusBroadcaster, '_listen')
+class StatusStreamTests(TestCase):
+    """ Tests for server-sent events of status changes """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        SmsUser.objects.create_user(name='user', password='user')
+
+    def stream(self, messages=(), method='GET', login=True) -> list:
+        """ ASGI messages sent by the stream to a client that goes away after `messages` """
+        headers = []
+        if login:
+            self.client.force_login(SmsUser.objects.get(name='user'))
+            cookie = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+            headers.append((b'cookie', f'{settings.SESSION_COOKIE_NAME}={cookie}'.encode()))
+        scope = {'type': 'http', 'method': method, 'path': '/sms/overview/events/',
+                 'headers': headers}
+        broadcaster = StatusBroadcaster(queue_size=2)
+        sent = []
+
+        async def receive() -> dict:
+            for data in messages:
+                broadcaster.dispatch(data)
+            await asyncio.sleep(0.1)
+            return {'type': 'http.disconnect'}
+
+        async def send(message: dict) -> None:
+            sent.append(message)
+
+        with mock.patch('sms_core.streams.BROADCASTER', broadcaster):
+            async_to_sync(status_stream)(scope, receive, send)
+        self.assertFalse(broadcaster._queues)
+        return sent
+
+    def test_forbidden(self, *mocks) -> None:
+        self.assertEqual(self.stream(login=False)[0]['status'], 403)
+        self.assertEqual(self.stream(method='POST')[0]['status'], 405)
+
+    def test_status_events(self, *mocks) -> None:
+        sent = self.stream(messages=['{"devices": []}'])
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'), sent[0]['headers'])
+        self.assertEqual(
+            [message['body'] for message in sent[2:]],
+            [b'event: status\ndata: {"devices": []}\n\n']
+        )
+
+    def test_slow_client_reloads(self, *mocks) -> None:
+        # Messages over the queue size are dropped and the page is reloaded
+        sent = self.stream(messages=['1', '2', '3'])
+        self.assertEqual([message['body'] for message in sent[2:]], [b'event: reload\ndata: \n\n'])
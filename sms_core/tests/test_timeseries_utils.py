@@ -0,0 +1,168 @@
+""" Tests for the time series of probe results. """
+
+import datetime
+
+from django.test import TestCase, SimpleTestCase, override_settings
+
+from sms_core.models import SmsUser, Device, ProbeResult, ProbeRollup
+from sms_core.utils.icmp_utils import PingStats
+from sms_core.utils.timeseries_utils import (
+    record_probe_results, get_partitions, maintain_partitions, rollup_probe_results,
+    parse_window, get_window_points, get_window_summary
+)
+
+
+NOW = datetime.datetime(2021, 3, 10, 12, 30, tzinfo=datetime.timezone.utc)
+UP = PingStats(1, 1, 1.0, 2.0, 3.0)
+DOWN = PingStats(3, 0, None, None, None)
+
+
+class ParseWindowTests(SimpleTestCase):
+    """ Tests for time windows of probe results """
+
+    def test_parse_window(self) -> None:
+        self.assertEqual(parse_window('90'), datetime.timedelta(seconds=90))
+        self.assertEqual(parse_window('15m'), datetime.timedelta(minutes=15))
+        self.assertEqual(parse_window('24h'), datetime.timedelta(days=1))
+        self.assertEqual(parse_window('7d'), datetime.timedelta(days=7))
+        for value in ('', '0', '-1h', '1w', 'h', '1000d'):
+            with self.assertRaises(ValueError):
+                parse_window(value)
+
+
+@override_settings(TIMESERIES_RETENTION_DAYS=2, TIMESERIES_PARTITIONS_AHEAD=1,
+                   TIMESERIES_ROLLUP_PERIOD='hour', TIMESERIES_ROLLUP_RETENTION_DAYS=30)
+class ProbeResultsTests(TestCase):
+    """ Tests for writing, keeping and querying probe results """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        user = SmsUser.objects.create_user(name='user', password='user')
+        cls.device1 = Device.objects.create(name='device1', ip_fqdn='1.1.1.1', updated_by=user)
+        cls.device2 = Device.objects.create(name='device2', ip_fqdn='2.2.2.2', updated_by=user)
+
+    def record(self, minutes_ago: int, stats1=UP, stats2=DOWN) -> None:
+        """ Writing results of both devices some minutes before NOW """
+        record_probe_results(
+            [(self.device1.pk, stats1), (self.device2.pk, stats2)],
+            time=NOW - datetime.timedelta(minutes=minutes_ago)
+        )
+
+    def test_record_probe_results(self) -> None:
+        with override_settings(TIMESERIES_BATCH_SIZE=2):
+            with self.assertNumQueries(2):
+                record_probe_results(
+                    [(self.device1.pk, UP)] * 3 + [(self.device2.pk, DOWN)], time=NOW
+                )
+        self.assertEqual(
+            list(ProbeResult.objects.filter(device=self.device2).values_list(
+                'rtt_min', 'rtt_avg', 'rtt_max', 'loss'
+            )),
+            [(None, None, None, 100)]
+        )
+
+    def test_window_queries(self) -> None:
+        self.record(90)
+        self.record(30, stats1=PingStats(3, 1, 5.0, 5.0, 5.0))
+        self.record(10)
+
+        points = get_window_points(self.device1, datetime.timedelta(hours=1), now=NOW)
+        self.assertEqual(points['resolution'], 'raw')
+        self.assertEqual([point['rtt_avg'] for point in points['points']], [5.0, 2.0])
+
+        summary = get_window_summary(self.device1, datetime.timedelta(hours=1), now=NOW)
+        self.assertEqual(summary['samples'], 2)
+        self.assertEqual((summary['rtt_min'], summary['rtt_max']), (1.0, 5.0))
+        self.assertAlmostEqual(summary['rtt_avg'], 3.5)
+        self.assertAlmostEqual(summary['loss'], 33.5)
+
+        summary = get_window_summary(self.device2, datetime.timedelta(hours=2), now=NOW)
+        self.assertEqual((summary['samples'], summary['loss'], summary['rtt_avg']), (3, 100, None))
+
+    def test_downsampled_window(self) -> None:
+        for minutes_ago in range(1, 61):
+            self.record(minutes_ago, stats1=PingStats(2, 1, minutes_ago, minutes_ago, minutes_ago))
+        with override_settings(TIMESERIES_MAX_POINTS=7):
+            with self.assertNumQueries(2):
+                points = get_window_points(self.device1, datetime.timedelta(hours=1), now=NOW)
+            # 10 minutes buckets from 11:30 to 12:30
+            self.assertEqual(points['resolution'], '600s')
+            self.assertEqual(len(points['points']), 6)
+            first = points['points'][0]
+            self.assertEqual(first['time'], NOW - datetime.timedelta(hours=1))
+            self.assertEqual((first['samples'], first['rtt_min'], first['rtt_max']), (10, 51, 60))
+            self.assertAlmostEqual(first['rtt_avg'], 55.5)
+            self.assertAlmostEqual(first['loss'], 50)
+            self.assertEqual(sum(point['samples'] for point in points['points']), 60)
+
+            down = get_window_points(self.device2, datetime.timedelta(hours=1), now=NOW)
+            self.assertEqual(down['points'][0]['rtt_avg'], None)
+            self.assertEqual(down['points'][0]['loss'], 100)
+
+        with override_settings(TIMESERIES_MAX_POINTS=60):
+            points = get_window_points(self.device1, datetime.timedelta(hours=1), now=NOW)
+            self.assertEqual((points['resolution'], len(points['points'])), ('raw', 60))
+
+    def test_partitions(self) -> None:
+        # Rows written before the partition exists are kept in the default partition
+        self.record(0)
+        created, dropped = maintain_partitions(NOW.date())
+        self.assertEqual(created, [NOW.date(), NOW.date() + datetime.timedelta(days=1)])
+        self.assertEqual(dropped, [])
+        # ... and moved into the new partition
+        self.assertEqual(ProbeResult.objects.count(), 2)
+        partitions = get_partitions()
+        self.assertEqual(sorted(partitions), created)
+
+        # Partitions older than the retention days are dropped
+        self.assertEqual(maintain_partitions(NOW.date()), ([], []))
+        later = NOW.date() + datetime.timedelta(days=3)
+        created, dropped = maintain_partitions(later)
+        self.assertEqual(dropped, [NOW.date()])
+        self.assertEqual(ProbeResult.objects.count(), 0)
+        self.assertNotIn(NOW.date(), get_partitions())
+
+    def test_rollups(self) -> None:
+        self.record(90)
+        self.record(25)
+        self.record(20, stats1=PingStats(1, 1, 4.0, 4.0, 4.0))
+        self.assertEqual(rollup_probe_results(now=NOW), 4)
+        rollup = ProbeRollup.objects.get(
+            device=self.device1, period_start=NOW.replace(minute=0)
+        )
+        self.assertEqual((rollup.samples, rollup.rtt_min, rollup.rtt_max), (2, 1.0, 4.0))
+        self.assertAlmostEqual(rollup.rtt_avg, 3.0)
+
+        # The last period is aggregated again with new results
+        self.record(0)
+        rollup_probe_results(now=NOW + datetime.timedelta(minutes=1))
+        rollup.refresh_from_db()
+        self.assertEqual(rollup.samples, 3)
+        self.assertEqual(ProbeRollup.objects.count(), 4)
+
+        # Rollups are used for windows longer than the retention days
+        points = get_window_points(self.device2, datetime.timedelta(days=5), now=NOW)
+        self.assertEqual(points['resolution'], 'hour')
+        self.assertEqual([point['samples'] for point in points['points']], [1, 3])
+        summary = get_window_summary(self.device1, datetime.timedelta(days=5), now=NOW)
+        self.assertEqual((summary['samples'], summary['loss']), (4, 0))
+        self.assertAlmostEqual(summary['rtt_avg'], 2.5)
+
+        # Rollups are downsampled by whole periods, weighted by samples
+        with override_settings(TIMESERIES_MAX_POINTS=1):
+            points = get_window_points(self.device1, datetime.timedelta(days=5), now=NOW)
+        self.assertEqual(points['resolution'], '432000s')
+        self.assertEqual([point['samples'] for point in points['points']], [4])
+        self.assertAlmostEqual(points['points'][0]['rtt_avg'], 2.5)
+
+        # Rollups older than the retention days are removed
+        rollup_probe_results(now=NOW + datetime.timedelta(days=30, minutes=-31))
+        self.assertEqual(ProbeRollup.objects.count(), 2)
+
+    def test_device_removal(self) -> None:
+        self.record(0)
+        rollup_probe_results(now=NOW)
+        Device.objects.filter(pk=self.device2.pk).delete()
+        self.assertEqual(ProbeResult.objects.filter(device_id=self.device2.pk).count(), 0)
+        self.assertEqual(ProbeRollup.objects.filter(device_id=self.device2.pk).count(), 0)
+        self.assertEqual(ProbeResult.objects.count(), 1)
@@ -1,10 +1,15 @@
 """ Tests for sms_core views for authorized users. """
 
-from django.test import TestCase
+from unittest import mock
+
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
 from sms_core.models import SmsUser, Device
 from sms_core.forms import UserCreationForm, UserChangeForm, DeviceForm
+from sms_core.utils.icmp_utils import PingStats
+from sms_core.utils.redis_utils import get_redis
+from sms_core.utils.timeseries_utils import record_probe_results
 
 
 class LoginLogoutViewTests(TestCase):
@@ -147,6 +152,44 @@ class SmsOverviewViewTests(OperationalViewTests):
         # Checking the device name.
         self.assertEqual(str(response.context['devices'][0]), 'device2')
 
+    @mock.patch('sms_core.utils.counters_utils.COUNTERS_KEY', 'sms:test:counters')
+    def test_status_filter(self) -> None:
+        self.addCleanup(get_redis().delete, 'sms:test:counters')
+        Device.objects.get(name='device2').set_status(True)
+        self.client.login(username='test_user', password='test_user')
+        response = self.client.get(f'{reverse("sms_core:url_devices_overview")}?status=down')
+        self.assertEqual([str(device) for device in response.context['devices']], ['device1'])
+        # The summary counts all devices, by counters or by the search
+        self.assertEqual(
+            (response.context['devices_total'], response.context['devices_up']), (2, 1)
+        )
+        response = self.client.get(
+            f'{reverse("sms_core:url_devices_overview")}?status=down&search=device'
+        )
+        self.assertEqual(
+            (response.context['devices_total'], response.context['devices_up']), (2, 1)
+        )
+
+    @override_settings(OVERVIEW_PAGE_SIZE=1)
+    def test_pages(self) -> None:
+        Device.objects.get(name='device1').set_status(True)
+        self.client.login(username='test_user', password='test_user')
+        url = f'{reverse("sms_core:url_devices_overview")}?sort=changed'
+        response = self.client.get(url)
+        self.assertEqual([str(device) for device in response.context['devices']], ['device1'])
+        self.assertTrue(response.context['is_first_page'])
+        next_cursor = response.context['next_cursor']
+        self.assertContains(response, f'after={next_cursor}')
+
+        response = self.client.get(f'{url}&after={next_cursor}')
+        self.assertEqual([str(device) for device in response.context['devices']], ['device2'])
+        self.assertFalse(response.context['is_first_page'])
+        self.assertIsNone(response.context['next_cursor'])
+
+        # A broken cursor opens the first page
+        response = self.client.get(f'{url}&after=broken')
+        self.assertEqual([str(device) for device in response.context['devices']], ['device1'])
+
 
 class SmsAdministrationViewTests(OperationalViewTests):
     """ Tests for the SmsOverviewView """
@@ -198,6 +241,20 @@ class SmsDeviceDetailsViewTests(OperationalViewTests):
         self.assertTemplateUsed(response, 'sms_core/sms_device_detail.html')
         self.assertEqual(response.context['device'], device)
 
+    def test_device_detail_probes(self) -> None:
+        device = Device.objects.get(name='device1')
+        record_probe_results([(device.pk, PingStats(1, 1, 1.0, 2.0, 3.0))])
+        url = reverse('sms_core:url_device_detail', kwargs={'slug': device.name})
+        response = self.client.get(url)
+        self.assertEqual(response.context['window'], '24h')
+        self.assertEqual(response.context['probes']['samples'], 1)
+        response = self.client.get(url, {'window': '1h'})
+        self.assertEqual(response.context['window'], '1h')
+        self.assertContains(response, '1.00 / 2.00 / 3.00 ms')
+        # A wrong window falls back to the default one
+        response = self.client.get(url, {'window': 'week'})
+        self.assertEqual(response.context['window'], '24h')
+
 
 class SmsDeviceAddViewTests(OperationalViewTests):
     """ Tests for the SmsDeviceAddView """
@@ -1,9 +1,14 @@
 """ Tests for sms_core utils. """
 
-from django.test import TestCase
+from unittest import mock
 
-from sms_core.models import SmsUser, Device
-from sms_core.utils.devices_utils import device_ping, check_device_status
+from django.test import TestCase, override_settings
+
+from sms_core.models import SmsUser, Device, ProbeResult, StatusEvent
+from sms_core.utils.devices_utils import (
+    device_ping, check_device_status, parse_ping_output, get_devices
+)
+from sms_core.utils.icmp_utils import PingStats
 
 
 class DeviceUtilsTests(TestCase):
@@ -57,3 +62,130 @@ class DeviceUtilsTests(TestCase):
         self.assertTrue(Device.objects.get(name='device2').status)
         self.assertFalse(Device.objects.get(name='device3').status)
         self.assertFalse(Device.objects.get(name='device4').status)
+
+
+class DeviceStatusBatchTests(TestCase):
+    """ Tests for the batched status pipeline of check_device_status """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        user = SmsUser.objects.create_user(name='user', password='user')
+        Device.objects.bulk_create([
+            Device(
+                name=f'device{i}',
+                ip_fqdn=f'10.0.0.{i}',
+                check_interval=5,
+                updated_by=user
+            ) for i in range(50)
+        ])
+
+    @staticmethod
+    def ping_even_devices(device: object, count='3') -> PingStats:
+        """ A stub of device_probe: devices with an even number are UP """
+        if int(device.name[len('device'):]) % 2 == 0:
+            return PingStats(1, 1, 0.5, 0.5, 0.5)
+        return PingStats(3, 0, None, None, None)
+
+    def test_check_device_status_queries(self) -> None:
+        # One fetch, one bulk update, one insert of status events and
+        # one insert of probe results per batch, regardless of its size
+        with mock.patch('sms_core.utils.devices_utils.device_probe', self.ping_even_devices):
+            with self.assertNumQueries(4):
+                check_device_status([f'device{i}' for i in range(5)])
+            with self.assertNumQueries(4):
+                check_device_status([f'device{i}' for i in range(5, 50)])
+            # No status changed - only probe results to write
+            with self.assertNumQueries(2):
+                check_device_status([f'device{i}' for i in range(50)])
+        self.assertEqual(ProbeResult.objects.count(), 100)
+        self.assertEqual(StatusEvent.objects.count(), 25)
+
+    def test_get_devices_ignores_case(self) -> None:
+        with self.assertNumQueries(1):
+            self.assertEqual(len(get_devices(['device1', 'device2'])), 2)
+        with self.assertNumQueries(2):
+            devices = get_devices(['DEVICE1', 'device2', 'missing'])
+        self.assertEqual(sorted(device.name for device in devices), ['device1', 'device2'])
+
+    def test_check_device_status_result(self) -> None:
+        with mock.patch('sms_core.utils.devices_utils.device_probe', self.ping_even_devices):
+            results = check_device_status(['device1', 'device2'])
+        self.assertEqual(results, {'device1': False, 'device2': True})
+        self.assertFalse(Device.objects.get(name='device1').status)
+        self.assertTrue(Device.objects.get(name='device2').status)
+        # Probe results are recorded
+        self.assertEqual(
+            list(ProbeResult.objects.order_by('device__name').values_list('loss', 'rtt_avg')),
+            [(100, None), (0, 0.5)]
+        )
+
+    def test_bulk_set_status_updates_only_status(self) -> None:
+        devices = list(Device.objects.filter(name__in=['device1', 'device2']))
+        Device.objects.filter(name='device2').update(description='changed meanwhile')
+        changed = Device.objects.bulk_set_status(devices, {'device1': False, 'device2': True})
+        self.assertEqual([device.name for device in changed], ['device2'])
+        device = Device.objects.get(name='device2')
+        self.assertTrue(device.status)
+        self.assertEqual(device.description, 'changed meanwhile')
+
+
+class DevicePingModeTests(TestCase):
+    """ Tests for the ping modes of device_ping """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        user = SmsUser.objects.create_user(name='user', password='user')
+        Device.objects.create(name='device1', ip_fqdn='10.0.0.1', updated_by=user)
+        Device.objects.create(
+            name='device2', ip_fqdn='10.0.0.2', ping_deadline=10, ping_interval=0.5,
+            updated_by=user
+        )
+
+    @override_settings(PROBE_PING_MODE='fast', PROBE_PING_DEADLINE=3, PROBE_PING_INTERVAL=1.0)
+    @mock.patch('sms_core.utils.devices_utils.subprocess.run')
+    def test_fast_mode(self, run_mock) -> None:
+        # ping exits at the first reply, the deadline limits unanswered devices
+        run_mock.return_value.returncode = 0
+        run_mock.return_value.stdout = ''
+        device = Device.objects.get(name='device1')
+        self.assertEqual(device_ping(device), device)
+        self.assertEqual(run_mock.call_args[0][0],
+                         ['ping', '-c', '1', '-w', '3', '-i', '1.0', '10.0.0.1'])
+        # Per-device overrides
+        device_ping(Device.objects.get(name='device2'))
+        self.assertEqual(run_mock.call_args[0][0],
+                         ['ping', '-c', '1', '-w', '10', '-i', '0.5', '10.0.0.2'])
+
+        run_mock.return_value.returncode = 1
+        self.assertIsNone(device_ping(device))
+
+    @override_settings(PROBE_PING_MODE='full')
+    @mock.patch('sms_core.utils.devices_utils.subprocess.run')
+    def test_full_mode(self, run_mock) -> None:
+        run_mock.return_value.returncode = 0
+        run_mock.return_value.stdout = ''
+        device_ping(Device.objects.get(name='device2'))
+        self.assertEqual(run_mock.call_args[0][0], ['ping', '-c', '3', '10.0.0.2'])
+
+    def test_parse_ping_output(self) -> None:
+        output = (
+            '--- 10.0.0.1 ping statistics ---\n'
+            '3 packets transmitted, 2 received, 33.3333% packet loss, time 2003ms\n'
+            'rtt min/avg/max/mdev = 0.030/0.041/0.052/0.008 ms\n'
+        )
+        stats = parse_ping_output(output, True)
+        self.assertEqual(stats, (3, 2, 0.030, 0.041, 0.052))
+        self.assertEqual(stats.loss, 33)
+        output = (
+            '3 packets transmitted, 0 received, +3 errors, 100% packet loss, time 2003ms\n'
+        )
+        self.assertEqual(parse_ping_output(output, False), (3, 0, None, None, None))
+        # Busybox
+        output = (
+            '1 packets transmitted, 1 packets received, 0% packet loss\n'
+            'round-trip min/avg/max = 0.1/0.1/0.1 ms\n'
+        )
+        self.assertEqual(parse_ping_output(output, True), (1, 1, 0.1, 0.1, 0.1))
+        # No summary: only the result is known
+        self.assertEqual(parse_ping_output('', True).loss, 0)
+        self.assertEqual(parse_ping_output('', False).loss, 100)
@@ -0,0 +1,147 @@
+""" Users of verified API credentials cached in Redis """
+
+
+import json
+
+import redis
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.utils.crypto import salted_hmac
+
+from .redis_utils import get_redis
+
+
+AUTH_KEY = 'sms:auth'
+# Columns of cached users in the order of the model, others are loaded if needed
+USER_FIELDS = ('id', 'is_superuser', 'is_staff', 'is_active', 'name')
+
+
+def credentials_digest(*credentials) -> str:
+    """ A digest of credentials salted by the secret key, they are never kept as is """
+    return salted_hmac(AUTH_KEY, '\0'.join(credentials), algorithm='sha256').hexdigest()
+
+
+# Returns the cached user unless it was dropped after its credentials were verified.
+# KEYS: the cached user, the generation of the user
+GET_SCRIPT = """
+local value = redis.call('GET', KEYS[1])
+if value then
+    local dropped = redis.call('GET', KEYS[2])
+    if dropped and tonumber(dropped) > tonumber(cjson.decode(value)['generation']) then
+        return false
+    end
+end
+return value
+"""
+
+# Caches a user verified at the generation ARGV[2] unless the user was dropped since.
+# KEYS: the cached user, the digests of the user, the generation of the user.
+# ARGV: digest, generation, the user, timeout. Returns 1 if the user is cached
+CACHE_SCRIPT = """
+local dropped = redis.call('GET', KEYS[3])
+if dropped and tonumber(dropped) > tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[3], 'EX', ARGV[4])
+redis.call('SADD', KEYS[2], ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+return 1
+"""
+
+# Drops cached credentials of a user and marks the user with the next generation.
+# KEYS: the generation, the digests of the user, the generation of the user,
+# the cached credentials of the digests. ARGV: timeout, the digests
+DROP_SCRIPT = """
+local generation = redis.call('INCR', KEYS[1])
+redis.call('SET', KEYS[3], generation, 'EX', ARGV[1])
+for i = 4, #KEYS do
+    redis.call('DEL', KEYS[i])
+    redis.call('SREM', KEYS[2], ARGV[i - 2])
+end
+return generation
+"""
+
+
+def get_cached_user(digest: str) -> tuple:
+    """
+    (a user of verified credentials without queries or None, the generation).
+    The generation is read before credentials are verified and passed to
+    cache_user: a user changed while its credentials are verified is not cached.
+    """
+    client = get_redis()
+    try:
+        value, generation = client.pipeline(transaction=False).get(
+            f'{AUTH_KEY}:{digest}'
+        ).get(f'{AUTH_KEY}:generation').execute()
+        if value is not None:
+            # The user is known by the entry, the entry is read again with its drops
+            value = client.register_script(GET_SCRIPT)(keys=[
+                f'{AUTH_KEY}:{digest}',
+                f'{AUTH_KEY}:user:{json.loads(value)["id"]}:generation'
+            ])
+    except redis.RedisError:
+        return None, None
+    generation = int(generation or 0)
+    if value is None:
+        return None, generation
+    data = json.loads(value)
+    return apps.get_model('sms_core', 'SmsUser').from_db(
+        'default', USER_FIELDS, [data[field] for field in USER_FIELDS]
+    ), generation
+
+
+def cache_user(digest: str, user: object, generation: int) -> bool:
+    """
+    Keeping the user of credentials verified at `generation` for AUTH_CACHE_TIMEOUT
+    seconds. Digests of a user are listed to drop them together.
+    """
+    if not settings.AUTH_CACHE_TIMEOUT or generation is None:
+        return False
+    data = {field: getattr(user, field) for field in USER_FIELDS}
+    data['generation'] = generation
+    client = get_redis()
+    try:
+        return bool(client.register_script(CACHE_SCRIPT)(
+            keys=[
+                f'{AUTH_KEY}:{digest}',
+                f'{AUTH_KEY}:user:{user.pk}',
+                f'{AUTH_KEY}:user:{user.pk}:generation'
+            ],
+            args=[digest, generation, json.dumps(data), settings.AUTH_CACHE_TIMEOUT]
+        ))
+    except redis.RedisError:
+        return False
+
+
+def drop_cached_user(user_id: int) -> bool:
+    """
+    Dropping all cached credentials of a user. The user is marked with the next
+    generation, so credentials verified before the drop are not cached after it.
+    """
+    client = get_redis()
+    try:
+        # Credentials cached after the digests are read are not returned by get_cached_user
+        digests = sorted(client.smembers(f'{AUTH_KEY}:user:{user_id}'))
+        client.register_script(DROP_SCRIPT)(
+            keys=[
+                f'{AUTH_KEY}:generation',
+                f'{AUTH_KEY}:user:{user_id}',
+                f'{AUTH_KEY}:user:{user_id}:generation',
+                *[f'{AUTH_KEY}:{digest}' for digest in digests]
+            ],
+            args=[max(settings.AUTH_CACHE_TIMEOUT, 1), *digests]
+        )
+    except redis.RedisError:
+        return False
+    return True
+
+
+def drop_token_user(sender, instance, **kwargs) -> None:
+    """ A receiver of removed tokens, the user of a token is dropped after the commit """
+    transaction.on_commit(lambda: drop_cached_user(instance.user_id))
+
+
+def drop_deleted_user(sender, instance, **kwargs) -> None:
+    """ A receiver of removed users, the user is dropped after the commit """
+    transaction.on_commit(lambda: drop_cached_user(instance.pk))
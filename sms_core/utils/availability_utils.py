@@ -0,0 +1,142 @@
+""" Availability of devices: incremental rollups of status events """
+
+
+import datetime
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from sms_core.models import Device, StatusEvent, AvailabilityRollup, RollupWatermark
+
+
+WATERMARK_NAME = 'availability'
+HOUR = datetime.timedelta(hours=1)
+
+
+def truncate_time(time: datetime.datetime, period: str) -> datetime.datetime:
+    """ The start of the hour or the day (UTC) of the time """
+    time = time.astimezone(datetime.timezone.utc).replace(minute=0, second=0, microsecond=0)
+    if period == 'day':
+        time = time.replace(hour=0)
+    return time
+
+
+def add_segment(totals: dict, device_id: int, start: datetime.datetime,
+                end: datetime.datetime, status: bool) -> None:
+    """
+    Adding a time segment of a device in one status to totals of hours and days.
+    `totals` - {(device id, period, period start): [up seconds, seconds]}
+    """
+    while start < end:
+        hour = truncate_time(start, 'hour')
+        chunk_end = min(end, hour + HOUR)
+        seconds = (chunk_end - start).total_seconds()
+        for key in ((device_id, 'hour', hour), (device_id, 'day', truncate_time(hour, 'day'))):
+            totals[key][0] += seconds if status else 0
+            totals[key][1] += seconds
+        start = chunk_end
+
+
+def write_rollups(totals: dict, page_size=1000) -> None:
+    """ Adding totals to availability rollups with one upsert per page of rows """
+    table = AvailabilityRollup._meta.db_table
+    rows = [(*key, up_seconds, seconds) for key, (up_seconds, seconds) in totals.items()]
+    with connection.cursor() as cursor:
+        for i in range(0, len(rows), page_size):
+            page = rows[i:i + page_size]
+            cursor.execute(
+                f'INSERT INTO "{table}"'
+                ' ("device_id", "period", "period_start", "up_seconds", "seconds")'
+                f' VALUES {", ".join(["(%s, %s, %s, %s, %s)"] * len(page))}'
+                ' ON CONFLICT ("device_id", "period", "period_start") DO UPDATE SET'
+                f' "up_seconds" = "{table}"."up_seconds" + EXCLUDED."up_seconds",'
+                f' "seconds" = "{table}"."seconds" + EXCLUDED."seconds"',
+                [value for row in page for value in row]
+            )
+
+
+def rollup_availability(now=None) -> int:
+    """
+    Adding the time from the watermark until AVAILABILITY_ROLLUP_LAG seconds ago
+    to hourly and daily availability of every device. A device without status
+    events in the time kept its status the whole time.
+
+    Ids of events are taken at insert, but batches commit in any order, so
+    events are read by time. Events of the last AVAILABILITY_ROLLUP_LAG seconds
+    may be uncommitted yet, their time is rolled up by the next run.
+    Returns the number of processed events.
+    """
+    now = now or timezone.now()
+    settled = now - datetime.timedelta(seconds=settings.AVAILABILITY_ROLLUP_LAG)
+    with transaction.atomic():
+        watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(
+            name=WATERMARK_NAME, defaults={'time': settled}
+        )
+        start = watermark.time
+        if settled <= start:
+            return 0
+
+        # Statuses are read before events: a status changed meanwhile comes
+        # with its event, and a device without events kept its status.
+        devices = list(Device.objects.values_list('id', 'status', 'created_at'))
+        events = defaultdict(list)
+        # The first status of devices after the settled time
+        later_statuses = {}
+        last_event_id = watermark.event_id
+        for event_id, device_id, time, status in StatusEvent.objects.filter(
+                time__gt=start
+        ).order_by('time', 'pk').values_list('pk', 'device_id', 'time', 'status').iterator():
+            if time <= settled:
+                events[device_id].append((time, status))
+                last_event_id = max(last_event_id, event_id)
+            else:
+                later_statuses.setdefault(device_id, status)
+
+        totals = defaultdict(lambda: [0.0, 0.0])
+        for device_id, status, created_at in devices:
+            device_events = events.get(device_id, ())
+            # Events are changes, so a device had the opposite status before the first one
+            if device_events:
+                status = not device_events[0][1]
+            elif device_id in later_statuses:
+                status = not later_statuses[device_id]
+            segment_start = max(start, created_at)
+            for time, new_status in device_events:
+                add_segment(totals, device_id, segment_start, time, status)
+                segment_start, status = max(segment_start, time), new_status
+            add_segment(totals, device_id, segment_start, settled, status)
+
+        if totals:
+            write_rollups(totals)
+        hourly_retention = datetime.timedelta(days=settings.AVAILABILITY_HOURLY_RETENTION_DAYS)
+        AvailabilityRollup.objects.filter(
+            period='hour', period_start__lt=now - hourly_retention
+        ).delete()
+        # The last rolled up event is kept for reference, the time is the watermark
+        watermark.event_id = last_event_id
+        watermark.time = settled
+        watermark.save()
+    return sum(len(device_events) for device_events in events.values())
+
+
+def get_availability(days=30, devices=None, now=None) -> dict:
+    """
+    Availability of devices in percent for the last days by daily rollups.
+    Returns {device id: availability}
+    """
+    now = now or timezone.now()
+    rollups = AvailabilityRollup.objects.filter(
+        period='day',
+        period_start__gte=truncate_time(now - datetime.timedelta(days=days - 1), 'day')
+    )
+    if devices is not None:
+        rollups = rollups.filter(device__in=devices)
+    return {
+        item['device_id']: 100 * item['up_seconds'] / item['seconds']
+        for item in rollups.values('device_id').annotate(
+            up_seconds=Sum('up_seconds'), seconds=Sum('seconds')
+        ).order_by() if item['seconds']
+    }
@@ -0,0 +1,157 @@
+""" Rendered device cards of the overview page cached in Redis """
+
+
+import json
+from collections import namedtuple
+from urllib.parse import quote
+
+import redis
+from django.conf import settings
+from django.db.models import Count, Q
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.http import RFC3986_SUBDELIMS
+from django.utils.safestring import mark_safe
+
+from .counters_utils import get_version
+from .redis_utils import get_redis
+
+
+CARD_KEY = 'sms:cards'
+CARDS_TEMPLATE = 'sms_core/sms_device_cards.html'
+# Cards are rendered in one pass and split by a character text columns never have
+CARD_SEPARATOR = '\0'
+# The name of a device in URLs reversed once per render, see device_urls
+URL_PLACEHOLDER = 'device-name'
+CARD_FIELDS = ('pk', 'name', 'status', 'last_status_changed')
+# Keys per MGET and SET pipeline
+CHUNK_SIZE = 1000
+
+
+class DeviceCard(namedtuple('DeviceCard', CARD_FIELDS + ('html',))):
+    """ A device of the overview page with its rendered card """
+    __slots__ = ()
+
+    def __str__(self) -> str:
+        return str(self.name)
+
+
+def card_key(row: tuple, is_staff: bool) -> str:
+    """
+    The key of a card made of everything shown on it, so a device gets
+    a new card when its status or name changes and old ones expire.
+    """
+    pk, name, status, last_status_changed = row
+    return f'{CARD_KEY}:{int(is_staff)}:{pk}:{name}:{int(status)}:{last_status_changed.timestamp()}'
+
+
+def device_urls(url_name: str, names: list) -> list:
+    """
+    URLs of devices by their names with one reverse(): names are quoted into
+    the URL of a placeholder as reverse() does. A name reverse() would not
+    accept is passed to it.
+    """
+    prefix, _, suffix = reverse(url_name, kwargs={'slug': URL_PLACEHOLDER}).rpartition(
+        URL_PLACEHOLDER
+    )
+    return [
+        reverse(url_name, kwargs={'slug': name}) if '/' in name
+        else f'{prefix}{quote(name, safe=RFC3986_SUBDELIMS + "/~:@")}{suffix}'
+        for name in names
+    ]
+
+
+def render_cards(rows: list, is_staff: bool) -> list:
+    """ Rendering cards of devices from their columns in one pass """
+    names = [row[1] for row in rows]
+    urls = device_urls('sms_core:url_device_detail', names)
+    edit_urls = device_urls('sms_core:url_device_edit', names) if is_staff else [None] * len(rows)
+    devices = [
+        dict(zip(CARD_FIELDS, row), url=url, edit_url=edit_url)
+        for row, url, edit_url in zip(rows, urls, edit_urls)
+    ]
+    html = render_to_string(
+        CARDS_TEMPLATE,
+        {'card_devices': devices, 'is_staff': is_staff, 'separator': CARD_SEPARATOR}
+    )
+    return html.split(CARD_SEPARATOR)[:-1]
+
+
+def get_cached_cards(keys: list) -> list:
+    """ Cached cards by keys, None for missing ones """
+    pipe = get_redis().pipeline(transaction=False)
+    for i in range(0, len(keys), CHUNK_SIZE):
+        pipe.mget(keys[i:i + CHUNK_SIZE])
+    return [card for chunk in pipe.execute() for card in chunk]
+
+
+def set_cached_cards(cards: dict) -> None:
+    """ Caching cards for OVERVIEW_CARD_CACHE_TIMEOUT seconds, `cards` - {key: card} """
+    items = list(cards.items())
+    for i in range(0, len(items), CHUNK_SIZE):
+        pipe = get_redis().pipeline(transaction=False)
+        for key, card in items[i:i + CHUNK_SIZE]:
+            pipe.set(key, card, ex=settings.OVERVIEW_CARD_CACHE_TIMEOUT)
+        pipe.execute()
+
+
+def card_rows(devices):
+    """ A queryset of devices with only the columns shown on their cards """
+    return devices.values_list(*CARD_FIELDS, named=True)
+
+
+def get_device_cards(rows, is_staff: bool) -> list:
+    """
+    Devices with their cards, `rows` - see card_rows. Cards are read from Redis
+    with a few round trips, only missing ones are rendered together and cached.
+    Without Redis or with OVERVIEW_CARD_CACHE_TIMEOUT = 0 all cards are rendered.
+    """
+    rows = list(rows)
+    keys = [card_key(row, is_staff) for row in rows]
+    use_cache = settings.OVERVIEW_CARD_CACHE_TIMEOUT > 0
+    cached = [None] * len(rows)
+    if use_cache and rows:
+        try:
+            cached = get_cached_cards(keys)
+        except redis.RedisError:
+            use_cache = False
+
+    missing = {key: row for row, key, card in zip(rows, keys, cached) if card is None}
+    if missing:
+        missing = dict(zip(missing, render_cards(list(missing.values()), is_staff)))
+    cards = [
+        DeviceCard(*row, mark_safe(missing[key] if card is None else card))
+        for row, key, card in zip(rows, keys, cached)
+    ]
+
+    if use_cache and missing:
+        try:
+            set_cached_cards(missing)
+        except redis.RedisError:
+            pass
+    return cards
+
+
+def get_search_summary(devices, search: str) -> dict:
+    """
+    Total and UP devices found by a search, `devices` - the found devices.
+    Summaries are cached by the version of devices, so any change of devices
+    counts them again. Without Redis or the cache they are counted every time.
+    """
+    key = None
+    if settings.OVERVIEW_CARD_CACHE_TIMEOUT > 0:
+        try:
+            key = f'{CARD_KEY}:summary:{get_version()}:{search}'
+            summary = get_redis().get(key)
+        except redis.RedisError:
+            key = summary = None
+        if summary is not None:
+            return json.loads(summary)
+
+    summary = devices.aggregate(total=Count('pk'), up=Count('pk', filter=Q(status=True)))
+    if key is not None:
+        try:
+            get_redis().set(key, json.dumps(summary), ex=settings.OVERVIEW_CARD_CACHE_TIMEOUT)
+        except redis.RedisError:
+            pass
+    return summary
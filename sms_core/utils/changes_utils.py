@@ -0,0 +1,56 @@
+""" Devices changed since a cursor: status changes by the event log, config changes by time """
+
+
+import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from sms_core.models import Device, StatusEvent
+from .pagination_utils import encode_cursor, decode_cursor
+
+
+def changes_cursor(event_id: int, time: datetime.datetime) -> str:
+    """ A cursor of the last read status event and the time of config changes """
+    return encode_cursor((event_id, time))
+
+
+def current_changes_cursor(now=None) -> str:
+    """ The cursor of changes from now on """
+    now = now or timezone.now()
+    last_event = StatusEvent.objects.order_by('-pk').values_list('pk', flat=True).first()
+    settled = now - datetime.timedelta(seconds=settings.DEVICE_CHANGES_LAG)
+    return changes_cursor(last_event or 0, settled)
+
+
+def get_changes(cursor: str, now=None) -> tuple:
+    """
+    Devices whose status or config changed after the cursor and the next cursor.
+    Raises ValueError if the cursor is broken.
+
+    Transactions commit in any order, so changes of the last DEVICE_CHANGES_LAG
+    seconds are read again by the next cursor: a device may come twice, but
+    a change committed late is not missed.
+    """
+    now = now or timezone.now()
+    event_id, time = decode_cursor(cursor, 2)
+    time = parse_datetime(time) if isinstance(time, str) else None
+    if not isinstance(event_id, int) or time is None or timezone.is_naive(time):
+        raise ValueError('The cursor is broken')
+    settled = now - datetime.timedelta(seconds=settings.DEVICE_CHANGES_LAG)
+
+    # Events are read by the primary key, the cursor moves up to the first unsettled event
+    device_ids = set()
+    next_event_id, settling = event_id, True
+    for pk, device_id, event_time in StatusEvent.objects.filter(
+            pk__gt=event_id
+    ).order_by('pk').values_list('pk', 'device_id', 'time').iterator():
+        device_ids.add(device_id)
+        settling = settling and event_time <= settled
+        if settling:
+            next_event_id = pk
+
+    devices = Device.objects.filter(Q(pk__in=device_ids) | Q(updated_at__gt=time)).order_by('pk')
+    return devices, changes_cursor(next_event_id, max(time, settled))
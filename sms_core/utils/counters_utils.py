@@ -0,0 +1,79 @@
+""" Counters of devices by status kept in Redis """
+
+
+import redis
+from django.apps import apps
+from django.db.models import Count, Q
+
+from .redis_utils import get_redis
+
+
+COUNTERS_KEY = 'sms:counters'
+COUNTERS_FIELDS = ('total', 'up', 'down')
+
+
+def added_deltas(devices: list, sign=1) -> dict:
+    """ Changes of counters by added devices, `sign` = -1 for removed devices """
+    up = sum(1 for device in devices if device.status)
+    return {'total': sign * len(devices), 'up': sign * up, 'down': sign * (len(devices) - up)}
+
+
+def status_change_deltas(devices: list) -> dict:
+    """ Changes of counters by devices that changed their status """
+    up = sum(1 if device.status else -1 for device in devices)
+    return {'up': up, 'down': -up}
+
+
+def change_counters(deltas: dict) -> bool:
+    """
+    Changing counters with one atomic transaction. Every change of devices,
+    even one that does not change counters, makes a new version of devices.
+    """
+    pipe = get_redis().pipeline()
+    for field, delta in deltas.items():
+        if delta:
+            pipe.hincrby(COUNTERS_KEY, field, delta)
+    pipe.hincrby(COUNTERS_KEY, 'version', 1)
+    try:
+        pipe.execute()
+    except redis.RedisError:
+        return False
+    return True
+
+
+def count_devices() -> dict:
+    """ Counters by the database """
+    counts = apps.get_model('sms_core', 'Device').objects.aggregate(
+        total=Count('pk'), up=Count('pk', filter=Q(status=True))
+    )
+    counts['down'] = counts['total'] - counts['up']
+    return counts
+
+
+def reconcile_counters() -> dict:
+    """
+    Replacing counters with the numbers of the database. A change that happens
+    between the count and the write is fixed by the next reconciliation.
+    """
+    counts = count_devices()
+    try:
+        get_redis().hset(COUNTERS_KEY, mapping=counts)
+    except redis.RedisError:
+        pass
+    return counts
+
+
+def get_version() -> int:
+    """ The version of devices, see change_counters """
+    return int(get_redis().hget(COUNTERS_KEY, 'version') or 0)
+
+
+def get_counters() -> dict:
+    """ Counters of devices: total, up, down. They are created by the database if missing """
+    try:
+        values = get_redis().hmget(COUNTERS_KEY, COUNTERS_FIELDS)
+    except redis.RedisError:
+        return count_devices()
+    if None in values:
+        return reconcile_counters()
+    return {field: int(value) for field, value in zip(COUNTERS_FIELDS, values)}
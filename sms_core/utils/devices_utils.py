@@ -1,38 +1,170 @@
 """ Utilities that work with devices """
 
 
+import math
+import re
 import subprocess
+import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db.models.functions import Lower
+from django.utils import timezone
+
 from sms_core.models import Device
+from .icmp_utils import PingStats, probe_hosts
+from .metrics_utils import observe_probes
+from .timeseries_utils import record_probe_results
+
+
+# Summary lines of iputils and busybox ping
+PING_PACKETS_RE = re.compile(r'(\d+) packets transmitted, (\d+) (?:packets )?received')
+PING_RTT_RE = re.compile(r'min/avg/max\S* = ([\d.]+)/([\d.]+)/([\d.]+)')
+
+
+def get_ping_options(device: object) -> tuple:
+    """ (deadline, interval) of probes of a device in seconds """
+    return (
+        device.ping_deadline or settings.PROBE_PING_DEADLINE,
+        device.ping_interval or settings.PROBE_PING_INTERVAL
+    )
+
+
+def parse_ping_output(output: str, is_up: bool) -> PingStats:
+    """
+    Getting statistics from the summary of `ping`.
+    Without the summary only the result of ping is known.
+    """
+    packets = PING_PACKETS_RE.search(output or '')
+    if packets is None:
+        return PingStats(1, int(is_up), None, None, None)
+    rtt = PING_RTT_RE.search(output)
+    if rtt is None:
+        return PingStats(int(packets.group(1)), int(packets.group(2)), None, None, None)
+    return PingStats(int(packets.group(1)), int(packets.group(2)), *map(float, rtt.groups()))
+
+
+def device_probe(device: object, count='3') -> PingStats:
+    """
+    Synchronous ping of a device.
+    In the 'fast' mode ping exits at the first reply and spends
+    the whole deadline only on a device that does not answer.
+    """
+    if settings.PROBE_PING_MODE == 'fast':
+        deadline, interval = get_ping_options(device)
+        command = ['ping', '-c', '1', '-w', str(deadline), '-i', str(interval), device.ip_fqdn]
+    else:
+        command = ['ping', '-c', count, device.ip_fqdn]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                            universal_newlines=True)
+    return parse_ping_output(result.stdout, result.returncode == 0)
 
 
 def device_ping(device: object, count='3') -> object:
-    """ Synchronous ping of a device """
-    result = subprocess.run(['ping', '-c', count, device.ip_fqdn])
-    if result.returncode == 0:
+    """ Synchronous ping of a device. Returns the device if it answers """
+    if device_probe(device, count=count).received:
         return device
 
 
-def check_device_status(devices_list: list, workers_limit=5) -> None:
+def get_devices(devices_list: list) -> list:
+    """
+    Getting a batch of devices by their names, the case of names is ignored.
+    Names are looked up by the index of names with one query, only names
+    of another case are looked up again without it.
+    """
+    devices = list(Device.objects.filter(name__in=devices_list))
+    found = {device.name.lower() for device in devices}
+    other_case = {name.lower() for name in devices_list} - found
+    if other_case:
+        devices += Device.objects.annotate(lower_name=Lower('name')).filter(
+            lower_name__in=other_case
+        )
+    return devices
+
+
+def save_devices_statuses(devices_obj_list: list, statuses: dict) -> dict:
+    """
+    Writing statuses of a batch of devices with one query.
+    Returns {device name: status}.
+    """
+    Device.objects.bulk_set_status(devices_obj_list, statuses)
+    return {device.name: device.status for device in devices_obj_list}
+
+
+def save_probe_results(devices_obj_list: list, stats: dict) -> dict:
+    """
+    Writing statuses and probe results of a batch of devices.
+    `stats` - {device name: PingStats}. Returns {device name: status}.
+    """
+    now = timezone.now()
+    results = save_devices_statuses(
+        devices_obj_list,
+        {device.name: stats[device.name].received > 0 for device in devices_obj_list}
+    )
+    record_probe_results(
+        [(device.pk, stats[device.name]) for device in devices_obj_list], time=now
+    )
+    return results
+
+
+def check_device_status(devices_list: list, workers_limit=5) -> dict:
     """
     Checking devices statuses in multiple threads
     and set the status in DB in synchronous.
     """
-    devices_obj_list = []
-    device_up_list = []
-    for item in devices_list:
-        devices_obj_list.append(Device.objects.get(name__iexact=item))
+    started_at = time.perf_counter()
+    devices_obj_list = get_devices(devices_list)
+    stats = {}
 
     with ThreadPoolExecutor(max_workers=workers_limit) as executor:
         future_ping = {
-            executor.submit(device_ping, device): device for device in devices_obj_list
+            executor.submit(device_probe, device): device for device in devices_obj_list
         }
         for future in as_completed(future_ping):
-            device_up_list. append(future.result())
-
-    if device_up_list:
-        for device in devices_obj_list:
-            if device in device_up_list:
-                device.set_status(True)
-            else:
-                device.set_status(False)
+            stats[future_ping[future].name] = future.result()
+
+    results = save_probe_results(devices_obj_list, stats)
+    observe_probes('subprocess', stats, time.perf_counter() - started_at)
+    return results
+
+
+def check_device_status_icmp(devices_list: list) -> dict:
+    """
+    Checking devices statuses with the asynchronous ICMP probe engine
+    and set the status in DB in synchronous.
+    """
+    started_at = time.perf_counter()
+    devices_obj_list = get_devices(devices_list)
+
+    # Devices with their own deadline or interval: an echo request
+    # every interval until the deadline.
+    options = {}
+    for device in devices_obj_list:
+        if device.ping_deadline or device.ping_interval:
+            deadline, interval = get_ping_options(device)
+            options[device.ip_fqdn] = (interval, max(math.ceil(deadline / interval), 1))
+
+    results = probe_hosts(
+        [device.ip_fqdn for device in devices_obj_list],
+        timeout=settings.PROBE_ICMP_TIMEOUT,
+        count=settings.PROBE_ICMP_COUNT,
+        concurrency=settings.PROBE_ICMP_CONCURRENCY,
+        options=options
+    )
+
+    stats = {device.name: results[device.ip_fqdn] for device in devices_obj_list}
+    results = save_probe_results(devices_obj_list, stats)
+    observe_probes('icmp', stats, time.perf_counter() - started_at)
+    return results
+
+
+def check_devices(devices_list: list, workers_limit=5) -> dict:
+    """
+    Checking devices statuses with the probe engine chosen by the PROBE_ENGINE setting:
+    'subprocess' - a `ping` process per device in a thread pool,
+    'icmp' - the asynchronous ICMP probe engine.
+    Returns {device name: status}.
+    """
+    if settings.PROBE_ENGINE == 'icmp':
+        return check_device_status_icmp(devices_list)
+    return check_device_status(devices_list, workers_limit=workers_limit)
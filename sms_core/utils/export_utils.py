@@ -0,0 +1,92 @@
+""" Streaming export of devices and status events as NDJSON or CSV """
+
+
+import csv
+import datetime
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.utils.text import compress_sequence
+
+from sms_core.models import Device, StatusEvent
+
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+CONTENT_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv', 'gzip': 'application/gzip'}
+# Fields of the devices API
+DEVICE_FIELDS = (
+    'id', 'name', 'ip_fqdn', 'description', 'status', 'last_status_changed', 'check_interval',
+    'ping_deadline', 'ping_interval', 'created_at', 'updated_at'
+)
+EVENT_FIELDS = ('id', 'device', 'device_name', 'time', 'status')
+ENCODER = DjangoJSONEncoder()
+
+
+def device_rows() -> tuple:
+    """ Fields and rows of all devices ordered by id """
+    return DEVICE_FIELDS, Device.objects.order_by('pk').values_list(*DEVICE_FIELDS)
+
+
+def event_rows(since=None, until=None) -> tuple:
+    """ Fields and rows of status events of a time range ordered by id """
+    events = StatusEvent.objects.annotate(device_name=F('device__name')).order_by('pk')
+    if since is not None:
+        events = events.filter(time__gte=since)
+    if until is not None:
+        events = events.filter(time__lt=until)
+    return EVENT_FIELDS, events.values_list(*EVENT_FIELDS)
+
+
+class Echo:
+    """ A file-like object that returns lines written by csv.writer """
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def csv_value(value) -> object:
+    """ A CSV value with times like in JSON """
+    if value is None:
+        return ''
+    if isinstance(value, datetime.datetime):
+        return ENCODER.default(value)
+    return value
+
+
+def export_chunks(fields: tuple, rows: object, output='ndjson', chunk_size=None) -> iter:
+    """
+    Lines of rows read by a server-side cursor and joined by chunks of
+    EXPORT_CHUNK_SIZE rows, so memory does not depend on the number of rows.
+    CSV starts with the header.
+    """
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    if output == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(fields)
+
+        def line(row: tuple) -> str:
+            return writer.writerow([csv_value(value) for value in row])
+    else:
+        def line(row: tuple) -> str:
+            return json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder) + '\n'
+    chunk = []
+    for row in rows.iterator(chunk_size=chunk_size):
+        chunk.append(line(row))
+        if len(chunk) >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def encode_chunks(chunks: iter, compress=False) -> iter:
+    """ Bytes of chunks, a gzip stream if `compress` """
+    chunks = (chunk.encode() for chunk in chunks)
+    return compress_sequence(chunks) if compress else chunks
+
+
+def export_filename(name: str, output: str, compress=False) -> str:
+    """ A file name of an export """
+    return f'{name}.{output}.gz' if compress else f'{name}.{output}'
@@ -0,0 +1,238 @@
+""" Asynchronous ICMP echo probe engine """
+
+
+import asyncio
+import ipaddress
+import itertools
+import os
+import socket
+import struct
+import time
+from collections import namedtuple
+
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+ICMP_HEADER = struct.Struct('!BBHHH')
+ICMP_PAYLOAD = b'simple-monitoring-system'
+SOCKET_BUFFER_SIZE = 4 * 1024 * 1024
+
+
+class PingStats(namedtuple('PingStats', 'sent received rtt_min rtt_avg rtt_max')):
+    """ Echo requests sent to a host, replies received and round-trip times in ms """
+
+    __slots__ = ()
+
+    @property
+    def loss(self) -> int:
+        """ Packet loss in percent """
+        if not self.sent:
+            return 100
+        return round(100 * (self.sent - self.received) / self.sent)
+
+
+def icmp_checksum(data: bytes) -> int:
+    """ The Internet checksum (RFC 1071) of the data """
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def build_echo_request(ident: int, seq: int, payload=ICMP_PAYLOAD) -> bytes:
+    """ Build an ICMP echo request packet """
+    header = ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    checksum = icmp_checksum(header + payload)
+    return ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, checksum, ident, seq) + payload
+
+
+def parse_echo_reply(packet: bytes, has_ip_header=False) -> tuple:
+    """
+    Get (identifier, sequence number) of an ICMP echo reply packet.
+    Returns None if the packet is not an echo reply.
+    """
+    if has_ip_header:
+        packet = packet[(packet[0] & 0x0f) * 4:]
+    if len(packet) < ICMP_HEADER.size:
+        return None
+    icmp_type, _, _, ident, seq = ICMP_HEADER.unpack(packet[:ICMP_HEADER.size])
+    if icmp_type != ICMP_ECHO_REPLY:
+        return None
+    return ident, seq
+
+
+def open_icmp_socket() -> tuple:
+    """
+    Open a non-blocking ICMP socket.
+    An unprivileged datagram socket is preferred, a raw socket is a fallback.
+    Returns (socket, is_raw).
+    """
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+        is_raw = False
+    except PermissionError:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+        is_raw = True
+    sock.setblocking(False)
+    for option in (socket.SO_SNDBUF, socket.SO_RCVBUF):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, option, SOCKET_BUFFER_SIZE)
+        except OSError:
+            pass
+    return sock, is_raw
+
+
+class IcmpProber:
+    """
+    Sends ICMP echo requests and receives replies for many hosts
+    over a single socket driven by one asyncio event loop.
+    """
+
+    def __init__(self, timeout=1.0, count=3, concurrency=2000):
+        self.timeout = timeout
+        self.count = count
+        self.concurrency = concurrency
+        self._loop = None
+        self._socket = None
+        self._is_raw = False
+        self._semaphore = None
+        # Datagram sockets get the identifier from the kernel,
+        # for raw sockets we use our own one to filter foreign replies.
+        self._ident = os.getpid() & 0xffff
+        self._sequence = itertools.count()
+        # (address, sequence number) -> future of a reply
+        self._waiters = {}
+
+    async def __aenter__(self) -> object:
+        self.open()
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        self.close()
+
+    def open(self) -> None:
+        """ Open the socket and start reading replies """
+        self._loop = asyncio.get_running_loop()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._socket, self._is_raw = open_icmp_socket()
+        self._loop.add_reader(self._socket.fileno(), self._read_replies)
+
+    def close(self) -> None:
+        """ Stop reading replies and close the socket """
+        if self._socket is not None:
+            self._loop.remove_reader(self._socket.fileno())
+            self._socket.close()
+            self._socket = None
+        for future in self._waiters.values():
+            future.cancel()
+        self._waiters.clear()
+
+    def _read_replies(self) -> None:
+        while True:
+            try:
+                packet, address = self._socket.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            reply = parse_echo_reply(packet, has_ip_header=self._is_raw)
+            if reply is None:
+                continue
+            ident, seq = reply
+            if self._is_raw and ident != self._ident:
+                continue
+            future = self._waiters.pop((address[0], seq), None)
+            if future is not None and not future.done():
+                future.set_result(time.monotonic())
+
+    async def _send(self, packet: bytes, address: str) -> None:
+        while True:
+            try:
+                self._socket.sendto(packet, (address, 0))
+                return
+            except (BlockingIOError, InterruptedError):
+                # The send buffer is full, let the replies drain it.
+                await asyncio.sleep(0.005)
+
+    async def _resolve(self, host: str) -> str:
+        try:
+            return str(ipaddress.IPv4Address(host))
+        except ValueError:
+            pass
+        try:
+            addresses = await self._loop.getaddrinfo(
+                host, None, family=socket.AF_INET, type=socket.SOCK_RAW
+            )
+        except (socket.gaierror, UnicodeError):
+            return None
+        return addresses[0][4][0] if addresses else None
+
+    async def probe(self, host: str, timeout=None, count=None) -> PingStats:
+        """
+        Ping the host up to `count` times waiting `timeout` seconds for each reply.
+        Stops at the first echo reply.
+        """
+        timeout = timeout or self.timeout
+        sent = 0
+        async with self._semaphore:
+            address = await self._resolve(host)
+            if address is None:
+                return PingStats(sent, 0, None, None, None)
+            for _ in range(count or self.count):
+                seq = next(self._sequence) & 0xffff
+                key = (address, seq)
+                future = self._loop.create_future()
+                self._waiters[key] = future
+                try:
+                    sent_at = time.monotonic()
+                    await self._send(build_echo_request(self._ident, seq), address)
+                    sent += 1
+                    received_at = await asyncio.wait_for(future, timeout)
+                    rtt = (received_at - sent_at) * 1000
+                    return PingStats(sent, 1, rtt, rtt, rtt)
+                except asyncio.TimeoutError:
+                    continue
+                except OSError:
+                    break
+                finally:
+                    self._waiters.pop(key, None)
+            return PingStats(sent, 0, None, None, None)
+
+    async def ping(self, host: str, timeout=None, count=None) -> bool:
+        """ Returns True if the host answers """
+        stats = await self.probe(host, timeout=timeout, count=count)
+        return stats.received > 0
+
+
+async def async_probe_hosts(hosts: list, timeout=1.0, count=3, concurrency=2000,
+                            options=None) -> dict:
+    """
+    Probe all hosts concurrently. `options` - {host: (timeout, count)} for hosts
+    that don't use the common ones. Returns {host: PingStats}
+    """
+    hosts = list(dict.fromkeys(hosts))
+    options = options or {}
+    async with IcmpProber(timeout=timeout, count=count, concurrency=concurrency) as prober:
+        results = await asyncio.gather(
+            *(prober.probe(host, *options.get(host, ())) for host in hosts)
+        )
+    return dict(zip(hosts, results))
+
+
+def probe_hosts(hosts: list, timeout=1.0, count=3, concurrency=2000, options=None) -> dict:
+    """ Synchronous entry point of the probe engine. Returns {host: PingStats} """
+    return asyncio.run(
+        async_probe_hosts(
+            hosts, timeout=timeout, count=count, concurrency=concurrency, options=options
+        )
+    )
+
+
+def ping_hosts(hosts: list, timeout=1.0, count=3, concurrency=2000, options=None) -> dict:
+    """ Returns {host: reachable} """
+    results = probe_hosts(
+        hosts, timeout=timeout, count=count, concurrency=concurrency, options=options
+    )
+    return {host: stats.received > 0 for host, stats in results.items()}
@@ -0,0 +1,167 @@
+""" Import of devices by chunks with validation of whole chunks """
+
+
+import csv
+import json
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from sms_core.models import Device
+
+
+# Fields of imported devices, other fields of rows (e.g. of an export) are skipped
+IMPORT_FIELDS = (
+    'name', 'ip_fqdn', 'description', 'check_interval', 'ping_deadline', 'ping_interval'
+)
+
+
+def read_csv(stream) -> iter:
+    """ Rows of a CSV file with a header, empty values are defaults """
+    for row in csv.DictReader(stream):
+        yield {field: value for field, value in row.items() if value not in ('', None)}
+
+
+def read_ndjson(stream) -> iter:
+    """ Rows of a file with a JSON object per line """
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_json(stream) -> iter:
+    """ Rows of a JSON list or of the "devices" list of an object. The file is read at once """
+    data = json.load(stream)
+    if isinstance(data, dict):
+        data = data.get('devices')
+    if not isinstance(data, list):
+        raise ValueError('A list of devices is expected')
+    yield from data
+
+
+def read_yaml(stream) -> iter:
+    """ Rows of YAML documents of lists of devices, a document is read at once """
+    try:
+        import yaml
+    except ImportError:
+        raise ValueError('PyYAML is required to read YAML files')
+    try:
+        for document in yaml.safe_load_all(stream):
+            if isinstance(document, dict):
+                document = document.get('devices')
+            if not isinstance(document, list):
+                raise ValueError('A list of devices is expected')
+            yield from document
+    except yaml.YAMLError as error:
+        raise ValueError(str(error))
+
+
+READERS = {'csv': read_csv, 'ndjson': read_ndjson, 'json': read_json, 'yaml': read_yaml}
+
+
+def chunked(rows: iter, size: int) -> iter:
+    """ Lists of `size` rows of an iterator """
+    rows = iter(rows)
+    chunk = list(islice(rows, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(rows, size))
+
+
+def clean_row(row: object, user: object) -> Device:
+    """ A device of a row validated by fields of the model without queries """
+    if not isinstance(row, dict):
+        raise ValidationError('An object of device fields is expected')
+    device = Device(updated_by=user, **{field: row[field] for field in IMPORT_FIELDS if field in row})
+    device.clean_fields(exclude=['updated_by'])
+    if device.name.lower() in Device.RESERVED_NAMES:
+        raise ValidationError({'name': ['Please, use other name']})
+    return device
+
+
+def error_text(error: ValidationError) -> str:
+    """ A line of messages of a validation error """
+    if hasattr(error, 'error_dict'):
+        return '; '.join(
+            f'{field}: {" ".join(messages)}' for field, messages in error.message_dict.items()
+        )
+    return ' '.join(error.messages)
+
+
+class DeviceImport:
+    """
+    An import of devices: new devices are created and devices with known names are
+    updated by chunks. A chunk is checked for taken names and IPs with two queries
+    and written with one transaction. Names and IPs are tracked over the whole import.
+    """
+
+    def __init__(self, user: object, dry_run=False):
+        self.user = user
+        self.dry_run = dry_run
+        self.names, self.ips = set(), set()
+        # Names of created devices
+        self.created = []
+        self.updated = 0
+        # (row number, message)
+        self.errors = []
+
+    def import_rows(self, rows: iter, chunk_size=1000) -> None:
+        for index, chunk in enumerate(chunked(rows, chunk_size)):
+            self.import_chunk(chunk, index * chunk_size + 1)
+
+    def import_chunk(self, rows: list, first_row: int) -> None:
+        valid = []
+        for number, row in enumerate(rows, first_row):
+            try:
+                device = clean_row(row, self.user)
+            except ValidationError as error:
+                self.errors.append((number, error_text(error)))
+                continue
+            if device.name in self.names or device.ip_fqdn in self.ips:
+                self.errors.append((number, 'The name or the IP / FQDN is repeated in the file'))
+                continue
+            self.names.add(device.name)
+            self.ips.add(device.ip_fqdn)
+            valid.append((number, row, device))
+
+        existing = Device.objects.in_bulk([device.name for _, _, device in valid], field_name='name')
+        ip_owners = dict(
+            Device.objects.filter(ip_fqdn__in=[device.ip_fqdn for _, _, device in valid])
+            .values_list('ip_fqdn', 'name')
+        )
+        new, changed, numbers = [], [], []
+        for number, row, device in valid:
+            owner = ip_owners.get(device.ip_fqdn)
+            if owner is not None and owner != device.name:
+                self.errors.append((number, f'ip_fqdn: The IP / FQDN is taken by "{owner}"'))
+                continue
+            numbers.append(number)
+            if device.name in existing:
+                # Fields missing in the row are kept
+                old_device = existing[device.name]
+                for field in IMPORT_FIELDS:
+                    if field in row:
+                        setattr(old_device, field, getattr(device, field))
+                old_device.updated_by, old_device.updated_at = self.user, timezone.now()
+                changed.append(old_device)
+            else:
+                new.append(device)
+        self.write(new, changed, numbers)
+
+    def write(self, new: list, changed: list, numbers: list) -> None:
+        """ Writing devices of a chunk with one transaction, `numbers` - their rows """
+        try:
+            with transaction.atomic():
+                new = Device.objects.bulk_add(new, batch_size=1000)
+                Device.objects.bulk_update(
+                    changed, IMPORT_FIELDS + ('updated_by', 'updated_at'), batch_size=1000
+                )
+                transaction.set_rollback(self.dry_run)
+        except IntegrityError as error:
+            # Devices changed by others after the check
+            self.errors.extend((number, str(error).strip()) for number in numbers)
+            return
+        self.created.extend(device.name for device in new)
+        self.updated += len(changed)
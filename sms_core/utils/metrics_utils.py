@@ -0,0 +1,286 @@
+"""
+Metrics of probes, the check loop and views in the Prometheus format.
+Samples of all processes, gunicorn and Celery workers, are kept in Redis:
+a hash per metric with a field per labels and sample, so /metrics of any
+process shows the totals. Metrics are never a reason for a check to fail,
+errors of Redis are ignored.
+"""
+
+
+import bisect
+import json
+import math
+
+import redis
+from django.conf import settings
+from prometheus_client.core import (
+    CollectorRegistry, CounterMetricFamily, GaugeMetricFamily, HistogramMetricFamily
+)
+
+from .counters_utils import get_counters
+from .redis_utils import get_redis
+from .runs_utils import get_run_stats
+
+
+METRICS_KEY = 'sms:metrics'
+# Buckets of durations in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+RTT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+# Gauges of statistics of the last loop run, see save_run_stats
+LOOP_RUN_GAUGES = {
+    'duration': ('sms_loop_last_run_duration_seconds', 'Seconds of the last loop run'),
+    'overrun': ('sms_loop_last_run_overrun_seconds', 'Seconds the last loop run took too long'),
+    'checked': ('sms_loop_last_run_checked_devices', 'Devices checked by the last loop run'),
+    'down': ('sms_loop_last_run_down_devices', 'Devices down by the last loop run'),
+    'errors': ('sms_loop_last_run_error_devices', 'Devices not checked by the last loop run'),
+}
+
+METRICS = []
+
+
+def execute(pipe: object) -> bool:
+    """ Writing updates of metrics queued to the pipeline """
+    try:
+        pipe.execute()
+    except redis.RedisError:
+        return False
+    return True
+
+
+class Metric:
+    """
+    A metric shared by processes. Updates take labels as keyword arguments
+    and are written at once, or queued to `pipe` to write several metrics
+    with one round trip, see execute.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        METRICS.append(self)
+
+    @property
+    def key(self) -> str:
+        return f'{METRICS_KEY}:{self.name}'
+
+    def field(self, labels: dict, sample: str) -> str:
+        """ A field of the hash: label values in the order of label names and the sample """
+        return json.dumps([str(labels[name]) for name in self.labelnames] + [sample])
+
+    def write(self, pipe: object, queue) -> bool:
+        """ Queuing updates by `queue(pipe)`, they are written if there is no common pipeline """
+        if not settings.METRICS_ENABLED:
+            return False
+        if pipe is not None:
+            queue(pipe)
+            return True
+        pipe = get_redis().pipeline(transaction=False)
+        queue(pipe)
+        return execute(pipe)
+
+    def samples(self, fields: dict) -> dict:
+        """ {label values: {sample: value}} of fields of the hash """
+        samples = {}
+        for field, value in fields.items():
+            *values, sample = json.loads(field)
+            samples.setdefault(tuple(values), {})[sample] = float(value)
+        return samples
+
+    def family(self, fields: dict) -> object:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """ A value that only grows, e.g. probes or changes of statuses """
+
+    def inc(self, amount=1, pipe=None, **labels) -> bool:
+        if not amount:
+            return False
+        return self.write(
+            pipe, lambda pipe: pipe.hincrbyfloat(self.key, self.field(labels, 'total'), amount)
+        )
+
+    def family(self, fields: dict) -> object:
+        family = CounterMetricFamily(self.name, self.documentation, labels=self.labelnames)
+        for values, samples in sorted(self.samples(fields).items()):
+            family.add_metric(values, samples['total'])
+        return family
+
+
+class Gauge(Metric):
+    """ The last value set by any process, e.g. overdue devices of the last loop run """
+
+    def set(self, value: float, pipe=None, **labels) -> bool:
+        return self.write(
+            pipe, lambda pipe: pipe.hset(self.key, self.field(labels, 'value'), value)
+        )
+
+    def family(self, fields: dict) -> object:
+        family = GaugeMetricFamily(self.name, self.documentation, labels=self.labelnames)
+        for values, samples in sorted(self.samples(fields).items()):
+            family.add_metric(values, samples['value'])
+        return family
+
+
+class Histogram(Metric):
+    """
+    Observations counted by buckets of upper bounds, e.g. durations.
+    Buckets are kept as they are and summed up for the exposition.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value: float, pipe=None, **labels) -> bool:
+        return self.observe_many([value], pipe=pipe, **labels)
+
+    def observe_many(self, values: list, pipe=None, **labels) -> bool:
+        """ Observations of a batch, e.g. round trip times of probes, with one update """
+        if not values:
+            return False
+        counts = {}
+        for value in values:
+            bucket = self.buckets[bisect.bisect_left(self.buckets, value)]
+            counts[bucket] = counts.get(bucket, 0) + 1
+
+        def queue(pipe: object) -> None:
+            for bucket, count in counts.items():
+                pipe.hincrby(self.key, self.field(labels, bucket_bound(bucket)), count)
+            pipe.hincrby(self.key, self.field(labels, 'count'), len(values))
+            pipe.hincrbyfloat(self.key, self.field(labels, 'sum'), sum(values))
+
+        return self.write(pipe, queue)
+
+    def family(self, fields: dict) -> object:
+        family = HistogramMetricFamily(self.name, self.documentation, labels=self.labelnames)
+        for values, samples in sorted(self.samples(fields).items()):
+            buckets, total = [], 0
+            for bucket in self.buckets:
+                total += samples.get(bucket_bound(bucket), 0)
+                buckets.append((bucket_bound(bucket), total))
+            family.add_metric(values, buckets, samples.get('sum', 0))
+        return family
+
+
+def bucket_bound(bucket: float) -> str:
+    """ The `le` label of a bucket """
+    return '+Inf' if bucket == math.inf else repr(float(bucket))
+
+
+PROBES = Counter(
+    'sms_probes', 'Probes of devices by the engine and the result', ('engine', 'result')
+)
+PROBE_RTT = Histogram(
+    'sms_probe_rtt_seconds', 'Round trip times of answered probes', ('engine',),
+    buckets=RTT_BUCKETS
+)
+CHECK_BATCH_DURATION = Histogram(
+    'sms_check_batch_duration_seconds',
+    'Checks of batches of devices: probes and writes of results', ('engine',)
+)
+CHECK_LAG = Histogram(
+    'sms_check_lag_seconds', 'Seconds devices were claimed for a check after they were due'
+)
+CHECK_RUN_DURATION = Histogram(
+    'sms_check_run_duration_seconds', 'Check runs from the dispatch to the last batch', ('run',)
+)
+CHECK_RUN_OVERRUN = Counter(
+    'sms_check_run_overrun_seconds', 'Seconds check runs took longer than their budget',
+    ('run',)
+)
+LOOP_DURATION = Histogram(
+    'sms_loop_duration_seconds',
+    'Runs of the monitoring loop task: reconciliation, claims and dispatch of checks'
+)
+OVERDUE_DEVICES = Gauge(
+    'sms_scheduler_overdue_devices',
+    'Devices due more than a loop run ago at the start of the last loop run'
+)
+STATUS_CHANGES = Counter(
+    'sms_status_changes', 'Changes of statuses of devices by the new status', ('status',)
+)
+REQUEST_DURATION = Histogram(
+    'sms_http_request_duration_seconds', 'Responses by the view',
+    ('view', 'method')
+)
+RESPONSES = Counter(
+    'sms_http_responses', 'Responses by the view and the status code',
+    ('view', 'method', 'status')
+)
+
+
+def observe_probes(engine: str, stats: dict, duration: float) -> bool:
+    """ Metrics of a checked batch, `stats` - {device name: PingStats} """
+    up = sum(1 for device_stats in stats.values() if device_stats.received)
+    pipe = get_redis().pipeline(transaction=False)
+    PROBES.inc(up, pipe=pipe, engine=engine, result='up')
+    PROBES.inc(len(stats) - up, pipe=pipe, engine=engine, result='down')
+    PROBE_RTT.observe_many([
+        device_stats.rtt_avg / 1000 for device_stats in stats.values()
+        if device_stats.rtt_avg is not None
+    ], pipe=pipe, engine=engine)
+    CHECK_BATCH_DURATION.observe(duration, pipe=pipe, engine=engine)
+    return execute(pipe)
+
+
+def observe_run(run: str, stats: dict) -> bool:
+    """ Metrics of a finished check run, `stats` - see aggregate_run_stats """
+    pipe = get_redis().pipeline(transaction=False)
+    CHECK_RUN_DURATION.observe(stats['duration'], pipe=pipe, run=run)
+    CHECK_RUN_OVERRUN.inc(stats['overrun'], pipe=pipe, run=run)
+    return execute(pipe)
+
+
+def count_status_changes(devices: list) -> bool:
+    """ Metrics of devices that changed their status """
+    up = sum(1 for device in devices if device.status)
+    pipe = get_redis().pipeline(transaction=False)
+    STATUS_CHANGES.inc(up, pipe=pipe, status='up')
+    STATUS_CHANGES.inc(len(devices) - up, pipe=pipe, status='down')
+    return execute(pipe)
+
+
+class MetricsCollector:
+    """
+    Samples of all metrics with one round trip to Redis and gauges of
+    the current state: devices by status and the last run of the loop
+    """
+
+    def collect(self):
+        pipe = get_redis().pipeline(transaction=False)
+        for metric in METRICS:
+            pipe.hgetall(metric.key)
+        try:
+            hashes = pipe.execute()
+        except redis.RedisError:
+            hashes = [{}] * len(METRICS)
+        for metric, fields in zip(METRICS, hashes):
+            yield metric.family(fields)
+
+        counters = get_counters()
+        devices = GaugeMetricFamily('sms_devices', 'Devices by status', labels=('status',))
+        for status in ('up', 'down'):
+            devices.add_metric((status,), counters[status])
+        yield devices
+
+        try:
+            stats = get_run_stats('loop')
+        except redis.RedisError:
+            stats = {}
+        for field, (name, documentation) in LOOP_RUN_GAUGES.items():
+            if field in stats:
+                yield GaugeMetricFamily(name, documentation, value=stats[field])
+
+
+def metrics_registry() -> CollectorRegistry:
+    """ A registry of the exposition, metrics of this process alone are not included """
+    registry = CollectorRegistry(auto_describe=False)
+    registry.register(MetricsCollector())
+    return registry
+
+
+def clear_metrics() -> None:
+    """ Dropping samples of all metrics """
+    get_redis().delete(*(metric.key for metric in METRICS))
@@ -0,0 +1,71 @@
+""" Keyset pagination: pages are read after the last row of the previous page """
+
+
+import base64
+import datetime
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    Datetimes keep microseconds: DjangoJSONEncoder cuts them to milliseconds,
+    and rows changed within a millisecond would be skipped by the next page.
+    """
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            value = o.isoformat()
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+        return super().default(o)
+
+
+def encode_cursor(values: tuple) -> str:
+    """ An opaque cursor of values of the ordering fields of a row """
+    data = json.dumps(list(values), cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, length: int) -> list:
+    """ Values of a cursor, raises ValueError if the cursor is broken """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (TypeError, ValueError) as error:
+        raise ValueError('The cursor is broken') from error
+    if not isinstance(values, list) or len(values) != length:
+        raise ValueError('The cursor is broken')
+    return values
+
+
+def keyset_filter(ordering: tuple, values: list) -> Q:
+    """
+    Rows after the row with `values` of the ordering fields,
+    `ordering` - field names, '-' for a descending order, unique together.
+    (a, b) > (x, y) is a > x OR (a = x AND b > y)
+    """
+    condition = Q()
+    for i in reversed(range(len(ordering))):
+        field = ordering[i].lstrip('-')
+        lookup = 'lt' if ordering[i].startswith('-') else 'gt'
+        equal = {ordering[j].lstrip('-'): values[j] for j in range(i)}
+        condition = Q(**equal, **{f'{field}__{lookup}': values[i]}) | condition
+    return condition
+
+
+def keyset_page(queryset, ordering: tuple, size: int, cursor=None) -> tuple:
+    """
+    A page of the queryset ordered by `ordering` after the cursor.
+    Returns (rows, the cursor of the next page or None)
+    `queryset` must give rows with the ordering fields as attributes.
+    """
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        queryset = queryset.filter(keyset_filter(ordering, decode_cursor(cursor, len(ordering))))
+    rows = list(queryset[:size + 1])
+    if len(rows) <= size:
+        return rows, None
+    rows = rows[:size]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, field.lstrip('-')) for field in ordering)
@@ -0,0 +1,26 @@
+""" Redis connection of the application """
+
+
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+
+
+@lru_cache(maxsize=None)
+def get_redis() -> redis.Redis:
+    """ A Redis client shared by the process, it keeps a connection pool inside """
+    return redis.Redis(
+        host=settings.REDIS_HOST,
+        port=int(settings.REDIS_PORT),
+        db=int(settings.REDIS_DB_NUM),
+        decode_responses=True
+    )
+
+
+def redis_available() -> bool:
+    """ Checking that the Redis server answers """
+    try:
+        return get_redis().ping()
+    except redis.RedisError:
+        return False
@@ -0,0 +1,61 @@
+""" Batches of device checks and statistics of check runs """
+
+
+import redis
+
+from .redis_utils import get_redis
+
+
+RUN_STATS_KEY = 'sms:runs'
+BATCH_STATS_FIELDS = ('checked', 'down', 'errors')
+
+
+def split_batches(items: list, size: int) -> list:
+    """ Splitting a list into batches of a fixed size """
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def batch_stats(results: dict) -> dict:
+    """ Statistics of a checked batch, `results` - {device name: status} """
+    return {
+        'checked': len(results),
+        'down': sum(1 for status in results.values() if not status),
+        'errors': 0
+    }
+
+
+def batch_error_stats(devices_list: list) -> dict:
+    """ Statistics of a batch that could not be checked """
+    return {'checked': 0, 'down': 0, 'errors': len(devices_list)}
+
+
+def aggregate_run_stats(results: list, started_at: float, finished_at: float,
+                        budget=None) -> dict:
+    """
+    Statistics of a check run from statistics of its batches.
+    `overrun` - seconds the run took longer than its budget.
+    """
+    stats = {field: sum(result[field] for result in results) for field in BATCH_STATS_FIELDS}
+    duration = finished_at - started_at
+    stats.update({
+        'batches': len(results),
+        'started_at': started_at,
+        'duration': duration,
+        'overrun': max(duration - budget, 0) if budget is not None else 0
+    })
+    return stats
+
+
+def save_run_stats(run: str, stats: dict) -> bool:
+    """ Keeping statistics of the last run of a kind in Redis """
+    try:
+        get_redis().hset(f'{RUN_STATS_KEY}:{run}', mapping=stats)
+    except redis.RedisError:
+        return False
+    return True
+
+
+def get_run_stats(run: str) -> dict:
+    """ Statistics of the last run of a kind """
+    stats = get_redis().hgetall(f'{RUN_STATS_KEY}:{run}')
+    return {field: float(value) for field, value in stats.items()}
@@ -0,0 +1,527 @@
+""" A scheduler of device checks """
+
+
+import heapq
+import json
+import os
+import re
+import uuid
+from collections import namedtuple
+
+import redis
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .redis_utils import get_redis
+
+
+SNAPSHOT_KEY = 'sms:schedule:snapshot'
+
+
+def phase_offset(device_id: int, interval: float) -> float:
+    """
+    A deterministic offset of device checks within the interval.
+    Multiplicative hashing of ids spreads devices evenly over the interval.
+    """
+    return (device_id * 2654435761 % 2 ** 32) / 2 ** 32 * interval
+
+
+def next_slot(device_id: int, interval: float, after: float) -> float:
+    """ The first time from `after` that falls on the device's phase in the interval """
+    return after + (phase_offset(device_id, interval) - after) % interval
+
+
+def next_due_after_check(device_id: int, interval: float, due: float, now: float) -> float:
+    """
+    The due time of the check that follows the one due at `due` and done at `now`:
+    one interval later, or the first slot half an interval from now if the
+    device was late, so a late device is not checked twice in a row.
+    A device moved off its phase (see ramp_dues) returns to it.
+    """
+    return next_slot(device_id, interval, max(due, now) + interval / 2)
+
+
+def ramp_dues(due_devices: list, now: float, window: float) -> dict:
+    """
+    Spreading checks of overdue devices evenly over the ramp window,
+    the most overdue devices first. Returns {device id: due time}
+    """
+    due_devices = sorted(due_devices, key=lambda device: device.due)
+    return {
+        device.id: now + window * i / len(due_devices) for i, device in enumerate(due_devices)
+    }
+
+
+# A device whose check is due. `lateness` - seconds since the due time.
+DueDevice = namedtuple('DueDevice', ('id', 'name', 'due', 'lateness'))
+
+# The scheduler's record of a device.
+ScheduleEntry = namedtuple('ScheduleEntry', ('name', 'interval', 'due', 'version'))
+
+
+class DeviceScheduler:
+    """
+    Next-due times of device checks kept in a heap keyed by device id.
+    Checks of a device fall on its phase offset within the interval, so the
+    probes of a fleet are spread evenly in time.
+    Removed and rescheduled devices leave stale heap items behind, they are
+    skipped by version and dropped when they reach the top of the heap.
+    All times are UNIX timestamps, all intervals are in seconds.
+    """
+
+    def __init__(self):
+        self._heap = []  # [(due, device id, version)]
+        self._entries = {}  # {device id: ScheduleEntry}
+        self._version = 0
+        self._probe_rate = 0.0
+        self.reconciled_at = None
+        self.snapshot_at = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, device_id: int) -> bool:
+        return device_id in self._entries
+
+    def get(self, device_id: int) -> ScheduleEntry:
+        """ Getting the schedule entry of a device or None """
+        return self._entries.get(device_id)
+
+    def schedule(self, device_id: int, name: str, interval: float, due: float) -> None:
+        """ Adding a device or moving its next check to the `due` time """
+        self._version += 1
+        self._entries[device_id] = ScheduleEntry(name, interval, due, self._version)
+        heapq.heappush(self._heap, (due, device_id, self._version))
+        # Don't let stale items outgrow live ones.
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._compact()
+
+    def remove(self, device_id: int) -> None:
+        """ Removing a device from the schedule """
+        self._entries.pop(device_id, None)
+
+    def probe_rate(self) -> float:
+        """ Probes per second of the fleet as of the last reconciliation """
+        return self._probe_rate
+
+    def reconcile(self, devices: list, now: float) -> None:
+        """
+        Syncing the schedule with (id, name, interval) of all devices in O(N):
+        new devices are added at their next slot,
+        a shortened interval pulls the next check closer,
+        devices that are not in the list are removed.
+        """
+        seen = set()
+        probe_rate = 0.0
+        for device_id, name, interval in devices:
+            seen.add(device_id)
+            probe_rate += 1 / interval
+            entry = self._entries.get(device_id)
+            if entry is None:
+                self.schedule(device_id, name, interval, next_slot(device_id, interval, now))
+            elif entry.interval != interval or entry.name != name:
+                self.schedule(
+                    device_id, name, interval,
+                    min(entry.due, next_slot(device_id, interval, now))
+                )
+        for device_id in [device_id for device_id in self._entries if device_id not in seen]:
+            self.remove(device_id)
+        self._probe_rate = probe_rate
+        self.reconciled_at = now
+
+    def _is_live(self, item: tuple) -> bool:
+        entry = self._entries.get(item[1])
+        return entry is not None and entry.version == item[2]
+
+    def _compact(self) -> None:
+        self._heap = [item for item in self._heap if self._is_live(item)]
+        heapq.heapify(self._heap)
+
+    def next_due(self) -> float:
+        """ The earliest due time or None if the schedule is empty """
+        while self._heap and not self._is_live(self._heap[0]):
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float, tolerance=0, limit=None) -> list:
+        """
+        Taking up to `limit` devices that are due by `now + tolerance` and
+        scheduling their next checks (see next_due_after_check).
+        Returns a list of DueDevice.
+        """
+        due_devices = []
+        while self._heap and self._heap[0][0] <= now + tolerance \
+                and (limit is None or len(due_devices) < limit):
+            item = heapq.heappop(self._heap)
+            if not self._is_live(item):
+                continue
+            due, device_id, _ = item
+            due_devices.append(
+                DueDevice(device_id, self._entries[device_id].name, due, max(now - due, 0))
+            )
+        # Rescheduling after the loop, so a device is never taken twice.
+        for device in due_devices:
+            entry = self._entries[device.id]
+            self.schedule(
+                device.id, entry.name, entry.interval,
+                next_due_after_check(device.id, entry.interval, device.due, now)
+            )
+        return due_devices
+
+    def overdue(self, now: float, grace=0) -> list:
+        """
+        Devices that should have been checked more than `grace` seconds ago,
+        without taking them. Walks only the due part of the heap.
+        """
+        overdue_devices = []
+        stack = [0] if self._heap else []
+        while stack:
+            index = stack.pop()
+            due, device_id, _ = self._heap[index]
+            if due >= now - grace:
+                continue
+            if self._is_live(self._heap[index]):
+                overdue_devices.append(
+                    DueDevice(device_id, self._entries[device_id].name, due, now - due)
+                )
+            stack.extend(child for child in (2 * index + 1, 2 * index + 2)
+                         if child < len(self._heap))
+        return sorted(overdue_devices, key=lambda device: device.due)
+
+    def count_overdue(self, now: float, grace=0) -> int:
+        """ The number of devices overdue by more than `grace` seconds """
+        return len(self.overdue(now, grace))
+
+    def claim(self, now: float, tolerance=0, limit=None) -> tuple:
+        """
+        Taking due devices, the same interface as RedisDeviceScheduler.claim.
+        The process memory has a single owner, so the claim token is None.
+        """
+        return None, self.pop_due(now, tolerance=tolerance, limit=limit)
+
+    def complete(self, token: str, due_devices: list, now: float) -> None:
+        """ Next checks are scheduled by pop_due already """
+
+    def ramp(self, now: float, window: float, grace=0) -> int:
+        """
+        Spreading devices overdue by more than `grace` seconds over the window
+        (see ramp_dues). Returns the number of moved devices.
+        """
+        dues = ramp_dues(self.overdue(now, grace), now, window)
+        for device_id, due in dues.items():
+            entry = self._entries[device_id]
+            self.schedule(device_id, entry.name, entry.interval, due)
+        return len(dues)
+
+    def snapshot(self) -> list:
+        """ [(id, name, interval, due)] of all devices """
+        return [
+            (device_id, entry.name, entry.interval, entry.due)
+            for device_id, entry in self._entries.items()
+        ]
+
+    def restore(self, devices: list) -> None:
+        """ Scheduling devices of a snapshot """
+        for device_id, name, interval, due in devices:
+            self.schedule(device_id, name, interval, due)
+
+
+# Returns expired leases to the schedule and moves up to ARGV[2] devices
+# due by ARGV[1] to the leases. KEYS: due, leases, owners, devices.
+# ARGV: horizon, limit, now, lease expiry, token. Returns [id, due, meta, ...]
+CLAIM_SCRIPT = """
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[3])) do
+    local owner = redis.call('HGET', KEYS[3], id)
+    redis.call('ZREM', KEYS[2], id)
+    redis.call('HDEL', KEYS[3], id)
+    if owner and redis.call('HEXISTS', KEYS[4], id) == 1 then
+        redis.call('ZADD', KEYS[1], string.match(owner, '|(.*)$'), id)
+    end
+end
+local items = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'WITHSCORES', 'LIMIT', 0, ARGV[2])
+local result = {}
+for i = 1, #items, 2 do
+    local id, due = items[i], items[i + 1]
+    redis.call('ZREM', KEYS[1], id)
+    redis.call('ZADD', KEYS[2], ARGV[4], id)
+    redis.call('HSET', KEYS[3], id, ARGV[5] .. '|' .. due)
+    table.insert(result, id)
+    table.insert(result, due)
+    table.insert(result, redis.call('HGET', KEYS[4], id))
+end
+return result
+"""
+
+# Releases leases held by the token ARGV[1] and schedules the next checks.
+# KEYS: due, leases, owners, devices. ARGV: token, id, next due, id, next due...
+COMPLETE_SCRIPT = """
+local prefix = ARGV[1] .. '|'
+for i = 2, #ARGV, 2 do
+    local id = ARGV[i]
+    local owner = redis.call('HGET', KEYS[3], id)
+    if owner and string.sub(owner, 1, #prefix) == prefix then
+        redis.call('ZREM', KEYS[2], id)
+        redis.call('HDEL', KEYS[3], id)
+        if redis.call('HEXISTS', KEYS[4], id) == 1 then
+            redis.call('ZADD', KEYS[1], ARGV[i + 1], id)
+        end
+    end
+end
+"""
+
+# Pulls due times of scheduled devices closer. KEYS: due. ARGV: id, due, id, due...
+PULL_CLOSER_SCRIPT = """
+for i = 1, #ARGV, 2 do
+    local due = redis.call('ZSCORE', KEYS[1], ARGV[i])
+    if due and tonumber(due) > tonumber(ARGV[i + 1]) then
+        redis.call('ZADD', KEYS[1], ARGV[i + 1], ARGV[i])
+    end
+end
+"""
+
+
+class RedisDeviceScheduler:
+    """
+    Next-due times of device checks kept in a Redis sorted set,
+    so any number of workers share one schedule that survives restarts.
+    Workers claim due devices atomically, a claim is a lease: devices that
+    are not completed before the lease expires return to the schedule.
+    Keys: <prefix>:due - {device id: due time}, <prefix>:leases - {device id:
+    lease expiry}, <prefix>:owners - {device id: "token|due time"},
+    <prefix>:devices - {device id: "interval|name"}, <prefix>:stats - results
+    of the last reconciliation.
+    """
+
+    def __init__(self, client: object, prefix='sms:schedule', lease_time=300, chunk_size=5000):
+        self.client = client
+        self.lease_time = lease_time
+        self.chunk_size = chunk_size
+        self.due_key = f'{prefix}:due'
+        self.leases_key = f'{prefix}:leases'
+        self.owners_key = f'{prefix}:owners'
+        self.devices_key = f'{prefix}:devices'
+        self.stats_key = f'{prefix}:stats'
+        self._keys = [self.due_key, self.leases_key, self.owners_key, self.devices_key]
+        self._claim = client.register_script(CLAIM_SCRIPT)
+        self._complete = client.register_script(COMPLETE_SCRIPT)
+        self._pull_closer = client.register_script(PULL_CLOSER_SCRIPT)
+
+    def __len__(self) -> int:
+        return self.client.hlen(self.devices_key)
+
+    def __contains__(self, device_id: int) -> bool:
+        return self.client.hexists(self.devices_key, device_id)
+
+    @staticmethod
+    def _parse_meta(meta: str) -> tuple:
+        interval, name = meta.split('|', 1)
+        return float(interval), name
+
+    @property
+    def reconciled_at(self) -> float:
+        """ The time of the last reconciliation by any worker """
+        reconciled_at = self.client.hget(self.stats_key, 'reconciled_at')
+        return float(reconciled_at) if reconciled_at is not None else None
+
+    def probe_rate(self) -> float:
+        """ Probes per second of the fleet as of the last reconciliation """
+        return float(self.client.hget(self.stats_key, 'probe_rate') or 0)
+
+    def schedule(self, device_id: int, name: str, interval: float, due: float) -> None:
+        """ Adding a device or moving its next check to the `due` time """
+        pipe = self.client.pipeline()
+        pipe.hset(self.devices_key, device_id, f'{float(interval)}|{name}')
+        pipe.zadd(self.due_key, {device_id: due})
+        pipe.execute()
+
+    def reconcile(self, devices: list, now: float) -> None:
+        """
+        Syncing the schedule with (id, name, interval) of all devices in O(N),
+        the same rules as DeviceScheduler.reconcile.
+        """
+        known = self.client.hgetall(self.devices_key)
+        new_meta, new_due, closer = {}, {}, []
+        probe_rate = 0.0
+        for device_id, name, interval in devices:
+            probe_rate += 1 / interval
+            key = str(device_id)
+            meta = f'{float(interval)}|{name}'
+            old_meta = known.pop(key, None)
+            if old_meta == meta:
+                continue
+            new_meta[key] = meta
+            if old_meta is None:
+                new_due[key] = next_slot(device_id, interval, now)
+            else:
+                closer.extend((key, next_slot(device_id, interval, now)))
+
+        for chunk in self._chunks(list(new_meta.items())):
+            self.client.hset(self.devices_key, mapping=dict(chunk))
+        for chunk in self._chunks(list(new_due.items())):
+            self.client.zadd(self.due_key, dict(chunk), nx=True)
+        for chunk in self._chunks(closer, self.chunk_size * 2):
+            self._pull_closer(keys=[self.due_key], args=chunk)
+        # Devices that left the database. Their leases are dropped on completion.
+        for chunk in self._chunks(list(known)):
+            pipe = self.client.pipeline()
+            pipe.hdel(self.devices_key, *chunk)
+            pipe.zrem(self.due_key, *chunk)
+            pipe.execute()
+        self.client.hset(self.stats_key, mapping={'reconciled_at': now, 'probe_rate': probe_rate})
+
+    def _chunks(self, items: list, size=None) -> list:
+        size = size or self.chunk_size
+        return [items[i:i + size] for i in range(0, len(items), size)]
+
+    def claim(self, now: float, tolerance=0, limit=500) -> tuple:
+        """
+        Atomically taking up to `limit` devices due by `now + tolerance`
+        under a lease of `lease_time` seconds.
+        Returns (claim token, a list of DueDevice).
+        """
+        token = uuid.uuid4().hex
+        items = self._claim(
+            keys=self._keys,
+            args=[now + tolerance, limit, now, now + self.lease_time, token]
+        )
+        due_devices = []
+        for i in range(0, len(items), 3):
+            device_id, due, meta = int(items[i]), float(items[i + 1]), items[i + 2]
+            if meta is None:
+                # Removed meanwhile, the lease expires on its own.
+                continue
+            due_devices.append(
+                DueDevice(device_id, self._parse_meta(meta)[1], due, max(now - due, 0))
+            )
+        return token, due_devices
+
+    def complete(self, token: str, due_devices: list, now: float) -> None:
+        """
+        Releasing devices claimed with the token and scheduling their next
+        checks (see next_due_after_check).
+        Devices whose lease has expired meanwhile are left to their new owner.
+        """
+        if not due_devices:
+            return
+        metas = self.client.hmget(self.devices_key, [device.id for device in due_devices])
+        args = [token]
+        for device, meta in zip(due_devices, metas):
+            if meta is None:
+                continue
+            interval = self._parse_meta(meta)[0]
+            args.extend((device.id, next_due_after_check(device.id, interval, device.due, now)))
+        self._complete(keys=self._keys, args=args)
+
+    def ramp(self, now: float, window: float, grace=0) -> int:
+        """
+        Spreading devices overdue by more than `grace` seconds over the window
+        (see ramp_dues). Claimed devices are left to their owners.
+        Returns the number of moved devices.
+        """
+        dues = ramp_dues(self.overdue(now, grace), now, window)
+        for chunk in self._chunks(list(dues.items())):
+            self.client.zadd(self.due_key, dict(chunk), xx=True)
+        return len(dues)
+
+    def next_due(self) -> float:
+        """ The earliest due time or None if the schedule is empty """
+        items = self.client.zrange(self.due_key, 0, 0, withscores=True)
+        return items[0][1] if items else None
+
+    def overdue(self, now: float, grace=0) -> list:
+        """
+        Devices that should have been checked more than `grace` seconds ago,
+        without taking them.
+        """
+        items = self.client.zrangebyscore(self.due_key, '-inf', f'({now - grace}', withscores=True)
+        if not items:
+            return []
+        metas = self.client.hmget(self.devices_key, [device_id for device_id, _ in items])
+        return [
+            DueDevice(int(device_id), self._parse_meta(meta)[1], due, now - due)
+            for (device_id, due), meta in zip(items, metas) if meta is not None
+        ]
+
+    def count_overdue(self, now: float, grace=0) -> int:
+        """ The number of devices overdue by more than `grace` seconds """
+        return self.client.zcount(self.due_key, '-inf', f'({now - grace}')
+
+
+MEMORY_SCHEDULER = DeviceScheduler()
+# Processes of the Celery worker that runs this process, set on the worker start.
+# Every prefork child keeps its own memory schedule and would check devices again.
+WORKER_PROCESSES = 1
+# The node name of the worker, e.g. celery@host, set on the worker start.
+# Every worker keeps a snapshot of its own memory schedule.
+WORKER_NAME = 'default'
+
+
+def get_scheduler() -> object:
+    """
+    The scheduler chosen by the SCHEDULER_BACKEND setting:
+    'memory' - the process memory of a single worker of one process,
+    'redis' - a schedule shared by all workers.
+    Raises ImproperlyConfigured for the memory schedule of a prefork worker
+    of many processes.
+    """
+    if settings.SCHEDULER_BACKEND == 'redis':
+        return RedisDeviceScheduler(get_redis(), lease_time=settings.SCHEDULER_LEASE_TIME)
+    if WORKER_PROCESSES > 1:
+        raise ImproperlyConfigured(
+            f'The memory scheduler needs a worker of one process, the worker has '
+            f'{WORKER_PROCESSES}: run it with --concurrency=1 or set SCHEDULER_BACKEND=redis'
+        )
+    return MEMORY_SCHEDULER
+
+
+def snapshot_key() -> str:
+    """ The Redis key of the snapshot of this worker """
+    return f'{SNAPSHOT_KEY}:{WORKER_NAME}'
+
+
+def snapshot_path() -> str:
+    """ The file of the snapshot of this worker next to SCHEDULER_SNAPSHOT_PATH """
+    root, extension = os.path.splitext(settings.SCHEDULER_SNAPSHOT_PATH)
+    worker = re.sub(r'[^\w.-]', '_', WORKER_NAME)
+    return f'{root}.{worker}{extension}'
+
+
+def save_snapshot(scheduler: object, now: float) -> bool:
+    """
+    Saving the schedule of the process memory to the store chosen by
+    the SCHEDULER_SNAPSHOT_STORE setting: 'redis', 'file' or 'none'.
+    Workers keep their snapshots apart by their node names.
+    """
+    store = settings.SCHEDULER_SNAPSHOT_STORE
+    if store == 'none':
+        return False
+    data = json.dumps({'saved_at': now, 'devices': scheduler.snapshot()})
+    try:
+        if store == 'redis':
+            get_redis().set(snapshot_key(), data)
+        else:
+            # A reader never sees a partly written file
+            path = snapshot_path()
+            with open(f'{path}.tmp', 'w') as snapshot_file:
+                snapshot_file.write(data)
+            os.replace(f'{path}.tmp', path)
+    except (redis.RedisError, OSError):
+        return False
+    scheduler.snapshot_at = now
+    return True
+
+
+def load_snapshot() -> list:
+    """ Devices of the last saved schedule snapshot of this worker or None """
+    store = settings.SCHEDULER_SNAPSHOT_STORE
+    try:
+        if store == 'redis':
+            data = get_redis().get(snapshot_key())
+        elif store == 'file':
+            with open(snapshot_path()) as snapshot_file:
+                data = snapshot_file.read()
+        else:
+            data = None
+        return json.loads(data)['devices'] if data else None
+    except (redis.RedisError, OSError, ValueError, KeyError):
+        return None
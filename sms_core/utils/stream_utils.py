@@ -0,0 +1,114 @@
+""" Live status changes of devices: publishing through Redis pub/sub and pushing to browsers """
+
+
+import asyncio
+import json
+import logging
+import threading
+import time
+
+import redis
+from django.conf import settings
+from django.utils import dateformat, timezone
+
+from .redis_utils import get_redis
+
+
+STATUS_CHANNEL = 'sms:status'
+# Seconds before the listener subscribes again after a lost Redis connection
+RECONNECT_DELAY = 5
+
+logger = logging.getLogger(__name__)
+
+
+def status_message(devices: list) -> str:
+    """
+    A message about status changes of devices.
+    `since` is formatted like on the overview page.
+    """
+    return json.dumps({'devices': [
+        {
+            'id': device.pk,
+            'name': device.name,
+            'status': device.status,
+            'since': dateformat.format(
+                timezone.localtime(device.last_status_changed), 'd M Y H:i'
+            )
+        } for device in devices
+    ]})
+
+
+def publish_status_changes(devices: list) -> bool:
+    """ Publishing status changes of devices with one message """
+    if not devices:
+        return False
+    try:
+        get_redis().publish(STATUS_CHANNEL, status_message(devices))
+    except redis.RedisError:
+        return False
+    return True
+
+
+class StatusBroadcaster:
+    """
+    One subscription to status changes per process shared by all open streams.
+    A thread listens to the channel and puts messages into queues of streams,
+    `None` tells a stream that messages were lost and the page has to be reloaded.
+    """
+
+    def __init__(self, queue_size=100) -> None:
+        self.queue_size = queue_size
+        self._queues = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, loop: asyncio.AbstractEventLoop) -> asyncio.Queue:
+        """ A queue of messages for a stream served by the event loop """
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._queues.add((loop, queue))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._listen, name='sms-status-listener', daemon=True
+                )
+                self._thread.start()
+        return queue
+
+    def unsubscribe(self, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue) -> None:
+        with self._lock:
+            self._queues.discard((loop, queue))
+
+    def dispatch(self, data) -> None:
+        """ Passing a message to all streams, it is called from any thread """
+        with self._lock:
+            targets = list(self._queues)
+        for loop, queue in targets:
+            loop.call_soon_threadsafe(self._put, queue, data)
+
+    @staticmethod
+    def _put(queue: asyncio.Queue, data) -> None:
+        # A stream that can't keep up loses its messages instead of memory
+        if queue.full():
+            while not queue.empty():
+                queue.get_nowait()
+            data = None
+        queue.put_nowait(data)
+
+    def _listen(self) -> None:
+        lost = False
+        while True:
+            try:
+                pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(STATUS_CHANNEL)
+                if lost:
+                    self.dispatch(None)
+                    lost = False
+                for message in pubsub.listen():
+                    self.dispatch(message['data'])
+            except redis.RedisError as error:
+                logger.warning('The subscription to status changes is lost: %s', error)
+                lost = True
+                time.sleep(RECONNECT_DELAY)
+
+
+BROADCASTER = StatusBroadcaster(queue_size=settings.STATUS_STREAM_QUEUE_SIZE)
@@ -0,0 +1,277 @@
+""" Time series of probe results: writing, partitions, rollups and window queries """
+
+
+import datetime
+import math
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import (
+    Avg, Count, ExpressionWrapper, F, FloatField, Max, Min, Q, Sum
+)
+from django.utils import timezone
+
+from sms_core.models import ProbeResult, ProbeRollup
+
+
+ROLLUP_PERIODS = ('hour', 'day')
+ROLLUP_PERIOD_SECONDS = {'hour': 3600, 'day': 86400}
+WINDOW_RE = re.compile(r'^(\d+)([smhd]?)$')
+WINDOW_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def record_probe_results(results: list, time=None) -> None:
+    """
+    Writing results of probes in batches.
+    `results` - a list of (device id, PingStats)
+    """
+    time = time or timezone.now()
+    ProbeResult.objects.bulk_create(
+        [
+            ProbeResult(
+                time=time,
+                device_id=device_id,
+                rtt_min=stats.rtt_min,
+                rtt_avg=stats.rtt_avg,
+                rtt_max=stats.rtt_max,
+                loss=stats.loss
+            ) for device_id, stats in results
+        ],
+        batch_size=settings.TIMESERIES_BATCH_SIZE
+    )
+
+
+def partition_name(day: datetime.date) -> str:
+    """ The table name of the partition of probe results of a day """
+    return f'{ProbeResult._meta.db_table}_p{day:%Y%m%d}'
+
+
+def day_range(day: datetime.date) -> tuple:
+    """ The start and the end of a day in UTC """
+    start = datetime.datetime.combine(day, datetime.time(), tzinfo=datetime.timezone.utc)
+    return start, start + datetime.timedelta(days=1)
+
+
+def get_partitions() -> dict:
+    """ {day: table name} of existing partitions of probe results """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits'
+            ' JOIN pg_class parent ON pg_inherits.inhparent = parent.oid'
+            ' JOIN pg_class child ON pg_inherits.inhrelid = child.oid'
+            ' WHERE parent.relname = %s',
+            [ProbeResult._meta.db_table]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    prefix = f'{ProbeResult._meta.db_table}_p'
+    return {
+        datetime.datetime.strptime(name[len(prefix):], '%Y%m%d').date(): name
+        for name in names if name.startswith(prefix)
+    }
+
+
+def create_partition(day: datetime.date) -> None:
+    """
+    Creating the partition of a day.
+    Rows of the day that got into the default partition are moved into it.
+    """
+    table = ProbeResult._meta.db_table
+    name = partition_name(day)
+    start, end = day_range(day)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TABLE "{name}" (LIKE "{table}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+        )
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM "{table}_default"'
+            f' WHERE "time" >= %s AND "time" < %s RETURNING *)'
+            f' INSERT INTO "{name}" SELECT * FROM moved',
+            [start, end]
+        )
+        cursor.execute(
+            f'ALTER TABLE "{table}" ATTACH PARTITION "{name}" FOR VALUES FROM (%s) TO (%s)',
+            [start, end]
+        )
+
+
+def maintain_partitions(today=None) -> tuple:
+    """
+    Creating partitions of the next TIMESERIES_PARTITIONS_AHEAD days and
+    dropping partitions older than TIMESERIES_RETENTION_DAYS.
+    Returns (created days, dropped days)
+    """
+    today = today or timezone.now().astimezone(datetime.timezone.utc).date()
+    partitions = get_partitions()
+    created = []
+    for i in range(settings.TIMESERIES_PARTITIONS_AHEAD + 1):
+        day = today + datetime.timedelta(days=i)
+        if day not in partitions:
+            create_partition(day)
+            created.append(day)
+
+    first_day = today - datetime.timedelta(days=settings.TIMESERIES_RETENTION_DAYS)
+    dropped = sorted(day for day in partitions if day < first_day)
+    with connection.cursor() as cursor:
+        for day in dropped:
+            cursor.execute(f'DROP TABLE "{partitions[day]}"')
+        cursor.execute(
+            f'DELETE FROM "{ProbeResult._meta.db_table}_default" WHERE "time" < %s',
+            [day_range(first_day)[0]]
+        )
+    return created, dropped
+
+
+def rollup_probe_results(now=None) -> int:
+    """
+    Aggregating probe results by TIMESERIES_ROLLUP_PERIOD.
+    The last rolled up period may be incomplete, so it is aggregated again.
+    Returns the number of written rollups.
+    """
+    period = settings.TIMESERIES_ROLLUP_PERIOD
+    if period not in ROLLUP_PERIODS:
+        raise ValueError(f'TIMESERIES_ROLLUP_PERIOD must be one of {ROLLUP_PERIODS}')
+    now = now or timezone.now()
+    start = ProbeRollup.objects.aggregate(last=Max('period_start'))['last']
+    if start is None:
+        start = now - datetime.timedelta(days=settings.TIMESERIES_RETENTION_DAYS)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO "{ProbeRollup._meta.db_table}"'
+            ' ("device_id", "period_start", "samples", "rtt_min", "rtt_avg", "rtt_max", "loss")'
+            ' SELECT "device_id", date_trunc(%s, "time"), count(*),'
+            ' min("rtt_min"), avg("rtt_avg"), max("rtt_max"), avg("loss")'
+            f' FROM "{ProbeResult._meta.db_table}"'
+            ' WHERE "time" >= %s AND "time" < %s'
+            ' GROUP BY 1, 2'
+            ' ON CONFLICT ("device_id", "period_start") DO UPDATE SET'
+            ' "samples" = EXCLUDED."samples", "rtt_min" = EXCLUDED."rtt_min",'
+            ' "rtt_avg" = EXCLUDED."rtt_avg", "rtt_max" = EXCLUDED."rtt_max",'
+            ' "loss" = EXCLUDED."loss"',
+            [period, start, now]
+        )
+        written = cursor.rowcount
+
+    ProbeRollup.objects.filter(
+        period_start__lt=now - datetime.timedelta(days=settings.TIMESERIES_ROLLUP_RETENTION_DAYS)
+    ).delete()
+    return written
+
+
+def maintain_timeseries(now=None) -> None:
+    """ Partitions maintenance and rollups of probe results """
+    now = now or timezone.now()
+    maintain_partitions(now.astimezone(datetime.timezone.utc).date())
+    rollup_probe_results(now)
+
+
+def parse_window(value: str) -> datetime.timedelta:
+    """
+    A time window from a string: seconds or a number with
+    a unit: s, m, h, d. For example: '90', '15m', '24h', '7d'.
+    """
+    match = WINDOW_RE.match(str(value).strip())
+    if match is None or int(match.group(1)) == 0:
+        raise ValueError(f'Wrong time window "{value}"')
+    window = datetime.timedelta(seconds=int(match.group(1)) * WINDOW_UNITS[match.group(2)])
+    if window > datetime.timedelta(days=settings.TIMESERIES_ROLLUP_RETENTION_DAYS):
+        raise ValueError(f'The time window "{value}" is longer than the stored data')
+    return window
+
+
+def use_rollups(start: datetime.datetime, now=None) -> bool:
+    """ Raw results of the window have been dropped, rollups are used instead """
+    now = now or timezone.now()
+    return start < now - datetime.timedelta(days=settings.TIMESERIES_RETENTION_DAYS)
+
+
+def bucket_seconds(window: datetime.timedelta, step: int) -> int:
+    """
+    Seconds of buckets, multiples of `step`, that keep points of the window
+    within TIMESERIES_MAX_POINTS. Buckets at both ends may be incomplete.
+    """
+    buckets = max(settings.TIMESERIES_MAX_POINTS - 1, 1)
+    return max(math.ceil(window.total_seconds() / buckets / step), 1) * step
+
+
+def downsample(model: object, device: object, start: datetime.datetime,
+               end: datetime.datetime, seconds: int) -> list:
+    """
+    Probe results or rollups of a device aggregated by buckets of `seconds`
+    from the UNIX epoch. Rollups are weighted by their samples.
+    """
+    time, samples = ('period_start', '"samples"') if model is ProbeRollup else ('time', '1')
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT to_timestamp(floor(extract(epoch FROM "{time}") / %s) * %s),'
+            f' sum({samples}), min("rtt_min"),'
+            f' sum("rtt_avg" * {samples}) / nullif(sum({samples})'
+            ' FILTER (WHERE "rtt_avg" IS NOT NULL), 0),'
+            f' max("rtt_max"), sum("loss" * {samples}) / sum({samples})'
+            f' FROM "{model._meta.db_table}"'
+            f' WHERE "device_id" = %s AND "{time}" >= %s AND "{time}" < %s'
+            ' GROUP BY 1 ORDER BY 1',
+            [seconds, seconds, device.pk, start, end]
+        )
+        columns = ('time', 'samples', 'rtt_min', 'rtt_avg', 'rtt_max', 'loss')
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def get_window_points(device: object, window: datetime.timedelta, now=None) -> dict:
+    """
+    Probe results of a device in the last time window.
+    Raw results are used while they are stored, rollups are used for longer windows.
+    Windows of more than TIMESERIES_MAX_POINTS results are downsampled,
+    the resolution is the size of buckets then, e.g. '300s'.
+    """
+    end = now or timezone.now()
+    start = end - window
+    if use_rollups(start, end):
+        model, resolution = ProbeRollup, settings.TIMESERIES_ROLLUP_PERIOD
+        step = ROLLUP_PERIOD_SECONDS[resolution]
+        points = ProbeRollup.objects.window(device, start, end).values(
+            'rtt_min', 'rtt_avg', 'rtt_max', 'loss', 'samples', time=F('period_start')
+        )
+    else:
+        model, resolution, step = ProbeResult, 'raw', 1
+        points = ProbeResult.objects.window(device, start, end).values(
+            'time', 'rtt_min', 'rtt_avg', 'rtt_max', 'loss'
+        )
+    # One point more than the limit tells if the window has to be downsampled
+    points = list(points[:settings.TIMESERIES_MAX_POINTS + 1])
+    if len(points) > settings.TIMESERIES_MAX_POINTS:
+        seconds = bucket_seconds(window, step)
+        resolution = f'{seconds}s'
+        points = downsample(model, device, start, end, seconds)
+    return {'start': start, 'end': end, 'resolution': resolution, 'points': points}
+
+
+def get_window_summary(device: object, window: datetime.timedelta, now=None) -> dict:
+    """ Aggregated probe results of a device in the last time window """
+    end = now or timezone.now()
+    start = end - window
+    if use_rollups(start, end):
+        summary = ProbeRollup.objects.window(device, start, end).order_by().aggregate(
+            samples=Sum('samples'),
+            rtt_min=Min('rtt_min'),
+            rtt_avg_total=Sum(ExpressionWrapper(F('rtt_avg') * F('samples'), FloatField())),
+            rtt_samples=Sum('samples', filter=Q(rtt_avg__isnull=False)),
+            rtt_max=Max('rtt_max'),
+            loss_total=Sum(ExpressionWrapper(F('loss') * F('samples'), FloatField()))
+        )
+        samples = summary['samples'] or 0
+        rtt_samples = summary.pop('rtt_samples')
+        rtt_avg_total = summary.pop('rtt_avg_total')
+        summary['rtt_avg'] = rtt_avg_total / rtt_samples if rtt_samples else None
+        summary['loss'] = summary.pop('loss_total') / samples if samples else None
+    else:
+        summary = ProbeResult.objects.window(device, start, end).order_by().aggregate(
+            samples=Count('id'),
+            rtt_min=Min('rtt_min'),
+            rtt_avg=Avg('rtt_avg'),
+            rtt_max=Max('rtt_max'),
+            loss=Avg('loss')
+        )
+    summary.update({'start': start, 'end': end})
+    return summary
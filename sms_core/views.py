@@ -1,6 +1,7 @@
 """ Views of the application sms_core """
 
 
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views import View
 from django.urls import reverse
@@ -10,7 +11,13 @@ from django.contrib.auth import authenticate, login, logout
 
 from .models import SmsUser, Device
 from .forms import DeviceForm, UserCreationForm, UserChangeForm
+from .streams import STATUS_STREAM_PATH
 from .tasks import task_device_check_after_update
+from .utils.availability_utils import get_availability
+from .utils.cards_utils import card_rows, get_device_cards, get_search_summary
+from .utils.counters_utils import get_counters
+from .utils.pagination_utils import keyset_page
+from .utils.timeseries_utils import parse_window, get_window_summary
 
 
 class ObjectDetailMixin:
@@ -18,9 +25,14 @@ class ObjectDetailMixin:
     model = None
     template = None
 
+    def get_extra_context(self, request, obj) -> dict:
+        """ Additional context of the object's details """
+        return {}
+
     def get(self, request, slug):
         obj = get_object_or_404(self.model, name__iexact=slug)
         context = {self.model.__name__.lower(): obj}
+        context.update(self.get_extra_context(request, obj))
         del obj
         return render(request, self.template, context=context)
 
@@ -30,6 +42,10 @@ class ObjectListMixin:
     model = None
     template = None
 
+    def get_extra_context(self, request, objs) -> dict:
+        """ Additional context of the list, it may replace the objects """
+        return {}
+
     def get(self, request):
         search_query = request.GET.get('search', '')
         if search_query:
@@ -44,6 +60,7 @@ class ObjectListMixin:
             f'{self.model.__name__.lower()}s': objs,
             'search': search_query
         }
+        context.update(self.get_extra_context(request, objs))
         del search_query
         del objs
         return render(request, self.template, context=context)
@@ -185,6 +202,49 @@ class SmsOverviewView(LoginRequiredMixin, ObjectListMixin, View):
     model = Device
     template = 'sms_core/sms_overview.html'
 
+    # Orderings of keyset pages, fields of an ordering are unique together
+    sorts = {'name': ('name',), 'changed': ('-last_status_changed', '-pk')}
+    statuses = {'up': True, 'down': False}
+
+    def get_extra_context(self, request, objs) -> dict:
+        sort = request.GET.get('sort', '')
+        if sort not in self.sorts:
+            sort = 'name'
+        status = request.GET.get('status', '')
+        # Counters of all devices are kept in Redis, summaries of searches are cached there
+        search = request.GET.get('search', '')
+        if search:
+            summary = get_search_summary(objs, search)
+        else:
+            summary = get_counters()
+        if status in self.statuses:
+            objs = objs.filter(status=self.statuses[status])
+        else:
+            status = ''
+
+        # Cards are rendered from cache, only the columns shown on them are read
+        cursor = request.GET.get('after', '')
+        try:
+            rows, next_cursor = keyset_page(
+                card_rows(objs), self.sorts[sort], settings.OVERVIEW_PAGE_SIZE, cursor
+            )
+        except ValueError:
+            cursor = ''
+            rows, next_cursor = keyset_page(
+                card_rows(objs), self.sorts[sort], settings.OVERVIEW_PAGE_SIZE
+            )
+        return {
+            'devices': get_device_cards(rows, request.user.is_staff),
+            'devices_total': summary['total'],
+            'devices_up': summary['up'],
+            'devices_down': summary['total'] - summary['up'],
+            'status': status,
+            'sort': sort,
+            'is_first_page': not cursor,
+            'next_cursor': next_cursor,
+            'status_stream_url': STATUS_STREAM_PATH
+        }
+
 
 class SmsAdministrationView(LoginRequiredMixin, ObjectListMixin, View):
     """ View to get list of all users """
@@ -196,6 +256,22 @@ class SmsDeviceDetailsView(LoginRequiredMixin, ObjectDetailMixin, View):
     """ View to get device's details """
     model = Device
     template = 'sms_core/sms_device_detail.html'
+    # Time windows of probe results
+    windows = ('1h', '24h', '7d')
+
+    def get_extra_context(self, request, obj) -> dict:
+        window = request.GET.get('window', self.windows[1])
+        try:
+            window_delta = parse_window(window)
+        except ValueError:
+            window = self.windows[1]
+            window_delta = parse_window(window)
+        return {
+            'probes': get_window_summary(obj, window_delta),
+            'window': window,
+            'windows': self.windows,
+            'availability': get_availability(days=30, devices=[obj]).get(obj.pk)
+        }
 
 
 class SmsDeviceEditView(LoginRequiredMixin, ObjectEditMixin, View):